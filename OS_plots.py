@@ -1,99 +1,384 @@
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
-import ipywidgets as widgets
-from IPython.display import display, clear_output
 import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import plotly.io as pio 
-import matplotlib.pyplot as plt
-import seaborn as sns
-from scipy.stats import pearsonr
+from csv_loader import project_columns, read_csv_columns, read_header
+from merge_engine import merge_frames, MergeFanoutError
+from bar_reduction import DEFAULT_MAX_POINTS, reduce_for_bars, labels_fit, describe_reduction
+import instrumentation
+from instrumentation import span, traced
+
+# ipywidgets/IPython, matplotlib, seaborn ו-scipy (כולל correlation_stats) נטענים רק בתוך
+# הפונקציות שצריכות אותם, כך ש-import OS_plots מהיר ועובד גם בלי ממשק (למשל plot_from_path
+# או batch_plots.py). plotly.graph_objects ו-plotly.io נטענים בעצמם בעצלות ונשארים כאן.
+# תקציב זמן הטעינה נבדק ב-benchmarks/bench_import_time.py
+
+# מעל מספר השורות הזה plot_correlation עוברת למסלול המהיר (hexbin + רווח סמך אנליטי)
+FAST_CORRELATION_ROWS = 50_000
+# גודל המנה (בשורות) בקריאת קבצים שהועלו ב-launch_interactive_plotter - ההתקדמות מתעדכנת ואפשר לבטל אחרי כל מנה
+UPLOAD_CHUNK_ROWS = 100_000
+def _print_merge_report(df, x_col):
+    # מדווח מראש על מפתחות כפולים שמנפחים את המיזוג
+    report = df.attrs.get('merge_report')
+    if report and report['duplicated_keys']:
+        print(f"Warning: {report['duplicated_keys']} duplicated '{x_col}' value(s) expand the merge "
+              f"from {max(report['rows_in'])} to {report['rows_out']} rows "
+              f"(up to {report['max_multiplicity']} rows per value).")
+
+
+def _use_colab_renderer():
+    # מגדיר את התצוגה של Colab רק כשבאמת רצים בתוך Colab, כדי שהקוד ירוץ גם בלי ממשק (סקריפטים ודוחות)
+    if 'google.colab' in sys.modules:
+        pio.renderers.default = 'colab'
+
+
+def _bar_traces(df, x_col, y_cols, max_points, agg):
+    # מצמצם את הנתונים לתקציב הנקודות ובונה עמודה (Bar) לכל עמודת Y.
+    # תוויות טקסט נשלחות רק אם הן ייכנסו לרוחב העמודות - אחרת uniformtext_mode='hide' יסתיר אותן ממילא
+    with span('reduce') as sp:
+        df, info = reduce_for_bars(df, x_col, y_cols, max_points=max_points, agg=agg)
+        info['max_points'] = max_points
+        sp.set(rows_in=info['rows_in'], rows_out=info['rows_out'], method=info['method'])
+    widest = df[y_cols].abs().max().max() if len(df) else 0
+    show_text = labels_fit(len(df), len(y_cols), len(f"-{widest:.2f}"))
+
+    with span('traces', traces=len(y_cols)):
+        traces = []
+        for y_col in y_cols:
+            traces.append(go.Bar(
+                x=df[x_col],
+                y=df[y_col],
+                name=y_col,
+                text=df[y_col].round(2) if show_text else None,
+                textposition='outside' if show_text else None
+            ))
+    return traces, info
+
+
+def _measure_serialization(fig):
+    # רק כשהמדידה (instrumentation) פעילה: הזמן והגודל של ה-JSON שנשלח לדפדפן כשהגרף מוצג.
+    # בלי מדידה הגרף לא מומר כאן ל-JSON בכלל
+    if instrumentation.enabled():
+        with span('serialize') as sp:
+            sp.set(bytes=len(fig.to_json()))
+
+
+def _annotate_reduction(fig, info, x_col):
+    # מציג על הגרף כמה שורות צומצמו, ושומר את הפרטים (ואת עמודת ה-X) ב-layout.meta
+    description = describe_reduction(info, x_col)
+    fig.layout.meta = {**info, 'x_col': x_col}
+    if description:
+        print(description)
+        fig.add_annotation(text=description, xref='paper', yref='paper', x=1, y=1.08,
+                           xanchor='right', showarrow=False, font=dict(size=11, color='gray'))
+
+
 # ==============================================================================
 #  פונקציה 1: היגיון הליבה (ה"מנוע")
 # ==============================================================================
 
-def create_plot_from_dfs(dataframes, x_col, y_cols):
-    
+@traced()
+def create_plot_from_dfs(dataframes, x_col, y_cols, max_fanout=None, tolerance=None,
+                         max_points=DEFAULT_MAX_POINTS, agg='mean', widget=True):
+    # widget=False מחזיר go.Figure רגיל (בלי ipywidgets) - לשמירה לקובץ בלי ממשק, ראו batch_plots.py
+
     df = None
     
-    if not isinstance(dataframes, list) or len(dataframes) not in [1, 2]:
-        print("Error: 'dataframes' must be a list containing one or two DataFrames.")
+    if not isinstance(dataframes, list) or len(dataframes) == 0:
+        print("Error: 'dataframes' must be a non-empty list of DataFrames.")
         return None
 
+    if isinstance(y_cols, str):
+        y_cols = [y_cols]
+
     if len(dataframes) == 1:
         df = dataframes[0]
-    elif len(dataframes) == 2:
-        df1 = dataframes[0]
-        df2 = dataframes[1]
-        
-        if x_col not in df1.columns or x_col not in df2.columns:
-            print(f"Error: X-axis column '{x_col}' not found in one or both dataframes.")
+    else:
+        if any(x_col not in d.columns for d in dataframes):
+            print(f"Error: X-axis column '{x_col}' not found in all dataframes.")
             return None
-        
-        df = pd.merge(df1, df2, on=x_col, how='inner')
 
-    if isinstance(y_cols, str):
-        y_cols = [y_cols]
+        try:
+            with span('merge', files=len(dataframes)) as sp:
+                df = merge_frames(dataframes, x_col, y_cols, max_fanout=max_fanout, tolerance=tolerance)
+                sp.set(rows=len(df))
+        except MergeFanoutError as e:
+            print(f"Error: {e}")
+            return None
+        _print_merge_report(df, x_col)
 
-    traces = []
     valid_y_cols = [col for col in y_cols if col in df.columns]
     missing_cols = set(y_cols) - set(valid_y_cols)
     if missing_cols:
         print(f"Warning: Columns not found and will be skipped: {missing_cols}")
 
-    for y_col in valid_y_cols:
-        traces.append(go.Bar(
-            x=df[x_col], 
-            y=df[y_col], 
-            name=y_col, 
-            text=df[y_col].round(2), 
-            textposition='outside'
-        ))
-
-    if not traces:
+    if not valid_y_cols:
         print("Error: No valid Y-axis columns to plot.")
         return None
 
-    # ***************************************************************
-    # *** הנה התיקון הקריטי! שימוש ב-FigureWidget ***
-    fig = go.FigureWidget(data=traces)
-    # ***************************************************************
-
-    fig.update_layout(
-        title=f"Bar Chart: {', '.join(valid_y_cols)} vs {x_col}",
-        xaxis_title=x_col,
-        yaxis_title="Value",
-        hovermode='x unified',
-        uniformtext_minsize=8,
-        uniformtext_mode='hide'
-    )
+    traces, reduction = _bar_traces(df, x_col, valid_y_cols, max_points, agg)
+
+    with span('figure'):
+        # ***************************************************************
+        # *** הנה התיקון הקריטי! שימוש ב-FigureWidget ***
+        fig = go.FigureWidget(data=traces) if widget else go.Figure(data=traces)
+        # ***************************************************************
+
+        fig.update_layout(
+            title=f"Bar Chart: {', '.join(valid_y_cols)} vs {x_col}",
+            xaxis_title=x_col,
+            yaxis_title="Value",
+            hovermode='x unified',
+            uniformtext_minsize=8,
+            uniformtext_mode='hide'
+        )
+        _annotate_reduction(fig, reduction, x_col)
+    _measure_serialization(fig)
     
     return fig
 
 
+def update_bar_figure(fig, df, x_col, y_cols, max_points=DEFAULT_MAX_POINTS, agg='mean'):
+    """
+    מעדכן גרף עמודות קיים (FigureWidget) לבחירת עמודות חדשה, במקום לבנות גרף חדש.
+
+    רק מה שהשתנה נשלח לדפדפן: אם עמודת ה-X (וההגדרות והנתונים) לא השתנו,
+    עמודות Y שכבר מוצגות נשארות כמו שהן, עמודות שהוסרו נמחקות, ורק לעמודות
+    החדשות מחושבים ונשלחים נתונים. כל העדכונים נשלחים יחד ב-batch_update.
+
+    Args:
+        fig (go.FigureWidget): גרף שנבנה ב-create_plot_from_dfs או בקריאה קודמת.
+        df (DataFrame): הנתונים (כבר ממוזגים).
+        x_col (str): שם עמודת ציר ה-X.
+        y_cols (str or list): שם עמודת ה-Y, או רשימה של שמות.
+        max_points (int, optional): תקציב העמודות, כמו ב-create_plot_from_dfs.
+        agg (str): אופן הצמצום.
+
+    Returns:
+        go.FigureWidget: אותו גרף, או None אם אף עמודת Y לא קיימת.
+    """
+    if isinstance(y_cols, str):
+        y_cols = [y_cols]
+    valid_y_cols = [col for col in y_cols if col in df.columns]
+    if not valid_y_cols:
+        print("Error: No valid Y-axis columns to plot.")
+        return None
+
+    # ה-X נשאר אותו דבר אם עמודת ה-X, הצמצום ומספר השורות זהים - אז גם
+    # התאים (bins) זהים, כי הם נקבעים לפי ה-X בלבד
+    meta = fig.layout.meta or {}
+    same_x = (meta.get('x_col') == x_col and meta.get('agg') == agg and
+              meta.get('max_points') == max_points and meta.get('rows_in') == len(df))
+    current = {trace.name: trace for trace in fig.data} if same_x else {}
+    new_cols = [col for col in valid_y_cols if col not in current]
+
+    info = {key: meta[key] for key in ('rows_in', 'rows_out', 'method', 'agg', 'max_points')} if same_x else None
+    reduced = None
+    if new_cols:
+        reduced, info = reduce_for_bars(df, x_col, new_cols, max_points=max_points, agg=agg)
+        info['max_points'] = max_points
+
+    # תוויות הטקסט תלויות בכל העמודות שמוצגות יחד (מספר העמודות והערך הרחב ביותר)
+    widest = max([np.nanmax(np.abs(np.asarray(current[col].y, dtype=float)), initial=0)
+                  for col in valid_y_cols if col in current] +
+                 [reduced[col].abs().max() for col in new_cols if len(reduced)] + [0])
+    n_bars = info['rows_out']
+    show_text = labels_fit(n_bars, len(valid_y_cols), len(f"-{widest:.2f}"))
+
+    with fig.batch_update():
+        fig.data = tuple(current[col] for col in valid_y_cols if col in current)
+        for col in new_cols:
+            fig.add_bar(x=reduced[x_col], y=reduced[col], name=col)
+        # סדר העמודות כמו בבחירה
+        order = {col: i for i, col in enumerate(valid_y_cols)}
+        fig.data = tuple(sorted(fig.data, key=lambda trace: order[trace.name]))
+
+        for trace in fig.data:
+            if show_text and trace.text is None:
+                trace.text = np.round(np.asarray(trace.y, dtype=float), 2)
+                trace.textposition = 'outside'
+            elif not show_text and trace.text is not None:
+                trace.text = None
+                trace.textposition = None
+
+        fig.layout.annotations = ()
+        fig.update_layout(
+            title=f"Bar Chart: {', '.join(valid_y_cols)} vs {x_col}",
+            xaxis_title=x_col,
+        )
+        _annotate_reduction(fig, info, x_col)
+
+    return fig
+
+
 # ==============================================================================
 #  פונקציה 2: מפעיל ה-GUI (נשארת זהה)
 # ==============================================================================
 
-def launch_interactive_plotter():
+class _UploadCancelled(Exception):
+    pass
+
+
+def _parse_upload(content, cancelled, on_progress):
+    # קורא קובץ שהועלה במנות (chunks), כדי שאפשר יהיה לדווח התקדמות ולבטל באמצע הקובץ.
+    # הקריאה עוברת דרך read_csv_columns, כך שהמטמון (enable_cache) חל גם על קבצים שהועלו.
+    # מחזיר None אם הקריאה בוטלה
+    buffer = io.BytesIO(content)
+
+    def on_chunk(chunk):
+        if cancelled.is_set():
+            raise _UploadCancelled()
+        on_progress(buffer.tell())
+
+    try:
+        return read_csv_columns(buffer, chunksize=UPLOAD_CHUNK_ROWS, on_chunk=on_chunk)
+    except _UploadCancelled:
+        return None
+
+
+def launch_interactive_plotter(reactive=False):
+    # reactive=True - הגרף מתעדכן מיד כשבחירת הצירים משתנה, בלי ללחוץ על הכפתור
+    # (אפשר לשנות גם בתיבת הסימון בממשק)
+    import ipywidgets as widgets
+    from IPython.display import display
     
     # הגדרה עבור Google Colab
-    pio.renderers.default = 'colab'
+    _use_colab_renderer()
     
-    app_data = {'dfs': []}
+    # dfs - הקבצים אחרי קריאה; merged - המיזוג לפי כל עמודת X שכבר נבחרה,
+    # כך ששינוי בחירת עמודות ה-Y (או חזרה ל-X קודם) לא ממזג מחדש;
+    # fig - הגרף שמוצג, שמתעדכן במקום (update_bar_figure) ולא נבנה מחדש בכל בחירה
+    app_data = {'dfs': [], 'merged': {}, 'job': None, 'fig': None}
+
+    # כל הקריאה, המיזוג ובניית הגרף רצים ב-thread ברקע, כדי שהממשק לא יקפא
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='os_plots')
 
     file_uploader = widgets.FileUpload(
         accept='.csv',
         multiple=True,
         description='Upload CSV(s)',
-        tooltip='Upload one or two CSV files'
+        tooltip='Upload one or more CSV files'
     )
     x_axis_selector = widgets.Dropdown(options=[], description='Select X-Axis:', disabled=True)
     y_axis_selector = widgets.SelectMultiple(options=[], description='Select Y-Axis:', disabled=True)
     plot_button = widgets.Button(description='Create Plot', disabled=True)
-    status_label = widgets.Label(value="Please upload 1 or 2 CSV files.")
+    cancel_button = widgets.Button(description='Cancel', button_style='warning', disabled=True)
+    reactive_checkbox = widgets.Checkbox(value=reactive, description='Update on selection change')
+    progress_bar = widgets.FloatProgress(value=0, min=0, max=1, layout=widgets.Layout(visibility='hidden'))
+    status_label = widgets.Label(value="Please upload one or more CSV files.")
     output_area = widgets.Output()
 
+    def start_job(work, *args):
+        # מבטל עבודה קודמת שעוד רצה ומריץ את החדשה ברקע.
+        # העבודה מקבלת Event שמסמן ביטול, ובודקת אותו בין השלבים
+        cancel_job()
+        cancelled = threading.Event()
+        progress_bar.value = 0
+        progress_bar.layout.visibility = 'visible'
+        cancel_button.disabled = False
+        future = executor.submit(work, cancelled, *args)
+        app_data['job'] = (future, cancelled)
+        future.add_done_callback(lambda f: finish_job(f, cancelled))
+
+    def cancel_job():
+        if app_data['job'] is not None:
+            future, cancelled = app_data['job']
+            cancelled.set()
+            future.cancel()
+
+    def finish_job(future, cancelled):
+        if app_data['job'] is None or app_data['job'][0] is not future:
+            return
+        app_data['job'] = None
+        progress_bar.layout.visibility = 'hidden'
+        cancel_button.disabled = True
+        if cancelled.is_set():
+            status_label.value = "Cancelled."
+        elif future.exception() is not None:
+            status_label.value = f"An error occurred: {future.exception()}"
+
+    def on_cancel_clicked(b):
+        status_label.value = "Cancelling..."
+        cancel_job()
+
+    def load_files(cancelled, uploaded_files):
+        contents = [file_info['content'] for file_info in uploaded_files]
+        total_bytes = sum(len(content) for content in contents) or 1
+        done_bytes = 0
+        dfs = []
+        for i, content in enumerate(contents):
+            status_label.value = f"Reading file {i + 1} of {len(contents)}..."
+
+            def on_progress(position, done_bytes=done_bytes):
+                progress_bar.value = (done_bytes + position) / total_bytes
+
+            df = _parse_upload(content, cancelled, on_progress)
+            if df is None:
+                return
+            dfs.append(df)
+            done_bytes += len(content)
+
+        if cancelled.is_set():
+            return
+        app_data['dfs'] = dfs
+        
+        if len(dfs) == 1:
+            all_cols = sorted(list(dfs[0].columns))
+            x_axis_selector.options = all_cols
+            y_axis_selector.options = all_cols
+        else:
+            common_cols = sorted(set.intersection(*(set(df.columns) for df in dfs)))
+            if not common_cols:
+                status_label.value = "Error: The files have no common columns."
+                return
+            all_cols = sorted(set.union(*(set(df.columns) for df in dfs)))
+            x_axis_selector.options = common_cols
+            y_axis_selector.options = all_cols
+
+        x_axis_selector.disabled = False
+        y_axis_selector.disabled = False
+        plot_button.disabled = False
+        status_label.value = f"{len(dfs)} file(s) loaded. Please select axes."
+
+    def merged_frame(x_col):
+        # המיזוג של כל העמודות לפי x_col נשמר ב-app_data ומשמש את כל בחירות ה-Y
+        dfs = app_data['dfs']
+        if len(dfs) == 1:
+            return dfs[0]
+        if x_col not in app_data['merged']:
+            status_label.value = f"Merging {len(dfs)} files on '{x_col}'..."
+            df = merge_frames(dfs, x_col)
+            _print_merge_report(df, x_col)
+            app_data['merged'][x_col] = df
+        return app_data['merged'][x_col]
+
+    def build_plot(cancelled, x_col, y_cols):
+        df = merged_frame(x_col)
+        progress_bar.value = 0.5
+        if cancelled.is_set():
+            return
+        if app_data['fig'] is None:
+            status_label.value = "Generating plot..."
+            fig = create_plot_from_dfs([df], x_col, y_cols)
+            if fig:
+                # תצוגה מתוך thread ברקע - append_display_data ולא "with output_area"
+                app_data['fig'] = fig
+                output_area.append_display_data(fig)
+                status_label.value = "Plot created successfully."
+        else:
+            # הגרף כבר מוצג - נשלחים לדפדפן רק השינויים
+            status_label.value = "Updating plot..."
+            fig = update_bar_figure(app_data['fig'], df, x_col, y_cols)
+            if fig:
+                status_label.value = "Plot updated."
+
+        if not fig:
+            status_label.value = "Error creating plot. Check console."
+
     def on_file_upload(change):
         x_axis_selector.options = []
         y_axis_selector.options = []
@@ -101,79 +386,48 @@ def launch_interactive_plotter():
         y_axis_selector.disabled = True
         plot_button.disabled = True
         app_data['dfs'] = []
+        app_data['merged'] = {}
+        app_data['fig'] = None
         output_area.clear_output()
         
         uploaded_files = file_uploader.value
         
-        if not (1 <= len(uploaded_files) <= 2):
-            status_label.value = "Error: Please upload EXACTLY 1 or 2 CSV files."
+        if len(uploaded_files) == 0:
+            cancel_job()
+            status_label.value = "Error: Please upload at least one CSV file."
             return
 
-        try:
-            dfs = []
-            for file_info in uploaded_files.values():
-                content = file_info['content']
-                df = pd.read_csv(io.BytesIO(content), encoding='latin1')
-                dfs.append(df)
-            
-            app_data['dfs'] = dfs
-            
-            if len(dfs) == 1:
-                all_cols = sorted(list(dfs[0].columns))
-                x_axis_selector.options = all_cols
-                y_axis_selector.options = all_cols
-            elif len(dfs) == 2:
-                common_cols = sorted(list(set(dfs[0].columns) & set(dfs[1].columns)))
-                if not common_cols:
-                    status_label.value = "Error: The two files have no common columns."
-                    return
-                all_cols = sorted(list(set(dfs[0].columns) | set(dfs[1].columns)))
-                x_axis_selector.options = common_cols
-                y_axis_selector.options = all_cols
-
-            x_axis_selector.disabled = False
-            y_axis_selector.disabled = False
-            plot_button.disabled = False
-            status_label.value = f"{len(dfs)} file(s) loaded. Please select axes."
-            
-        except Exception as e:
-            status_label.value = f"Error processing file: {e}"
+        # FileUpload מחזיר dict בגרסה 7 של ipywidgets ו-tuple בגרסה 8
+        if isinstance(uploaded_files, dict):
+            uploaded_files = uploaded_files.values()
+        start_job(load_files, list(uploaded_files))
 
     def on_plot_button_clicked(b):
-        output_area.clear_output()
-        status_label.value = "Generating plot..."
-        
         x_col = x_axis_selector.value
         y_cols = list(y_axis_selector.value)
         
         if not x_col or not y_cols:
             status_label.value = "Error: Must select an X-axis and one Y-axis."
             return
-            
-        try:
-            fig = create_plot_from_dfs(app_data['dfs'], x_col, y_cols)
-            
-            if fig:
-                with output_area:
-                    # שיטת התצוגה נשארת זהה
-                    display(fig) 
-                status_label.value = "Plot created successfully."
-            else:
-                status_label.value = "Error creating plot. Check console."
-                
-        except Exception as e:
-            status_label.value = f"An error occurred: {e}"
-            with output_area:
-                print(f"An unexpected error occurred: {e}")
+
+        start_job(build_plot, x_col, y_cols)
+
+    def on_selection_change(change):
+        if reactive_checkbox.value and not plot_button.disabled and y_axis_selector.value:
+            on_plot_button_clicked(None)
 
     file_uploader.observe(on_file_upload, names='value')
     plot_button.on_click(on_plot_button_clicked)
+    cancel_button.on_click(on_cancel_clicked)
+    x_axis_selector.observe(on_selection_change, names='value')
+    y_axis_selector.observe(on_selection_change, names='value')
 
     gui_layout = widgets.VBox([
         file_uploader,
         x_axis_selector,
         y_axis_selector,
-        plot_button,
+        widgets.HBox([plot_button, cancel_button, reactive_checkbox]),
+        progress_bar,
         status_label,
         output_area
     ])
@@ -187,26 +441,35 @@ def launch_interactive_plotter():
 
 # --- הוסף את זה לקובץ OS_plots.py שלך ---
 
-import plotly.graph_objects as go
-import pandas as pd
-import plotly.io as pio
-
-def plot_from_path(file_paths, x_col, y_cols):
+@traced()
+def plot_from_path(file_paths, x_col, y_cols, max_fanout=None, tolerance=None,
+                   max_points=DEFAULT_MAX_POINTS, agg='mean', schema=None):
     """
     יוצר גרף פלוטלי מנתיבי קבצים ושמות עמודות.
     פשוט וקל - בלי GUI.
     
     Args:
-        file_paths (str or list): נתיב לקובץ בודד, או רשימה של שני נתיבים.
+        file_paths (str or list): נתיב לקובץ בודד, או רשימה של כמה נתיבים
+            (הקבצים ימוזגו לפי עמודת ה-X).
         x_col (str): שם עמודת ציר ה-X.
         y_cols (str or list): שם עמודת ציר ה-Y, או רשימה של שמות.
+        max_fanout (float, optional): עצירה אם מפתחות כפולים מנפחים את המיזוג
+            מעבר לפי כמה מהקובץ הגדול ביותר.
+        tolerance (float, optional): מיזוג לפי ערך ה-X הקרוב ביותר בטווח הזה
+            במקום התאמה מדויקת.
+        max_points (int, optional): מעל מספר העמודות הזה הנתונים מצומצמים
+            (קיבוץ לפי X, חלוקה לתאים ל-X מספרי, או N הקטגוריות המובילות + "Other").
+            None מבטל את הצמצום.
+        agg (str): אופן הצמצום - 'mean', 'sum', 'min' או 'max'.
+        schema (DtypeSchema, optional): סכמת טיפוסים מ-optimize_dtypes
+            (omris_data_utils) שמוחלת על העמודות כבר בזמן הקריאה.
 
     Returns:
         plotly.graph_objects.Figure: אובייקט הגרף (fig) שניתן להציג.
     """
     
-    # 1. הגדרת סביבת התצוגה של Colab (ליתר ביטחון)
-    pio.renderers.default = 'colab'
+    # 1. הגדרת סביבת התצוגה של Colab (רק אם רצים בתוך Colab)
+    _use_colab_renderer()
     
     df = None
     
@@ -214,24 +477,34 @@ def plot_from_path(file_paths, x_col, y_cols):
     if isinstance(file_paths, str):
         file_paths = [file_paths]
 
-    if not (1 <= len(file_paths) <= 2):
-        print("שגיאה: 'file_paths' חייב להיות נתיב אחד או רשימה של שני נתיבים.")
+    if len(file_paths) == 0:
+        print("שגיאה: 'file_paths' חייב להכיל לפחות נתיב אחד.")
         return None
 
-    # 3. טעינת הנתונים
+    if isinstance(y_cols, str):
+        y_cols = [y_cols]
+
+    # 3. טעינת הנתונים - רק העמודות הדרושות (ציר X ועמודות ה-Y)
     try:
-        if len(file_paths) == 1:
-            df = pd.read_csv(file_paths[0], encoding='latin1')
-        elif len(file_paths) == 2:
-            df1 = pd.read_csv(file_paths[0], encoding='latin1')
-            df2 = pd.read_csv(file_paths[1], encoding='latin1')
-            
-            if x_col not in df1.columns or x_col not in df2.columns:
-                print(f"שגיאה: עמודת X '{x_col}' לא קיימת בשני הקבצים.")
-                return None
-            
-            df = pd.merge(df1, df2, on=x_col, how='inner')
-            
+        with span('read_header', files=len(file_paths)):
+            headers = [read_header(path) for path in file_paths]
+
+        if len(file_paths) > 1 and any(x_col not in header for header in headers):
+            print(f"שגיאה: עמודת X '{x_col}' לא קיימת בכל הקבצים.")
+            return None
+
+        projected = project_columns(headers, x_col, y_cols)
+        dfs = []
+        for path, cols in zip(file_paths, projected):
+            with span('read_csv', file=str(path), columns=len(cols)) as sp:
+                dfs.append(read_csv_columns(path, cols, schema=schema))
+                sp.set(rows=len(dfs[-1]))
+
+        with span('merge', files=len(dfs)) as sp:
+            df = merge_frames(dfs, x_col, y_cols, max_fanout=max_fanout, tolerance=tolerance)
+            sp.set(rows=len(df))
+        _print_merge_report(df, x_col)
+
     except FileNotFoundError as e:
         print(f"שגיאה: הקובץ לא נמצא. {e}")
         return None
@@ -240,10 +513,6 @@ def plot_from_path(file_paths, x_col, y_cols):
         return None
 
     # 4. הכנת הנתונים לגרף
-    if isinstance(y_cols, str):
-        y_cols = [y_cols]
-
-    traces = []
     # ודא שהעמודות קיימות ב-DataFrame
     valid_y_cols = [col for col in y_cols if col in df.columns]
     
@@ -251,23 +520,20 @@ def plot_from_path(file_paths, x_col, y_cols):
         print(f"שגיאה: אף אחת מעמודות ה-Y שצוינו ({y_cols}) לא נמצאה בנתונים.")
         return None
 
-    for y_col in valid_y_cols:
-        traces.append(go.Bar(
-            x=df[x_col], 
-            y=df[y_col], 
-            name=y_col,
-            text=df[y_col].round(2),
-            textposition='outside'
-        ))
+    # צמצום הנתונים אם יש יותר מדי עמודות לדפדפן
+    traces, reduction = _bar_traces(df, x_col, valid_y_cols, max_points, agg)
 
     # 5. יצירת הגרף (עם go.Figure רגיל!)
-    fig = go.Figure(data=traces)
-    fig.update_layout(
-        title=f"גרף עמודות: {', '.join(valid_y_cols)} מול {x_col}",
-        xaxis_title=x_col,
-        yaxis_title="Value",
-        hovermode='x unified'
-    )
+    with span('figure'):
+        fig = go.Figure(data=traces)
+        fig.update_layout(
+            title=f"גרף עמודות: {', '.join(valid_y_cols)} מול {x_col}",
+            xaxis_title=x_col,
+            yaxis_title="Value",
+            hovermode='x unified'
+        )
+        _annotate_reduction(fig, reduction, x_col)
+    _measure_serialization(fig)
     
     # 6. החזרת הגרף!
     return fig
@@ -276,35 +542,70 @@ def plot_from_path(file_paths, x_col, y_cols):
 
 # פונקציה נוספת - חישוב קורלציה וגרפים
 
-def plot_correlation(file_path, col1_name, col2_name):
+def plot_correlation(file_path, col1_name, col2_name, fast=None,
+                     fast_threshold=FAST_CORRELATION_ROWS, gridsize=60, stream=False):
     """
     מחשב ומציג גרף קורלציה (פירסון) בין שתי עמודות.
     כולל גרף פיזור, קו רגרסיה, רווח סמך, ומדדי הקורלציה.
 
+    בנתונים גדולים (מעל fast_threshold שורות) הגרף עובר למסלול מהיר:
+    מפת צפיפות hexbin במקום נקודה לכל שורה, ורווח סמך אנליטי לקו הרגרסיה
+    במקום ה-bootstrap של seaborn. ערכי r ו-p זהים בשני המסלולים.
+
+    קבצים גדולים מהזיכרון (stream=True, או CorrelationAccumulator מוכן) נקראים
+    במעבר אחד בחלקים: r, p וקו הרגרסיה מחושבים במדויק מהסטטיסטיקות המצטברות,
+    ומפת הצפיפות נבנית מההיסטוגרמה הדו-ממדית שנאספה באותו מעבר (במסלול הרגיל
+    מצוירת דגימה אקראית של השורות).
+
     Args:
-        file_path (str): נתיב מלא לקובץ ה-CSV.
+        file_path (str, list, DataFrame, CorrelationMatrix or CorrelationAccumulator):
+            נתיב מלא לקובץ ה-CSV, DataFrame שכבר נטען, או תוצאה של
+            correlation_matrix - ואז הזוג נלקח מהנתונים שכבר בזיכרון בלי לקרוא
+            שוב את הקובץ. עם stream=True אפשר גם רשימת קבצים. CorrelationAccumulator
+            (של accumulate_csv) משמש כמו שהוא.
         col1_name (str): שם העמודה הראשונה (תופיע בציר X).
         col2_name (str): שם העמודה השנייה (תופיע בציר Y).
+        fast (bool, optional): כפיית המסלול המהיר (True) או הרגיל (False).
+            ברירת המחדל בוחרת לפי מספר השורות.
+        fast_threshold (int): מספר השורות שמעליו נבחר המסלול המהיר.
+        gridsize (int): מספר המשושים לרוחב מפת הצפיפות.
+        stream (bool): קריאת הקובץ בחלקים עם accumulate_csv במקום טעינתו לזיכרון.
 
     Returns:
         matplotlib.figure.Figure: אובייקט הגרף (fig) שניתן להציג.
     """
+    import matplotlib.pyplot as plt
+    from correlation_stats import (linear_fit_stats, regression_band, CorrelationMatrix,
+                                   CorrelationAccumulator, accumulate_csv)
     
-    # 1. טעינת הנתונים
+    # 1. טעינת הנתונים - רק שתי העמודות הדרושות
+    # 2. בדיקת קיום העמודות (read_csv_columns זורקת KeyError אם עמודה חסרה)
+    acc = file_path if isinstance(file_path, CorrelationAccumulator) else None
     try:
-        df = pd.read_csv(file_path, encoding='latin1')
+        if acc is not None:
+            pass
+        elif stream and not isinstance(file_path, (pd.DataFrame, CorrelationMatrix)):
+            with span('accumulate'):
+                acc = accumulate_csv(file_path, col1_name, col2_name)
+        elif isinstance(file_path, CorrelationMatrix):
+            df = file_path.data[[col1_name, col2_name]]
+        elif isinstance(file_path, pd.DataFrame):
+            df = file_path[[col1_name, col2_name]]
+        else:
+            df = read_csv_columns(file_path, [col1_name, col2_name])
     except FileNotFoundError:
         print(f"שגיאה: הקובץ לא נמצא בנתיב {file_path}")
         return None
+    except KeyError:
+        print(f"שגיאה: אחת העמודות ('{col1_name}', '{col2_name}') לא קיימת בקובץ.")
+        return None
     except Exception as e:
         print(f"שגיאה בטעינת הקובץ: {e}")
         return None
 
-    # 2. בדיקת קיום העמודות
-    if col1_name not in df.columns or col2_name not in df.columns:
-        print(f"שגיאה: אחת העמודות ('{col1_name}', '{col2_name}') לא קיימת בקובץ.")
-        return None
-        
+    if acc is not None:
+        return _plot_accumulated_correlation(acc, col1_name, col2_name, fast, fast_threshold)
+
     # 3. ניקוי נתונים חסרים (NaN) - חובה עבור קורלציה
     #    נשמיט שורות שבהן *אחת* מהעמודות הרלוונטיות חסרה
     clean_df = df[[col1_name, col2_name]].dropna()
@@ -313,26 +614,56 @@ def plot_correlation(file_path, col1_name, col2_name):
         print("שגיאה: לא נשארו נתונים תקפים לאחר ניקוי ערכים חסרים.")
         return None
         
-    col1 = clean_df[col1_name]
-    col2 = clean_df[col2_name]
+    # החישוב תמיד ב-float64, גם אם הטוען צמצם את העמודות ל-float32
+    col1 = clean_df[col1_name].astype('float64')
+    col2 = clean_df[col2_name].astype('float64')
+
+    if fast is None:
+        fast = len(clean_df) > fast_threshold
 
-    # 4. חישוב הקורלציה
-    corr, p_value = pearsonr(col1, col2)
-    
     # 5. יצירת הגרף
     #    ניצור אובייקט Figure ו-Axis של Matplotlib
     fig, ax = plt.subplots(figsize=(10, 6))
+
+    if fast:
+        # 4. חישוב הקורלציה וקו הרגרסיה במעבר וקטורי אחד
+        fit = linear_fit_stats(col1, col2)
+        corr, p_value = fit['r'], fit['p']
+
+        #    מפת צפיפות במקום נקודה לכל שורה
+        hb = ax.hexbin(col1, col2, gridsize=gridsize, mincnt=1, bins='log', cmap='Blues')
+        fig.colorbar(hb, ax=ax, label='count')
+
+        #    קו רגרסיה עם רווח סמך אנליטי של 95%
+        x_grid = np.linspace(col1.min(), col1.max(), 200)
+        y_hat, lower, upper = regression_band(fit, x_grid)
+        ax.plot(x_grid, y_hat, color='red', lw=2)
+        ax.fill_between(x_grid, lower, upper, color='red', alpha=0.15)
+    else:
+        import seaborn as sns
+        from scipy.stats import pearsonr
+
+        # 4. חישוב הקורלציה
+        corr, p_value = pearsonr(col1, col2)
+
+        #    זו פונקציית הקסם של Seaborn
+        sns.regplot(
+            x=col1,
+            y=col2,
+            ax=ax,  # מציין ל-Seaborn לצייר על ה-Axis שיצרנו
+            line_kws={"color": "red", "lw": 2}, # צובע את קו הרגרסיה באדום
+            scatter_kws={"alpha": 0.6} # הופך את הנקודות למעט שקופות
+        )
     
-    #    זו פונקציית הקסם של Seaborn
-    sns.regplot(
-        x=col1,
-        y=col2,
-        ax=ax,  # מציין ל-Seaborn לצייר על ה-Axis שיצרנו
-        line_kws={"color": "red", "lw": 2}, # צובע את קו הרגרסיה באדום
-        scatter_kws={"alpha": 0.6} # הופך את הנקודות למעט שקופות
-    )
-    
-    # 6. הוספת הטקסט האינפורמטיבי על הגרף
+    # 6-7. הוספת הטקסט האינפורמטיבי על הגרף ועיצוב סופי
+    _finish_correlation_axes(ax, corr, p_value, col1_name, col2_name)
+
+    # 8. החזרת אובייקט הגרף
+    return fig
+
+
+def _finish_correlation_axes(ax, corr, p_value, col1_name, col2_name):
+    # תיבת המדדים, הכותרות וההדפסה - משותפים לכל המסלולים של plot_correlation
     #    נבנה את מחרוזת הטקסט
     text_str = f"Pearson's r: {corr:.3f}\np-value: {p_value:.3f}"
     
@@ -355,5 +686,92 @@ def plot_correlation(file_path, col1_name, col2_name):
     print(f"Pearson's correlation (r): {corr:.3f}")
     print(f"p-value: {p_value:.3f}")
 
-    # 8. החזרת אובייקט הגרף
+
+def _plot_accumulated_correlation(acc, col1_name, col2_name, fast, fast_threshold):
+    # plot_correlation מתוך CorrelationAccumulator - בלי לקרוא שוב את הקובץ
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
+    from correlation_stats import regression_band
+
+    if acc.n < 2:
+        print("שגיאה: לא נשארו נתונים תקפים לאחר ניקוי ערכים חסרים.")
+        return None
+
+    fit = acc.fit()
+    if fast is None:
+        fast = acc.n > fast_threshold
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    if fast and acc.bins:
+        #    מפת צפיפות מההיסטוגרמה שנאספה בזמן הקריאה
+        counts, x_edges, y_edges = acc.histogram()
+        mesh = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0),
+                             norm=LogNorm(), cmap='Blues')
+        fig.colorbar(mesh, ax=ax, label='count')
+
+        #    קו רגרסיה עם רווח סמך אנליטי של 95%
+        x_grid = np.linspace(acc.x_min, acc.x_max, 200)
+        y_hat, lower, upper = regression_band(fit, x_grid)
+        ax.plot(x_grid, y_hat, color='red', lw=2)
+        ax.fill_between(x_grid, lower, upper, color='red', alpha=0.15)
+    else:
+        import seaborn as sns
+
+        #    גרף פיזור של הדגימה האקראית (כל השורות, אם הן נכנסו לדגימה)
+        sample = acc.sample()
+        sns.regplot(
+            x=sample[:, 0],
+            y=sample[:, 1],
+            ax=ax,
+            line_kws={"color": "red", "lw": 2},
+            scatter_kws={"alpha": 0.6}
+        )
+
+    _finish_correlation_axes(ax, fit['r'], fit['p'], col1_name, col2_name)
+    return fig
+
+
+# פונקציה נוספת - מטריצת קורלציות (מפת חום מקובצת)
+
+def plot_correlation_matrix(result, cluster=True, alpha=None, annot=None):
+    """
+    מציג מפת חום של כל הקורלציות שחושבו ב-correlation_matrix.
+
+    Args:
+        result (CorrelationMatrix): התוצאה של correlation_stats.correlation_matrix.
+        cluster (bool): סידור השורות והעמודות לפי קיבוץ היררכי, כך שעמודות
+            שמתואמות זו עם זו יופיעו סמוכות.
+        alpha (float, optional): אם צוין, תאים שה-p (המתוקן, אם יש) שלהם גבוה
+            מהסף מוסתרים.
+        annot (bool, optional): הצגת ערך r בכל תא. ברירת המחדל - רק עד 30 עמודות.
+
+    Returns:
+        matplotlib.figure.Figure: אובייקט הגרף (fig) שניתן להציג.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from scipy.cluster import hierarchy
+
+    r = result.r
+    p = result.p_adjusted if result.p_adjusted is not None else result.p
+    mask = (p > alpha) if alpha is not None else None
+    if annot is None:
+        annot = len(r) <= 30
+    size = max(6, min(0.35 * len(r), 30))
+
+    heatmap_kws = dict(cmap='vlag', center=0, vmin=-1, vmax=1, mask=mask,
+                       annot=annot, fmt='.2f', cbar_kws={'label': f"{result.method} r"})
+    if cluster and len(r) > 2:
+        # הקיבוץ לא מקבל NaN (זוגות בלי מספיק תצפיות) - לצורך הסידור בלבד הם נחשבים כ-r=0
+        linkage = hierarchy.linkage(r.fillna(0).to_numpy(), method='average')
+        grid = sns.clustermap(r, row_linkage=linkage, col_linkage=linkage,
+                              figsize=(size, size), **heatmap_kws)
+        fig = grid.figure
+        fig.suptitle(f"Clustered {result.method} correlations ({len(r)} columns)", y=1.02)
+    else:
+        fig, ax = plt.subplots(figsize=(size, size))
+        sns.heatmap(r, ax=ax, square=True, **heatmap_kws)
+        ax.set_title(f"{result.method.capitalize()} correlations ({len(r)} columns)")
+
     return fig
+
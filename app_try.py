@@ -1,163 +1,244 @@
 # %%writefile app.py
+import logging
+import time
+
 import streamlit as st
-import pandas as pd
-from datetime import datetime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from protocol_store import ProtocolStore
+from protocol_export import FORMATS, export_records
+
+# Every full rerun and every fragment rerun logs its duration here
+logger = logging.getLogger("app_try")
+_rerun_start = time.perf_counter()
+
 
 # ========================
-# FORM SECTIONS
+# CACHED RESOURCES
 # ========================
 
-with st.form("procedure_settings"):
-    st.subheader("Procedure - Settings")
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        num = st.text_input("#Num", "1-Infinity")
-    with col2:
-        date = st.date_input("Date")
-    with col3:
-        labeling = st.text_input("Labeling")
-    protein_type = st.selectbox("Protein type", ["Type A", "Type B", "Type C"])
-    concentration = st.number_input("Concentration [wt/wt%]")
-    submit_settings = st.form_submit_button("Save Settings")
-
-with st.form("physical_treatments"):
-    st.subheader("Procedure - Physical treatments")
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        right_valve = st.number_input("right valve [bar]", value=0.0)
-    with col2:
-        left_valve = st.number_input("left valve 2 [bar]", value=0.0)
-    with col3:
-        temp_after_HPH = st.number_input("Temp after HPH [°C]", value=0.0)
-    with col4:
-        HPH_fraction = st.number_input("HPH fraction [%]", value=0.0)
-    
-    col5, col6 = st.columns(2)
-    with col5:
-        acid_name = st.text_input("Acid name")
-    with col6:
-        concentration_acid = st.number_input("Concentration [%]", value=0.0)
-    
-    mixing_temp = st.number_input("Mixing temp[°C]", value=0.0)
-    mixing_time = st.number_input("Mixing time", value=0.0)
-    heat_treatment_fraction = st.number_input("Heat treatment fraction[%]", value=0.0)
-    pH = st.number_input("pH", value=7.0)
-    
-    initial_water_temp = st.number_input("Initial water temp", value=0.0)
-    
-    submit_physical = st.form_submit_button("Save Physical Treatments")
-
-with st.form("enzymes_hydrolyzing"):
-    st.subheader("Black box ? + Procedure - Enzymes Hydrolyzing")
-    YN = st.selectbox("Y/N", ["Yes", "No"])
-    col1, col2 = st.columns(2)
-    with col1:
-        enz_num = st.number_input("Enz num.", value=0.0)
-    with col2:
-        name_enz = st.selectbox("Name", ["Enzyme A", "Enzyme B"])
-    concentration_enz = st.number_input("Concentration [%]", value=0.0)
-    added_enz = st.number_input("Added enz [g]", value=0.0)
-    addition_temp = st.number_input("Addition temp [°C]", value=0.0)
-    ino_time = st.number_input("Ino. time [min]", value=0.0)
-    ino_temp = st.number_input("Ino. temp. [°C]", value=0.0)
-    stirring = st.number_input("stirring [RPM]", value=0.0)
-    
-    black_box_protein_fraction = st.number_input("black box protein fraction[%]", value=0.0)
-    
-    submit_hydrolyzing = st.form_submit_button("Save Enzymes Hydrolyzing")
-
-with st.form("enzymes_crosslinking"):
-    st.subheader("Procedure - Enzymes Crosslinking")
-    col1, col2 = st.columns(2)
-    with col1:
-        enz_num_cross = st.number_input("Enz num.", value=0.0)
-    with col2:
-        name_enz_cross = st.selectbox("Name", ["Crosslinker X", "Crosslinker Y"])
-    concentration_enz_cross = st.number_input("Concentration [%]", value=0.0)
-    added_enz_cross = st.number_input("Added enz [g]", value=0.0)
-    addition_temp_cross = st.number_input("Addition temp [°C]", value=0.0)
-    ino_time_cross = st.number_input("Ino. time [min]", value=0.0)
-    ino_temp_cross = st.number_input("Ino. temp. [°C]", value=0.0)
-    stirring_cross = st.number_input("stirring [RPM]", value=0.0)
-    
-    submit_crosslinking = st.form_submit_button("Save Enzymes Crosslinking")
+@st.cache_resource
+def get_store():
+    # Durable record store shared by all sessions (see protocol_store.py)
+    return ProtocolStore()
+
+
+@st.cache_data(max_entries=len(FORMATS))
+def build_export(export_format, revision):
+    # Keyed on the newest record id, so a save from any session invalidates it
+    return export_records(get_store(), export_format)
+
+
+store = get_store()
+
+
+def _record_timing(name, start):
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    st.session_state.setdefault("timings", {})[name] = elapsed_ms
+    logger.info("%s rerun took %.1f ms", name, elapsed_ms)
+    return elapsed_ms
+
+
+def save_record():
+    # Every form keeps its current values in session state; a submit from
+    # any form stores one record built from all four sections
+    ctx = get_script_run_ctx()
+    store.append(st.session_state["sections"], session_id=ctx.session_id if ctx else None)
+    build_export.clear()
+    st.success("Data saved successfully!")
+
 
 # ========================
-# DATA STORAGE AND EXPORT
+# FORM SECTIONS
 # ========================
+# Each form is a fragment: submitting it reruns only that form, not the whole page.
+
+@st.fragment
+def procedure_settings_form():
+    start = time.perf_counter()
+    with st.form("procedure_settings"):
+        st.subheader("Procedure - Settings")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            num = st.text_input("#Num", "1-Infinity")
+        with col2:
+            date = st.date_input("Date")
+        with col3:
+            labeling = st.text_input("Labeling")
+        protein_type = st.selectbox("Protein type", ["Type A", "Type B", "Type C"])
+        concentration = st.number_input("Concentration [wt/wt%]")
+        submit_settings = st.form_submit_button("Save Settings")
 
-if submit_settings or submit_physical or submit_hydrolyzing or submit_crosslinking:
-    data = {
-        "Procedure Settings": {
-            "Num": num,
-            "Date": date.strftime("%Y-%m-%d"),
-            "Labeling": labeling,
-            "Protein type": protein_type,
-            "Concentration": concentration
-        },
-        "Physical Treatments": {
-            "Right Valve": right_valve,
-            "Left Valve": left_valve,
-            "Temp after HPH": temp_after_HPH,
-            "HPH Fraction": HPH_fraction,
-            "Acid Name": acid_name,
-            "Concentration Acid": concentration_acid,
-            "Mixing Temp": mixing_temp,
-            "Mixing Time": mixing_time,
-            "Heat Treatment Fraction": heat_treatment_fraction,
-            "pH": pH,
-            "Initial Water Temp": initial_water_temp
-        },
-        "Enzymes Hydrolyzing": {
-            "Y/N": YN,
-            "Enz Num": enz_num,
-            "Name": name_enz,
-            "Concentration": concentration_enz,
-            "Added Enz": added_enz,
-            "Addition Temp": addition_temp,
-            "Ino. Time": ino_time,
-            "Ino. Temp": ino_temp,
-            "Stirring": stirring,
-            "Black Box Protein Fraction": black_box_protein_fraction
-        },
-        "Enzymes Crosslinking": {
-            "Enz Num": enz_num_cross,
-            "Name": name_enz_cross,
-            "Concentration": concentration_enz_cross,
-            "Added Enz": added_enz_cross,
-            "Addition Temp": addition_temp_cross,
-            "Ino. Time": ino_time_cross,
-            "Ino. Temp": ino_temp_cross,
-            "Stirring": stirring_cross
-        }
+    values = {
+        "Num": num,
+        "Date": date.strftime("%Y-%m-%d"),
+        "Labeling": labeling,
+        "Protein type": protein_type,
+        "Concentration": concentration
     }
+    st.session_state.setdefault("sections", {})["Procedure Settings"] = values
+    if submit_settings:
+        save_record()
+        st.caption(f"Form rerun: {_record_timing('Procedure Settings', start):.0f} ms")
 
-    # Store to session state
-    if 'protocol_data' not in st.session_state:
-        st.session_state.protocol_data = []
-    st.session_state.protocol_data.append(data)
-    st.success("Data saved successfully!")
+
+@st.fragment
+def physical_treatments_form():
+    start = time.perf_counter()
+    with st.form("physical_treatments"):
+        st.subheader("Procedure - Physical treatments")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            right_valve = st.number_input("right valve [bar]", value=0.0)
+        with col2:
+            left_valve = st.number_input("left valve 2 [bar]", value=0.0)
+        with col3:
+            temp_after_HPH = st.number_input("Temp after HPH [°C]", value=0.0)
+        with col4:
+            HPH_fraction = st.number_input("HPH fraction [%]", value=0.0)
+
+        col5, col6 = st.columns(2)
+        with col5:
+            acid_name = st.text_input("Acid name")
+        with col6:
+            concentration_acid = st.number_input("Concentration [%]", value=0.0)
+
+        mixing_temp = st.number_input("Mixing temp[°C]", value=0.0)
+        mixing_time = st.number_input("Mixing time", value=0.0)
+        heat_treatment_fraction = st.number_input("Heat treatment fraction[%]", value=0.0)
+        pH = st.number_input("pH", value=7.0)
+
+        initial_water_temp = st.number_input("Initial water temp", value=0.0)
+
+        submit_physical = st.form_submit_button("Save Physical Treatments")
+
+    values = {
+        "Right Valve": right_valve,
+        "Left Valve": left_valve,
+        "Temp after HPH": temp_after_HPH,
+        "HPH Fraction": HPH_fraction,
+        "Acid Name": acid_name,
+        "Concentration Acid": concentration_acid,
+        "Mixing Temp": mixing_temp,
+        "Mixing Time": mixing_time,
+        "Heat Treatment Fraction": heat_treatment_fraction,
+        "pH": pH,
+        "Initial Water Temp": initial_water_temp
+    }
+    st.session_state.setdefault("sections", {})["Physical Treatments"] = values
+    if submit_physical:
+        save_record()
+        st.caption(f"Form rerun: {_record_timing('Physical Treatments', start):.0f} ms")
+
+
+@st.fragment
+def enzymes_hydrolyzing_form():
+    start = time.perf_counter()
+    with st.form("enzymes_hydrolyzing"):
+        st.subheader("Black box ? + Procedure - Enzymes Hydrolyzing")
+        YN = st.selectbox("Y/N", ["Yes", "No"])
+        col1, col2 = st.columns(2)
+        with col1:
+            enz_num = st.number_input("Enz num.", value=0.0)
+        with col2:
+            name_enz = st.selectbox("Name", ["Enzyme A", "Enzyme B"])
+        concentration_enz = st.number_input("Concentration [%]", value=0.0)
+        added_enz = st.number_input("Added enz [g]", value=0.0)
+        addition_temp = st.number_input("Addition temp [°C]", value=0.0)
+        ino_time = st.number_input("Ino. time [min]", value=0.0)
+        ino_temp = st.number_input("Ino. temp. [°C]", value=0.0)
+        stirring = st.number_input("stirring [RPM]", value=0.0)
+
+        black_box_protein_fraction = st.number_input("black box protein fraction[%]", value=0.0)
+
+        submit_hydrolyzing = st.form_submit_button("Save Enzymes Hydrolyzing")
+
+    values = {
+        "Y/N": YN,
+        "Enz Num": enz_num,
+        "Name": name_enz,
+        "Concentration": concentration_enz,
+        "Added Enz": added_enz,
+        "Addition Temp": addition_temp,
+        "Ino. Time": ino_time,
+        "Ino. Temp": ino_temp,
+        "Stirring": stirring,
+        "Black Box Protein Fraction": black_box_protein_fraction
+    }
+    st.session_state.setdefault("sections", {})["Enzymes Hydrolyzing"] = values
+    if submit_hydrolyzing:
+        save_record()
+        st.caption(f"Form rerun: {_record_timing('Enzymes Hydrolyzing', start):.0f} ms")
+
+
+@st.fragment
+def enzymes_crosslinking_form():
+    start = time.perf_counter()
+    with st.form("enzymes_crosslinking"):
+        st.subheader("Procedure - Enzymes Crosslinking")
+        col1, col2 = st.columns(2)
+        with col1:
+            enz_num_cross = st.number_input("Enz num.", value=0.0)
+        with col2:
+            name_enz_cross = st.selectbox("Name", ["Crosslinker X", "Crosslinker Y"])
+        concentration_enz_cross = st.number_input("Concentration [%]", value=0.0)
+        added_enz_cross = st.number_input("Added enz [g]", value=0.0)
+        addition_temp_cross = st.number_input("Addition temp [°C]", value=0.0)
+        ino_time_cross = st.number_input("Ino. time [min]", value=0.0)
+        ino_temp_cross = st.number_input("Ino. temp. [°C]", value=0.0)
+        stirring_cross = st.number_input("stirring [RPM]", value=0.0)
+
+        submit_crosslinking = st.form_submit_button("Save Enzymes Crosslinking")
+
+    values = {
+        "Enz Num": enz_num_cross,
+        "Name": name_enz_cross,
+        "Concentration": concentration_enz_cross,
+        "Added Enz": added_enz_cross,
+        "Addition Temp": addition_temp_cross,
+        "Ino. Time": ino_time_cross,
+        "Ino. Temp": ino_temp_cross,
+        "Stirring": stirring_cross
+    }
+    st.session_state.setdefault("sections", {})["Enzymes Crosslinking"] = values
+    if submit_crosslinking:
+        save_record()
+        st.caption(f"Form rerun: {_record_timing('Enzymes Crosslinking', start):.0f} ms")
+
+
+# ========================
+# EXPORT
+# ========================
+
+@st.fragment
+def export_section():
+    start = time.perf_counter()
+    export_format = st.selectbox("Export format", list(FORMATS))
+    if st.button("Export"):
+        # Stream the stored records into an in-memory file (see protocol_export.py);
+        # the result is cached until the next saved record
+        data, file_name, mime = build_export(export_format, store.last_id())
+
+        # Download button
+        st.download_button(
+            label=f"Download {export_format} file",
+            data=data,
+            file_name=file_name,
+            mime=mime
+        )
+        st.caption(f"Export rerun: {_record_timing('Export', start):.0f} ms")
+
+
+procedure_settings_form()
+physical_treatments_form()
+enzymes_hydrolyzing_form()
+enzymes_crosslinking_form()
+export_section()
 
 # ========================
-# EXPORT TO EXCEL
+# RERUN TIMING
 # ========================
-if st.button("Export to Excel"):
-    # Create DataFrame
-    df = pd.DataFrame(st.session_state.protocol_data)
-    df = df.transpose()  # Transpose for a more readable format
-    
-    # Convert dictionary-like columns to string representation
-    for col in df.columns:
-        if isinstance(df[col].iloc[0], dict):
-            df[col] = df[col].apply(lambda x: str(x))
-
-    # Export to Excel
-    df.to_excel("protocol_data.xlsx")
-
-    # Download button
-    st.download_button(
-        label="Download Excel file",
-        data=open("protocol_data.xlsx", "rb").read(),
-        file_name="protocol_data.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+with st.sidebar.expander("Rerun timing"):
+    timings = st.session_state.get("timings", {})
+    timings["Full page"] = _record_timing("Full page", _rerun_start)
+    for name, elapsed_ms in timings.items():
+        st.write(f"{name}: {elapsed_ms:.0f} ms")
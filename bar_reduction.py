@@ -0,0 +1,103 @@
+"""
+Reduction stage for bar charts with very many X values.
+
+A bar chart with one bar per row sends every row (and a text label per bar)
+to the browser, which freezes Colab beyond ~10^5 rows. Above a point budget
+the rows are aggregated per X value; numeric X values are binned and
+categorical X values are cut down to the top N plus an "Other" bucket.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_POINTS = 5000
+AGGREGATIONS = ('mean', 'sum', 'min', 'max')
+
+# Rough size of a text label in plotly: characters * font size * this factor
+_CHAR_WIDTH = 0.6
+
+
+def reduce_for_bars(df, x_col, y_cols, max_points=DEFAULT_MAX_POINTS, agg='mean',
+                    top_n=None, other_label='Other'):
+    """
+    Shrinks a frame to at most ``max_points`` bars per Y column.
+
+    Parameters:
+    df: pandas.DataFrame, the data to plot
+    x_col: str, name of the X column
+    y_cols: list of str, names of the Y columns
+    max_points: int or None, number of bars above which the data is reduced
+        (None never reduces)
+    agg: str, one of 'mean', 'sum', 'min', 'max', used to combine rows
+    top_n: int or None, categories kept for categorical X before the rest is
+        folded into ``other_label`` (defaults to ``max_points - 1``)
+    other_label: str, label of the bucket holding the remaining categories
+
+    Returns:
+    (reduced DataFrame, info dict with 'rows_in', 'rows_out', 'method', 'agg')
+    """
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"agg must be one of {AGGREGATIONS}, got {agg!r}")
+
+    info = {'rows_in': len(df), 'rows_out': len(df), 'method': None, 'agg': agg}
+    if max_points is None or len(df) <= max_points:
+        return df, info
+
+    x = df[x_col]
+    is_numeric = pd.api.types.is_numeric_dtype(x) and not pd.api.types.is_bool_dtype(x)
+    n_unique = x.nunique()
+
+    if n_unique <= max_points:
+        keys, method = x, 'group'
+    elif is_numeric:
+        # Equal-width bins, each bar drawn at the centre of its bin
+        # Nullable Int64/Float64 columns hold pd.NA, so go through float NaN
+        values = x.to_numpy(dtype=np.float64, na_value=np.nan)
+        present = ~np.isnan(values)
+        edges = np.linspace(values[present].min(), values[present].max(), max_points + 1)
+        codes = np.clip(np.searchsorted(edges, values[present], side='right') - 1, 0, max_points - 1)
+        # Rows without an X value stay NaN and groupby leaves them out of every bin
+        centers = np.full(len(values), np.nan)
+        centers[present] = ((edges[:-1] + edges[1:]) / 2)[codes]
+        keys, method = pd.Series(centers, index=df.index, name=x_col), 'bin'
+    else:
+        keep = x.value_counts().index[:top_n or max_points - 1]
+        labels = x.astype(object)
+        keys = labels.where(labels.isin(keep), other_label).rename(x_col)
+        method = 'top_n'
+
+    reduced = (df[y_cols]
+               .groupby(keys, sort=is_numeric, observed=True)
+               .agg(agg)
+               .reset_index())
+    if method == 'top_n' and (reduced[x_col] == other_label).any():
+        # Keep the catch-all bucket at the end of the axis
+        is_other = reduced[x_col] == other_label
+        reduced = pd.concat([reduced[~is_other], reduced[is_other]], ignore_index=True)
+
+    info.update(rows_out=len(reduced), method=method)
+    return reduced, info
+
+
+def labels_fit(n_bars, n_traces, label_chars, plot_width=700, minsize=8):
+    """
+    Returns whether per-bar text labels would survive ``uniformtext_mode='hide'``.
+
+    Plotly hides any label it would have to shrink below ``minsize``; when the
+    bars are narrower than such a label, sending the labels is wasted payload.
+    """
+    if n_bars == 0:
+        return True
+    bar_width = plot_width / (n_bars * max(n_traces, 1))
+    return bar_width >= label_chars * minsize * _CHAR_WIDTH
+
+
+def describe_reduction(info, x_col):
+    """Returns a one-line description of a reduction for the figure, or None."""
+    if info['method'] is None:
+        return None
+    how = {
+        'group': f"{info['agg']} per {x_col} value",
+        'bin': f"{info['agg']} per {x_col} bin",
+        'top_n': f"{info['agg']} per {x_col}, top categories + Other",
+    }[info['method']]
+    return f"Reduced {info['rows_in']:,} rows to {info['rows_out']:,} bars ({how})"
@@ -0,0 +1,372 @@
+"""
+Headless batch rendering of OS_plots figures from a manifest.
+
+A manifest (JSON, or YAML when PyYAML is installed) lists many plot specs:
+
+    output_dir: reports            # optional, relative to the manifest
+    formats: [png, html]           # any of png, svg, html
+    defaults: {max_points: 5000, agg: mean}
+    plots:
+      - name: revenue
+        kind: bar                  # bar (create_plot_from_dfs) or correlation (plot_correlation)
+        files: [sales.csv, costs.csv]
+        x: date
+        y: [revenue, cost]
+      - name: price_vs_qty
+        kind: correlation
+        files: sales.csv
+        x: price
+        y: qty
+
+Every distinct file is read once, with the union of the columns its specs
+need; the specs then render in a process pool. Each worker keeps one Kaleido
+(Chrome) export process open for all of its Plotly figures instead of starting
+one per image, and matplotlib runs on the non-interactive Agg backend. An
+index.html linking every output is written next to the figures, and the load,
+build and write time of every plot is logged (the read time of a file shared
+by several plots is split equally between them).
+
+Usage:
+    python batch_plots.py manifest.yaml --workers 4 --formats png html
+"""
+import argparse
+import html
+import io
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from csv_loader import project_columns, read_csv_columns, read_header
+
+logger = logging.getLogger('batch_plots')
+
+KINDS = ('bar', 'correlation')
+FORMATS = ('png', 'svg', 'html')
+DEFAULT_FORMATS = ('png',)
+# Spec keys forwarded to create_plot_from_dfs / plot_correlation
+BAR_OPTIONS = ('max_fanout', 'tolerance', 'max_points', 'agg')
+CORRELATION_OPTIONS = ('fast', 'fast_threshold', 'gridsize')
+
+
+def load_manifest(path):
+    """
+    Reads and validates a plot manifest.
+
+    Parameters:
+    path: str, .json, .yaml or .yml file
+
+    Returns:
+    dict with 'output_dir', 'formats' and 'plots'; every plot spec has 'name',
+    'kind', 'files' (absolute paths), 'x', 'y' (list) and its options merged
+    over the manifest 'defaults'.
+    """
+    with open(path, encoding='utf-8') as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError("YAML manifests need PyYAML (pip install pyyaml); "
+                                  "use a .json manifest otherwise") from e
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(path))
+    formats = list(manifest.get('formats', DEFAULT_FORMATS))
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown output format(s) {sorted(unknown)}; expected {FORMATS}")
+
+    defaults = manifest.get('defaults', {})
+    plots, names = [], set()
+    for i, raw in enumerate(manifest.get('plots', [])):
+        spec = {**defaults, **raw}
+        kind = spec.get('kind', 'bar')
+        if kind not in KINDS:
+            raise ValueError(f"Plot {i}: kind must be one of {KINDS}, got {kind!r}")
+        for key in ('files', 'x', 'y'):
+            if key not in spec:
+                raise ValueError(f"Plot {i}: missing {key!r}")
+        files = [spec['files']] if isinstance(spec['files'], str) else list(spec['files'])
+        y = [spec['y']] if isinstance(spec['y'], str) else list(spec['y'])
+        if kind == 'correlation' and (len(files) != 1 or len(y) != 1):
+            raise ValueError(f"Plot {i}: a correlation plot takes one file and one y column")
+
+        name = _slug(spec.get('name') or f"{kind}_{spec['x']}_{'_'.join(y)}")
+        while name in names:
+            name += '_'
+        names.add(name)
+        spec.update(name=name, kind=kind, y=y,
+                    files=[os.path.normpath(os.path.join(base, f)) for f in files])
+        plots.append(spec)
+
+    output_dir = os.path.join(base, manifest.get('output_dir', 'plots'))
+    return {'output_dir': output_dir, 'formats': formats, 'plots': plots}
+
+
+def _slug(name):
+    return re.sub(r'[^\w.-]+', '_', str(name)).strip('_') or 'plot'
+
+
+def _read_headers(plots):
+    headers = {}
+    for spec in plots:
+        for path in spec['files']:
+            if path not in headers:
+                try:
+                    headers[path] = read_header(path)
+                except Exception as e:
+                    headers[path] = e
+    return headers
+
+
+def _needed_columns(plots, headers):
+    # Per file, the columns the specs that use it need. For bar specs over
+    # several files the same projection as OS_plots.plot_from_path is used, so
+    # a column present in several files is read from the first one only.
+    needed = {path: [] for path, header in headers.items() if not isinstance(header, Exception)}
+    for spec in plots:
+        file_headers = [headers[p] if p in needed else [] for p in spec['files']]
+        if spec['kind'] == 'correlation':
+            cols_per_file = [[spec['x']] + spec['y']]
+        else:
+            cols_per_file = project_columns(file_headers, spec['x'], spec['y'])
+        spec['columns'] = cols_per_file
+        for path, header, cols in zip(spec['files'], file_headers, cols_per_file):
+            if path in needed:
+                needed[path] += [c for c in cols if c in header and c not in needed[path]]
+    return needed
+
+
+def load_files(plots, timings=None):
+    """
+    Reads every distinct file of the specs once, with only the columns they use.
+
+    Parameters:
+    plots: list of dict, the normalized plot specs
+    timings: dict or None, filled with the read time in seconds of every file
+
+    Returns:
+    dict mapping file path to DataFrame; unreadable files map to the exception.
+    """
+    headers = _read_headers(plots)
+    frames = {path: header for path, header in headers.items() if isinstance(header, Exception)}
+    for path, cols in _needed_columns(plots, headers).items():
+        start = time.perf_counter()
+        try:
+            frames[path] = read_csv_columns(path, cols)
+            if timings is not None:
+                timings[path] = time.perf_counter() - start
+            logger.info("loaded %s (%d rows, %d columns) in %.2f s", path,
+                        len(frames[path]), len(cols), time.perf_counter() - start)
+        except Exception as e:
+            frames[path] = e
+    for path, frame in frames.items():
+        if isinstance(frame, Exception):
+            logger.error("could not load %s: %s", path, frame)
+    return frames
+
+
+def _init_worker():
+    # Runs once per worker process: headless matplotlib, and one Kaleido
+    # export process reused by every Plotly image this worker writes
+    import matplotlib
+    matplotlib.use('Agg')
+    try:
+        import kaleido
+        # Locates Chrome without launching it: the sync server starts its
+        # browser on a background thread and would hang every export if
+        # Chrome were missing
+        kaleido.Kaleido()
+        kaleido.start_sync_server(silence_warnings=True)
+    except Exception as e:
+        # Plotly then exports each image on its own (or fails per plot if
+        # Chrome is missing); HTML output does not need Kaleido
+        logger.warning("persistent Kaleido export process unavailable: %s", e)
+
+
+def _build_figure(spec, dfs):
+    from OS_plots import create_plot_from_dfs, plot_correlation
+
+    if spec['kind'] == 'bar':
+        options = {key: spec[key] for key in BAR_OPTIONS if key in spec}
+        return create_plot_from_dfs(dfs, spec['x'], spec['y'], widget=False, **options)
+    options = {key: spec[key] for key in CORRELATION_OPTIONS if key in spec}
+    return plot_correlation(dfs[0], spec['x'], spec['y'][0], **options)
+
+
+def _write_figure(fig, path, fmt):
+    if hasattr(fig, 'savefig'):
+        if fmt == 'html':
+            # matplotlib figures are embedded in the page as inline SVG
+            buffer = io.StringIO()
+            fig.savefig(buffer, format='svg', bbox_inches='tight')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"<!DOCTYPE html><html><body>{buffer.getvalue()}</body></html>")
+        else:
+            fig.savefig(path, format=fmt, dpi=120, bbox_inches='tight')
+    elif fmt == 'html':
+        fig.write_html(path, include_plotlyjs='cdn')
+    else:
+        fig.write_image(path, format=fmt)
+
+
+def _failed_result(spec, error):
+    # Result of a plot that never rendered, in the shape render_plot returns
+    return {'name': spec['name'], 'kind': spec['kind'], 'outputs': [],
+            'build_seconds': 0.0, 'write_seconds': 0.0, 'error': error}
+
+
+def render_plot(spec, dfs, output_dir, formats):
+    """
+    Builds one figure from already loaded frames and writes it in every format.
+
+    Returns:
+    dict with 'name', 'kind', 'outputs' (list of file names), 'build_seconds',
+    'write_seconds' and 'error' (None on success).
+    """
+    result = {'name': spec['name'], 'kind': spec['kind'], 'outputs': [],
+              'build_seconds': 0.0, 'write_seconds': 0.0, 'error': None}
+    start = time.perf_counter()
+    try:
+        fig = _build_figure(spec, dfs)
+    except Exception as e:
+        fig = None
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['build_seconds'] = time.perf_counter() - start
+    if fig is None:
+        result['error'] = result['error'] or "the plot function returned no figure (see its log)"
+        return result
+
+    # Formats are written independently, so e.g. HTML output survives a
+    # static export failure
+    start = time.perf_counter()
+    errors = []
+    for fmt in formats:
+        file_name = f"{spec['name']}.{fmt}"
+        try:
+            _write_figure(fig, os.path.join(output_dir, file_name), fmt)
+            result['outputs'].append(file_name)
+        except Exception as e:
+            errors.append(f"{fmt}: {type(e).__name__}: {str(e).strip()}")
+    if hasattr(fig, 'savefig'):
+        import matplotlib.pyplot as plt
+        plt.close(fig)
+    result['error'] = '\n'.join(errors) or None
+    result['write_seconds'] = time.perf_counter() - start
+    return result
+
+
+def write_index(results, output_dir, title='Plots'):
+    """Writes index.html listing every plot, its outputs, timing and errors; returns its path."""
+    rows = []
+    for r in results:
+        images = [o for o in r['outputs'] if o.endswith(('.png', '.svg'))]
+        preview = (f'<img src="{html.escape(images[0])}" loading="lazy" style="max-width:480px">'
+                   if images else '')
+        links = ' '.join(f'<a href="{html.escape(o)}">{html.escape(o.rsplit(".", 1)[1])}</a>'
+                         for o in r['outputs'])
+        error = f'<pre style="color:#b00">{html.escape(r["error"])}</pre>' if r['error'] else ''
+        rows.append(f"<tr><td><b>{html.escape(r['name'])}</b><br>{r['kind']}</td>"
+                    f"<td>{preview}{error}</td><td>{links}</td>"
+                    f"<td>{r.get('load_seconds', 0):.2f} / {r['build_seconds']:.2f} / "
+                    f"{r['write_seconds']:.2f}</td></tr>")
+    failed = sum(1 for r in results if r['error'])
+    page = (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title>"
+            "<style>td{vertical-align:top;padding:6px;border-bottom:1px solid #ddd}</style></head>"
+            f"<body><h1>{html.escape(title)}</h1>"
+            f"<p>{len(results)} plot(s), {failed} failed, generated {time.strftime('%Y-%m-%d %H:%M')}</p>"
+            "<table><tr><th>plot</th><th>preview</th><th>files</th>"
+            "<th>load / build / write [s]</th></tr>"
+            f"{''.join(rows)}</table></body></html>")
+    path = os.path.join(output_dir, 'index.html')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(page)
+    return path
+
+
+def render_manifest(manifest_path, output_dir=None, formats=None, workers=None):
+    """
+    Renders every plot of a manifest and writes an index page.
+
+    Parameters:
+    manifest_path: str, JSON or YAML manifest (see load_manifest)
+    output_dir: str or None, overrides the manifest's output_dir
+    formats: list of str or None, overrides the manifest's formats
+    workers: int or None, number of worker processes (None uses every CPU)
+
+    Returns:
+    list of per-plot result dicts (see render_plot), in manifest order.
+    """
+    manifest = load_manifest(manifest_path)
+    output_dir = output_dir or manifest['output_dir']
+    formats = formats or manifest['formats']
+    os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    timings = {}
+    frames = load_files(manifest['plots'], timings)
+    # Every file was read once for all the plots using it; each plot is charged
+    # its share, so the column sums to the total read time
+    users = {}
+    for spec in manifest['plots']:
+        for path in set(spec['files']):
+            users[path] = users.get(path, 0) + 1
+
+    results = [None] * len(manifest['plots'])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {}
+        for i, spec in enumerate(manifest['plots']):
+            failed = [frames[p] for p in spec['files'] if isinstance(frames[p], Exception)]
+            if failed:
+                results[i] = _failed_result(spec, f"could not load input: {failed[0]}")
+                continue
+            # Only the columns this spec uses are sent to the worker
+            dfs = [frames[p][[c for c in cols if c in frames[p].columns]]
+                   for p, cols in zip(spec['files'], spec['columns'])]
+            try:
+                futures[pool.submit(render_plot, spec, dfs, output_dir, formats)] = i
+            except Exception as e:
+                # The pool is broken (a worker died)
+                results[i] = _failed_result(spec, f"{type(e).__name__}: {e}")
+
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # A crashed worker (BrokenProcessPool) or a result that could not
+                # be pickled fails this plot only
+                results[i] = _failed_result(manifest['plots'][i], f"{type(e).__name__}: {e}")
+
+    for spec, r in zip(manifest['plots'], results):
+        r['load_seconds'] = sum(timings.get(path, 0.0) / users[path] for path in set(spec['files']))
+        if r['error']:
+            logger.error("%s: failed: %s", r['name'], r['error'])
+        else:
+            logger.info("%s: build %.2f s, write %.2f s -> %s", r['name'], r['build_seconds'],
+                        r['write_seconds'], ', '.join(r['outputs']))
+
+    index = write_index(results, output_dir, title=os.path.basename(manifest_path))
+    logger.info("%d plot(s) in %.2f s, index: %s", len(results), time.perf_counter() - start, index)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render OS_plots figures from a manifest, without a GUI.")
+    parser.add_argument('manifest', help='JSON or YAML manifest of plot specs')
+    parser.add_argument('--output-dir', help="overrides the manifest's output_dir")
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, help="overrides the manifest's formats")
+    parser.add_argument('--workers', type=int, help='worker processes (default: every CPU)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    results = render_manifest(args.manifest, args.output_dir, args.formats, args.workers)
+    return 1 if any(r['error'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
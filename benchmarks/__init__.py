@@ -0,0 +1,8 @@
+"""
+Benchmarks of the repo entry points.
+
+generators.py holds the seeded synthetic data, suite.py the size-sweep suite
+with JSON results and regression checks; the bench_*.py scripts are focused
+single-topic benchmarks. Run any of them from the repo root, e.g.
+``python benchmarks/suite.py --quick``.
+"""
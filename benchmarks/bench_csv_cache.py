@@ -0,0 +1,64 @@
+"""
+Cold vs warm load times of OS_plots calls with the columnar CSV cache.
+
+Usage:
+    python benchmarks/bench_csv_cache.py --rows 500000 --cols 60
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import csv_cache  # noqa: E402
+import csv_loader  # noqa: E402
+import OS_plots  # noqa: E402
+from benchmarks.generators import make_csv  # noqa: E402
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    if isinstance(result, plt.Figure):
+        plt.close(result)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--cols', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3, help='warm calls per case')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.csv')
+        make_csv(path, args.rows, args.cols)
+        size_mb = os.path.getsize(path) / 2**20
+
+        cases = {
+            'plot_from_path': lambda: OS_plots.plot_from_path(path, 'Sample', ['value_0', 'value_1']),
+            'plot_correlation': lambda: OS_plots.plot_correlation(path, 'value_0', 'value_1'),
+        }
+
+        print(f"file: {size_mb:.1f} MB, {args.rows} rows x {args.cols} cols")
+        print(f"{'call':<20}{'no cache [s]':>14}{'cold [s]':>10}{'warm [s]':>10}")
+        for name, func in cases.items():
+            csv_cache.disable_cache()
+            uncached = timed(func)
+            cache = csv_cache.enable_cache(os.path.join(tmp, f'cache_{name}'))
+            cold = timed(func)
+            warm = min(timed(func) for _ in range(args.repeat))
+            cache.clear()
+            print(f"{name:<20}{uncached:>14.3f}{cold:>10.3f}{warm:>10.3f}")
+        csv_loader.set_cache(None)
+
+
+if __name__ == '__main__':
+    main()
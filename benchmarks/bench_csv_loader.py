@@ -0,0 +1,61 @@
+"""
+Memory/throughput benchmark: full-frame pd.read_csv vs csv_loader.read_csv_columns.
+
+Usage:
+    python benchmarks/bench_csv_loader.py --rows 500000 --cols 60 --use 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from csv_loader import read_csv_columns  # noqa: E402
+from benchmarks.generators import make_csv  # noqa: E402
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, df.memory_usage(deep=True).sum()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--cols', type=int, default=40)
+    parser.add_argument('--use', type=int, default=3, help='number of columns a plot needs')
+    parser.add_argument('--chunksize', type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.csv')
+        make_csv(path, args.rows, args.cols)
+        size_mb = os.path.getsize(path) / 2**20
+        columns = list(pd.read_csv(path, nrows=0).columns[:args.use])
+
+        cases = {
+            'pd.read_csv (full frame)': lambda: pd.read_csv(path, encoding='latin1'),
+            'read_csv_columns': lambda: read_csv_columns(path, columns),
+            f'read_csv_columns chunk={args.chunksize}':
+                lambda: read_csv_columns(path, columns, chunksize=args.chunksize),
+        }
+
+        print(f"file: {size_mb:.1f} MB, {args.rows} rows x {args.cols} cols, reading {args.use} cols")
+        print(f"{'case':<36}{'time [s]':>10}{'MB/s':>10}{'peak [MB]':>12}{'frame [MB]':>12}")
+        for name, func in cases.items():
+            elapsed, peak, frame = measure(func)
+            print(f"{name:<36}{elapsed:>10.3f}{size_mb / elapsed:>10.1f}"
+                  f"{peak / 2**20:>12.1f}{frame / 2**20:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Cold import time of the repo modules, checked against a budget.
+
+Every module is imported in a fresh interpreter under ``python -X importtime``
+and the median of the cumulative times is compared with its budget. The heavy
+backends (ipywidgets, matplotlib, seaborn, SciPy, OpenCV, scikit-image) must
+not be loaded by the import at all; they load on the first call that needs
+them. The script exits with status 1 when a module is over budget or loads a
+deferred backend, so it can gate CI or a nightly job.
+
+Baseline measured with this script (Linux VM, Python 3.11, pandas 3):
+    module            eager imports    lazy imports
+    OS_plots              2.55 s          0.55 s
+    utils                 1.52 s          0.52 s
+Most of what remains is pandas itself.
+
+Usage:
+    python benchmarks/bench_import_time.py --repeat 5
+    python benchmarks/bench_import_time.py --budget OS_plots=0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold import budget per module in seconds, with headroom over the lazy baseline
+BUDGETS = {
+    'OS_plots': 0.8,
+    'utils': 0.8,
+    'batch_plots': 1.0,
+}
+
+# Top-level packages each module must leave unloaded
+DEFERRED = {
+    'OS_plots': ['ipywidgets', 'IPython', 'matplotlib', 'seaborn', 'scipy'],
+    'utils': ['cv2', 'skimage', 'scipy', 'imutils', 'matplotlib'],
+    'batch_plots': ['ipywidgets', 'IPython', 'matplotlib', 'seaborn', 'scipy'],
+}
+
+_PROBE = ("import sys, json, {module}; "
+          "print(json.dumps(sorted({{name.split('.')[0] for name in sys.modules}})))")
+
+
+def import_seconds(module):
+    """Cumulative cold import time of ``module`` in a fresh interpreter, from -X importtime."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         capture_output=True, text=True, check=True, cwd=ROOT)
+    for line in reversed(out.stderr.splitlines()):
+        # "import time: self [us] | cumulative | imported package"
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6
+    raise RuntimeError(f"No importtime line for {module}")
+
+
+def loaded_packages(module):
+    """Top-level packages present in sys.modules right after importing ``module``."""
+    out = subprocess.run([sys.executable, '-c', _PROBE.format(module=module)],
+                         capture_output=True, text=True, check=True, cwd=ROOT)
+    return set(json.loads(out.stdout.strip().splitlines()[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='cold imports per module')
+    parser.add_argument('--budget', action='append', default=[], metavar='MODULE=SECONDS',
+                        help='override a budget (repeatable)')
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS)
+    for item in args.budget:
+        module, seconds = item.split('=')
+        budgets[module] = float(seconds)
+
+    failed = False
+    print(f"{'module':<14}{'median [s]':>12}{'min [s]':>10}{'budget [s]':>12}  status")
+    for module, budget in budgets.items():
+        times = [import_seconds(module) for _ in range(args.repeat)]
+        median = statistics.median(times)
+        leaked = sorted(loaded_packages(module) & set(DEFERRED.get(module, [])))
+        status = 'ok'
+        if median > budget:
+            status = 'OVER BUDGET'
+        if leaked:
+            status = f"loads {', '.join(leaked)}" + ('' if status == 'ok' else f"; {status}")
+        failed |= status != 'ok'
+        print(f"{module:<14}{median:>12.3f}{min(times):>10.3f}{budget:>12.2f}  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
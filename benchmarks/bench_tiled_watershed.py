@@ -0,0 +1,83 @@
+"""
+Peak RSS and wall time: full-frame segment_image vs tiled_watershed_segmentation.
+
+Each case runs in a fresh subprocess so its peak resident memory is measured
+in isolation. Peak RSS of the tiled case is reported for the parent and for
+the largest worker process.
+
+Usage:
+    python benchmarks/bench_tiled_watershed.py --size 8000 --tile 2048 --workers 4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks.generators import make_particle_image  # noqa: E402
+
+
+def _peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def _run_case(mode, path, args):
+    start = time.perf_counter()
+    if mode == 'full':
+        from utils import segment_image
+        n_regions = segment_image(np.load(path), args.min_distance)['n_regions']
+    else:
+        from tiled_watershed import tiled_watershed_segmentation
+        result = tiled_watershed_segmentation(path, args.min_distance, tile_size=args.tile,
+                                              overlap=args.overlap, workers=args.workers,
+                                              progress=False)
+        n_regions = result['n_regions']
+        os.remove(result['labels_path'])
+    print(json.dumps({
+        'seconds': time.perf_counter() - start,
+        'n_regions': n_regions,
+        'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF),
+        'worker_peak_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=6000)
+    parser.add_argument('--tile', type=int, default=2048)
+    parser.add_argument('--overlap', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--min-distance', type=int, default=10)
+    parser.add_argument('--color', action='store_true', help='3-channel image (adds mean shift)')
+    parser.add_argument('--run', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        _run_case(args.run[0], args.run[1], args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'particles.npy')
+        expected = make_particle_image(path, args.size, color=args.color)
+        print(f"image: {args.size}x{args.size}{'x3' if args.color else ''}, {expected} particles, "
+              f"tile {args.tile} + {args.overlap} px halo, {args.workers} workers")
+        print(f"{'case':<8}{'time [s]':>10}{'regions':>10}{'peak RSS [MB]':>16}{'worker RSS [MB]':>18}")
+        for mode in ('full', 'tiled'):
+            out = subprocess.run([sys.executable, __file__, *sys.argv[1:], '--run', mode, path],
+                                 capture_output=True, text=True, check=True, cwd=ROOT)
+            stats = json.loads(out.stdout.strip().splitlines()[-1])
+            worker = stats['worker_peak_rss_mb'] if mode == 'tiled' else float('nan')
+            print(f"{mode:<8}{stats['seconds']:>10.2f}{stats['n_regions']:>10}"
+                  f"{stats['peak_rss_mb']:>16.0f}{worker:>18.0f}")
+
+
+if __name__ == '__main__':
+    main()
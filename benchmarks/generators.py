@@ -0,0 +1,125 @@
+"""
+Seeded synthetic data for the benchmarks.
+
+Every generator is deterministic for a given seed, so runs on different
+machines (or before and after a change) measure exactly the same data.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def make_frame(rows, cols, seed=0, nan_rate=0.0, key='Sample', label_every=5):
+    """
+    Returns a DataFrame with a unique integer key column and ``cols - 1`` data columns.
+
+    Every ``label_every``-th data column is a low-cardinality text label
+    ('low'/'mid'/'high'), the others are normal floats rounded to 3 decimals.
+    ``nan_rate`` of the data values (not the key) are set missing.
+    """
+    rng = np.random.default_rng(seed)
+    data = {key: np.arange(rows)}
+    for i in range(cols - 1):
+        if i % label_every == label_every - 1:
+            data[f'label_{i}'] = rng.choice(['low', 'mid', 'high'], size=rows)
+        else:
+            data[f'value_{i}'] = rng.normal(size=rows).round(3)
+    df = pd.DataFrame(data)
+    if nan_rate:
+        for column in df.columns[1:]:
+            df.loc[rng.random(rows) < nan_rate, column] = np.nan
+    return df
+
+
+def make_csv(path, rows, cols, seed=0, nan_rate=0.0):
+    """Writes make_frame(rows, cols, seed, nan_rate) to ``path`` as latin1 CSV; returns the path."""
+    make_frame(rows, cols, seed=seed, nan_rate=nan_rate).to_csv(path, index=False, encoding='latin1')
+    return path
+
+
+def duplicate_keys(df, dup_rate, seed=0, key='Sample'):
+    """
+    Makes ``dup_rate`` of the rows repeat a key of another row, then shuffles the rows.
+
+    Returns a copy; a dup_rate of 0 only shuffles.
+    """
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    n_dup = int(len(df) * dup_rate)
+    if n_dup:
+        keys = df[key].to_numpy().copy()
+        keys[-n_dup:] = rng.choice(keys[:len(df) - n_dup], size=n_dup)
+        df[key] = keys
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+
+def expected_merge_rows(frames, key='Sample'):
+    """Row count of the inner merge of ``frames`` on ``key`` (product of key multiplicities)."""
+    counts = None
+    for df in frames:
+        c = df[key].value_counts()
+        counts = c if counts is None else counts.mul(c, fill_value=0)
+    return int(counts[counts > 0].sum()) if counts is not None else 0
+
+
+def make_merge_frames(rows, n_frames=2, cols=6, seed=0, nan_rate=0.0, dup_rate=0.0):
+    """
+    Returns ``n_frames`` DataFrames sharing the 'Sample' key, ready to merge.
+
+    The data columns of frame i are prefixed 'f{i}_' so no two frames share a
+    column besides the key; ``dup_rate`` of every frame's keys are duplicated
+    (see duplicate_keys), which fans out the merge.
+    """
+    frames = []
+    for i in range(n_frames):
+        df = make_frame(rows, cols, seed=seed + i, nan_rate=nan_rate)
+        df = df.rename(columns={c: f'f{i}_{c}' for c in df.columns[1:]})
+        frames.append(duplicate_keys(df, dup_rate, seed=seed + i))
+    return frames
+
+
+def make_merge_csvs(directory, rows, n_frames=2, cols=6, seed=0, nan_rate=0.0, dup_rate=0.0):
+    """Writes make_merge_frames(...) as CSVs in ``directory``; returns (paths, expected merged rows)."""
+    frames = make_merge_frames(rows, n_frames, cols, seed, nan_rate, dup_rate)
+    paths = []
+    for i, df in enumerate(frames):
+        path = os.path.join(directory, f'merge_{rows}_{i}.csv')
+        df.to_csv(path, index=False, encoding='latin1')
+        paths.append(path)
+    return paths, expected_merge_rows(frames)
+
+
+def make_particle_image(path, size, radius=12, spacing=40, color=False, seed=0):
+    """
+    Writes an image with a jittered grid of bright discs; returns the disc count.
+
+    ``path`` ending in .npy is written as a memory-mapped array (so images larger
+    than RAM can be generated band by band); any other extension is written
+    with OpenCV.
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    shape = (size, size, 3) if color else (size, size)
+    is_npy = path.endswith('.npy')
+    img = (np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=shape) if is_npy
+           else np.zeros(shape, dtype=np.uint8))
+    count = 0
+    for y in range(spacing // 2, size - spacing // 2, spacing):
+        band = np.zeros((spacing + 2 * radius, size) + img.shape[2:], dtype=np.uint8)
+        for x in range(spacing // 2, size - spacing // 2, spacing):
+            jitter = rng.integers(-4, 5, 2)
+            cv2.circle(band, (int(x + jitter[0]), int(radius + spacing // 2 + jitter[1])),
+                       radius, (220, 220, 220) if color else 220, -1)
+            count += 1
+        top = y - spacing // 2 - radius
+        src = band[max(0, -top):]
+        top = max(top, 0)
+        rows = min(len(src), size - top)
+        img[top:top + rows] = np.maximum(img[top:top + rows], src[:rows])
+    if is_npy:
+        img.flush()
+    else:
+        cv2.imwrite(path, img)
+    return count
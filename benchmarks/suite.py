@@ -0,0 +1,330 @@
+"""
+Size-sweep benchmark suite for the repo entry points, with JSON results.
+
+Benchmarks (the --bench names):
+    create_plot_from_dfs     merge + bar reduction of in-memory frames
+    plot_from_path           column-projected CSV reads + merge + bars
+    plot_correlation         two-column read + correlation plot (hexbin path when large)
+    classify_variable_types  profiling of a wide frame with missing values
+    watershed_segmentation   segmentation + overlay of a particle image (known count)
+
+All inputs come from the seeded generators in benchmarks/generators.py and
+are written once per run. Every (benchmark, size) case runs in a fresh
+subprocess, so imports and earlier cases never leak into its numbers. The
+case reports the median wall time over --repeat calls and the peak resident
+memory of the calls. On Linux the kernel's peak-RSS counter is reset right
+before the first call, so 'peak_delta_mb' is the memory the calls
+themselves added.
+
+Results are saved as JSON (--out). Passing an earlier file to --compare flags
+every case whose time or peak memory grew by more than the tolerance, and
+the script then exits with status 1.
+
+Usage:
+    python benchmarks/suite.py --quick --out results.json
+    python benchmarks/suite.py --bench plot_from_path --sizes 100000 1000000
+    python benchmarks/suite.py --out new.json --compare results.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks import generators  # noqa: E402
+
+# Default sweeps: rows for the table benchmarks, image side in pixels for the watershed
+SIZES = {
+    'create_plot_from_dfs': [10_000, 100_000, 1_000_000],
+    'plot_from_path': [10_000, 100_000, 1_000_000],
+    'plot_correlation': [10_000, 100_000, 1_000_000],
+    'classify_variable_types': [10_000, 100_000, 1_000_000],
+    'watershed_segmentation': [512, 1024, 2048],
+}
+QUICK_SIZES = {name: sizes[:2] for name, sizes in SIZES.items()}
+
+# Shape of the generated data
+MERGE_COLS = 6           # columns per file in the merge benchmarks
+PROFILE_COLS = 50        # width of the classify_variable_types frame
+NAN_RATE = 0.05
+DUP_RATE = 0.01
+MIN_DISTANCE = 10
+
+
+# ------------------------------------------------------------------------------
+#  Inputs (parent process)
+# ------------------------------------------------------------------------------
+
+def make_inputs(bench, size, directory, seed):
+    """Writes the input files of one case and returns its parameters (JSON-serializable)."""
+    if bench in ('create_plot_from_dfs', 'plot_from_path'):
+        paths, expected = generators.make_merge_csvs(directory, size, n_frames=2, cols=MERGE_COLS,
+                                                     seed=seed, nan_rate=NAN_RATE, dup_rate=DUP_RATE)
+        return {'paths': paths, 'expected_rows': expected, 'x_col': 'Sample',
+                'y_cols': ['f0_value_0', 'f1_value_0']}
+    if bench == 'plot_correlation':
+        path = os.path.join(directory, f'corr_{size}.csv')
+        generators.make_csv(path, size, MERGE_COLS, seed=seed, nan_rate=NAN_RATE)
+        return {'paths': [path], 'col1': 'value_0', 'col2': 'value_1'}
+    if bench == 'classify_variable_types':
+        path = os.path.join(directory, f'wide_{size}.csv')
+        generators.make_csv(path, size, PROFILE_COLS, seed=seed, nan_rate=NAN_RATE)
+        return {'paths': [path]}
+    if bench == 'watershed_segmentation':
+        path = os.path.join(directory, f'particles_{size}.png')
+        expected = generators.make_particle_image(path, size, color=True, seed=seed)
+        return {'paths': [path], 'expected_regions': expected}
+    raise ValueError(f"Unknown benchmark: {bench}")
+
+
+# ------------------------------------------------------------------------------
+#  Measurement (case subprocess)
+# ------------------------------------------------------------------------------
+
+def _status_mb(field):
+    # VmRSS / VmHWM from /proc/self/status (Linux), in MB
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    raise KeyError(field)
+
+
+def _reset_peak_rss():
+    # Writing 5 to clear_refs resets the peak RSS (VmHWM) to the current RSS
+    # (Linux >= 4.0); returns whether the counter can be used
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    try:
+        return _status_mb('VmHWM')
+    except (OSError, KeyError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _prepare(bench, params):
+    # Loads everything the timed call needs but should not be charged for,
+    # and returns (call, units processed per call, unit name)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    if bench == 'create_plot_from_dfs':
+        from OS_plots import create_plot_from_dfs
+        frames = [pd.read_csv(path, encoding='latin1') for path in params['paths']]
+        rows = sum(len(df) for df in frames)
+        return (lambda: create_plot_from_dfs(frames, params['x_col'], params['y_cols'], widget=False),
+                rows, 'rows')
+    if bench == 'plot_from_path':
+        from OS_plots import plot_from_path
+        size = sum(os.path.getsize(path) for path in params['paths']) / 2**20
+        return (lambda: plot_from_path(params['paths'], params['x_col'], params['y_cols']),
+                size, 'MB')
+    if bench == 'plot_correlation':
+        from OS_plots import plot_correlation
+
+        def call():
+            fig = plot_correlation(params['paths'][0], params['col1'], params['col2'])
+            plt.close(fig)
+            return fig
+        return call, os.path.getsize(params['paths'][0]) / 2**20, 'MB'
+    if bench == 'classify_variable_types':
+        from omris_data_utils import classify_variable_types
+        df = pd.read_csv(params['paths'][0], encoding='latin1')
+        return (lambda: classify_variable_types(df)), len(df) * df.shape[1], 'cells'
+    if bench == 'watershed_segmentation':
+        import cv2
+        import utils
+
+        # watershed_segmentation only displays its result; capture the
+        # segment_image result it produces to check the region count
+        segment_image = utils.segment_image
+        results = []
+
+        def capture(*args, **kwargs):
+            # Only the latest result is kept, so repeats do not add to the peak
+            results[:] = [segment_image(*args, **kwargs)]
+            return results[0]
+
+        def call():
+            utils.segment_image = capture
+            try:
+                utils.watershed_segmentation(params['paths'][0], MIN_DISTANCE)
+            finally:
+                utils.segment_image = segment_image
+                plt.close('all')
+            return results[-1]
+        shape = cv2.imread(params['paths'][0]).shape
+        return call, shape[0] * shape[1] / 1e6, 'Mpx'
+    raise ValueError(f"Unknown benchmark: {bench}")
+
+
+def _details(bench, result, params):
+    # Correctness figures recorded next to the timings
+    if bench in ('create_plot_from_dfs', 'plot_from_path'):
+        return {'bars': len(result.data[0].x) if result is not None else None,
+                'expected_merge_rows': params['expected_rows'],
+                'merge_rows': (result.layout.meta or {}).get('rows_in') if result is not None else None}
+    if bench == 'watershed_segmentation':
+        return {'n_regions': result['n_regions'], 'expected_regions': params['expected_regions']}
+    return {}
+
+
+def run_case(bench, params, repeat):
+    """Runs one case in this process and returns its measurements."""
+    call, units, unit = _prepare(bench, params)
+    import gc
+    gc.collect()
+    rss_before = _status_mb('VmRSS') if os.path.exists('/proc/self/status') else None
+    exact_peak = _reset_peak_rss()
+
+    seconds, result = [], None
+    for _ in range(repeat):
+        result = None
+        start = time.perf_counter()
+        result = call()
+        seconds.append(time.perf_counter() - start)
+    peak = _peak_rss_mb()
+
+    median = statistics.median(seconds)
+    return {
+        'seconds': median,
+        'seconds_all': seconds,
+        'peak_rss_mb': peak,
+        'peak_delta_mb': peak - rss_before if rss_before is not None and exact_peak else None,
+        'throughput': units / median if median else None,
+        'throughput_unit': f'{unit}/s',
+        'details': _details(bench, result, params),
+    }
+
+
+# ------------------------------------------------------------------------------
+#  Results
+# ------------------------------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=ROOT).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance=0.2, memory_tolerance=None):
+    """
+    Compares two result lists case by case.
+
+    Returns:
+    list of (bench, size, metric, old, new, ratio) for every case whose time
+    (or peak memory added) grew by more than the tolerance.
+    """
+    memory_tolerance = tolerance if memory_tolerance is None else memory_tolerance
+    old = {(r['bench'], r['size']): r for r in baseline}
+    regressions = []
+    for r in results:
+        base = old.get((r['bench'], r['size']))
+        if base is None:
+            continue
+        for metric, tol in (('seconds', tolerance), ('peak_delta_mb', memory_tolerance)):
+            before, after = base.get(metric), r.get(metric)
+            # Memory deltas below a few MB are noise
+            if not before or after is None or (metric == 'peak_delta_mb' and after < 5):
+                continue
+            if after > before * (1 + tol):
+                regressions.append((r['bench'], r['size'], metric, before, after, after / before))
+    return regressions
+
+
+def _print_row(r, base=None):
+    ratio = f"{r['seconds'] / base['seconds']:>8.2f}x" if base else ''
+    delta = f"{r['peak_delta_mb']:>12.0f}" if r['peak_delta_mb'] is not None else f"{'-':>12}"
+    print(f"{r['bench']:<26}{r['size']:>10}{r['seconds']:>10.3f}{r['peak_rss_mb']:>11.0f}{delta}"
+          f"{r['throughput']:>14.4g} {r['throughput_unit']:<10}{ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bench', nargs='+', choices=list(SIZES), help='benchmarks to run (default: all)')
+    parser.add_argument('--sizes', nargs='+', type=int, help='override the size sweep of every benchmark')
+    parser.add_argument('--quick', action='store_true', help='only the two smallest sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls per case')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='earlier JSON results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    parser.add_argument('--memory-tolerance', type=float, help='allowed relative memory growth '
+                                                                '(default: --tolerance)')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        case = json.loads(args.run)
+        print(json.dumps(run_case(case['bench'], case['params'], args.repeat)))
+        return 0
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    old = {(r['bench'], r['size']): r for r in baseline or []}
+
+    sweeps = QUICK_SIZES if args.quick else SIZES
+    results = []
+    print(f"{'benchmark':<26}{'size':>10}{'time [s]':>10}{'peak [MB]':>11}{'added [MB]':>12}"
+          f"{'throughput':>14}{'':<11}{'vs base' if baseline else ''}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for bench in args.bench or list(SIZES):
+            for size in args.sizes or sweeps[bench]:
+                params = make_inputs(bench, size, tmp, args.seed)
+                case = json.dumps({'bench': bench, 'params': params})
+                out = subprocess.run([sys.executable, __file__, '--repeat', str(args.repeat), '--run', case],
+                                     capture_output=True, text=True, cwd=ROOT)
+                if out.returncode != 0:
+                    print(f"{bench:<26}{size:>10}  failed:\n{out.stderr.strip()}")
+                    continue
+                record = {'bench': bench, 'size': size, **json.loads(out.stdout.strip().splitlines()[-1])}
+                results.append(record)
+                _print_row(record, old.get((bench, size)))
+                for path in params['paths']:
+                    os.remove(path)
+
+    if args.out:
+        meta = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+        }
+        with open(args.out, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+        print(f"results written to {args.out}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+        for bench, size, metric, before, after, ratio in regressions:
+            print(f"REGRESSION {bench} size={size}: {metric} {before:.3f} -> {after:.3f} ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print("no regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
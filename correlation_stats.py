@@ -0,0 +1,573 @@
+"""
+Vectorized correlation and simple linear regression statistics.
+
+``sns.regplot`` bootstraps the confidence band of the regression line (1000
+resamples) and draws every point, which takes minutes on millions of rows.
+The helpers here compute Pearson r, its p-value and the least-squares line
+from one pass of sums, and give the analytic confidence band of the line.
+correlation_matrix does the same for every pair of a set of columns at once.
+CorrelationAccumulator and accumulate_csv compute the same fit in one streaming
+pass over files too large to load, and keep a sample and a 2-D histogram of the
+pairs for the plot.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from csv_loader import DEFAULT_CHUNKSIZE, DEFAULT_ENCODING, iter_csv_chunks, read_csv_columns
+
+
+def linear_fit_stats(x, y):
+    """
+    Computes Pearson r, its two-sided p-value and the least-squares line of y on x.
+
+    The p-value uses the same exact beta distribution as scipy.stats.pearsonr,
+    so the results match it.
+
+    Parameters:
+    x, y: array-like of equal length without missing values
+
+    Returns:
+    dict with 'n', 'r', 'p', 'slope', 'intercept', 'x_mean', 'sxx' and
+    'resid_std' (standard deviation of the residuals, n - 2 degrees of freedom)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n < 2:
+        raise ValueError("At least two observations are needed for a correlation.")
+
+    x_mean = x.mean()
+    y_mean = y.mean()
+    dx = x - x_mean
+    dy = y - y_mean
+    return _fit_from_moments(n, x_mean, y_mean, np.dot(dx, dx), np.dot(dy, dy), np.dot(dx, dy))
+
+
+def _fit_from_moments(n, x_mean, y_mean, sxx, syy, sxy):
+    # Shared by linear_fit_stats and CorrelationAccumulator.fit: the fit from
+    # the count, means and centred second moments
+    if sxx == 0 or syy == 0:
+        r = np.nan
+    else:
+        r = float(np.clip(sxy / np.sqrt(sxx * syy), -1.0, 1.0))
+    slope = sxy / sxx if sxx else np.nan
+    intercept = y_mean - slope * x_mean
+
+    return {
+        'n': n,
+        'r': r,
+        'p': pearson_p_value(r, n),
+        'slope': slope,
+        'intercept': intercept,
+        'x_mean': x_mean,
+        'sxx': sxx,
+        'resid_std': np.sqrt(max(syy - slope * sxy, 0.0) / (n - 2)) if n > 2 else np.nan,
+    }
+
+
+def pearson_p_value(r, n):
+    """Two-sided p-value of Pearson r over n observations (vectorized over r and n)."""
+    r = np.asarray(r, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Under H0, (r + 1) / 2 follows Beta(n/2 - 1, n/2 - 1)
+        a = n / 2 - 1
+        p = 2 * stats.beta.sf(np.abs(r), a, a, loc=-1, scale=2)
+    p = np.where(n > 2, p, np.nan)
+    return float(p) if p.ndim == 0 else p
+
+
+def regression_band(fit, x_grid, level=0.95):
+    """
+    Analytic confidence band of the fitted regression line.
+
+    Parameters:
+    fit: dict returned by linear_fit_stats
+    x_grid: array-like, X positions at which to evaluate the band
+    level: float, confidence level
+
+    Returns:
+    (y_hat, lower, upper) arrays over ``x_grid``
+    """
+    x_grid = np.asarray(x_grid, dtype=np.float64)
+    y_hat = fit['intercept'] + fit['slope'] * x_grid
+    t = stats.t.ppf((1 + level) / 2, fit['n'] - 2)
+    half = t * fit['resid_std'] * np.sqrt(1 / fit['n'] + (x_grid - fit['x_mean']) ** 2 / fit['sxx'])
+    return y_hat, y_hat - half, y_hat + half
+
+
+CORRECTIONS = ('bonferroni', 'holm', 'fdr_bh')
+
+
+def adjust_p_values(p_values, correction='fdr_bh'):
+    """
+    Corrects a 1-D array of p-values for multiple testing.
+
+    Parameters:
+    p_values: array-like, raw p-values (NaN entries are ignored and kept)
+    correction: str, 'bonferroni', 'holm' or 'fdr_bh' (Benjamini-Hochberg)
+
+    Returns:
+    numpy.ndarray of adjusted p-values, capped at 1
+    """
+    if correction not in CORRECTIONS:
+        raise ValueError(f"correction must be one of {CORRECTIONS}, got {correction!r}")
+
+    p_values = np.asarray(p_values, dtype=np.float64)
+    adjusted = np.full_like(p_values, np.nan)
+    valid = ~np.isnan(p_values)
+    p = p_values[valid]
+    m = len(p)
+    if m == 0:
+        return adjusted
+
+    order = np.argsort(p)
+    ranked = p[order]
+    if correction == 'bonferroni':
+        result = ranked * m
+    elif correction == 'holm':
+        result = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    else:
+        result = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+
+    out = np.empty(m)
+    out[order] = np.minimum(result, 1.0)
+    adjusted[valid] = out
+    return adjusted
+
+
+class CorrelationMatrix:
+    """
+    All pairwise correlations of a set of columns, computed in one go.
+
+    Attributes:
+    r, p, n: pandas.DataFrame, correlation, two-sided p-value and number of
+        pairwise-complete observations for every column pair
+    p_adjusted: pandas.DataFrame or None, p-values corrected for multiple
+        testing over the distinct pairs
+    method: str, 'pearson' or 'spearman'
+    correction: str or None, the multiple-testing correction applied
+    data: pandas.DataFrame, the columns the matrix was computed from, so any
+        pair can be plotted without reading the file again
+    """
+
+    def __init__(self, r, p, n, p_adjusted, method, correction, data):
+        self.r = r
+        self.p = p
+        self.n = n
+        self.p_adjusted = p_adjusted
+        self.method = method
+        self.correction = correction
+        self.data = data
+
+    def pair(self, col1, col2):
+        """Returns (r, p, n) of one column pair."""
+        return self.r.at[col1, col2], self.p.at[col1, col2], int(self.n.at[col1, col2])
+
+    def to_long(self):
+        """Returns one row per distinct column pair, sorted by p-value."""
+        columns = list(self.r.columns)
+        i, j = np.triu_indices(len(columns), k=1)
+        long = pd.DataFrame({
+            'col1': [columns[k] for k in i],
+            'col2': [columns[k] for k in j],
+            'r': self.r.to_numpy()[i, j],
+            'p': self.p.to_numpy()[i, j],
+            'n': self.n.to_numpy()[i, j],
+        })
+        if self.p_adjusted is not None:
+            long['p_adjusted'] = self.p_adjusted.to_numpy()[i, j]
+        return long.sort_values('p', ignore_index=True)
+
+
+def _pairwise_pearson(values):
+    # Pairwise-complete sums for every column pair at once: with the missing
+    # entries zeroed, matrix products over the presence mask give the
+    # per-pair counts, sums and cross-products
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    means = filled.sum(axis=0) / np.maximum(present.sum(axis=0), 1)
+    centred = np.where(present, filled - means, 0.0)
+    mask = present.astype(np.float64)
+
+    n = mask.T @ mask
+    sx = centred.T @ mask
+    sxx = (centred ** 2).T @ mask
+    sxy = centred.T @ centred
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sx.T / n
+        var_x = sxx - sx ** 2 / n
+        r = cov / np.sqrt(var_x * var_x.T)
+    r = np.clip(r, -1.0, 1.0)
+    np.fill_diagonal(r, np.where(np.diag(n) > 1, 1.0, np.nan))
+    return r, n
+
+
+# Values handled at once when re-ranking Spearman pairs (bounds the memory)
+_RERANK_BLOCK = 4_000_000
+
+
+def _masked_pearson(a, b, mask):
+    # Column-wise Pearson r of a and b over the rows where mask is True
+    n = mask.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        da = np.where(mask, a - np.where(mask, a, 0.0).sum(axis=0) / n, 0.0)
+        db = np.where(mask, b - np.where(mask, b, 0.0).sum(axis=0) / n, 0.0)
+        r = (da * db).sum(axis=0) / np.sqrt((da ** 2).sum(axis=0) * (db ** 2).sum(axis=0))
+    return np.where(n > 1, np.clip(r, -1.0, 1.0), np.nan)
+
+
+def _ranks_under_masks(values, order, masks):
+    # Average ranks of every column of values among the rows where the same
+    # column of masks is True, without sorting: walking the column in its sort
+    # order (order), the masked rows counted so far give the ranks. A single
+    # column of values and order is ranked under every column of masks.
+    n, k = masks.shape
+    position = np.arange(n)[:, None]
+    sorted_values = np.take_along_axis(values, order, axis=0)
+    in_order = np.take_along_axis(masks, order, axis=0)
+    counted = np.vstack([np.zeros((1, k), dtype=np.int64), np.cumsum(in_order, axis=0)])
+    new = sorted_values[1:] != sorted_values[:-1]
+    if new.all():
+        # No ties: each row's rank is the masked rows up to and including it
+        before, ties = counted[:-1], in_order
+    else:
+        # First and last sorted position of every value's tie group
+        edge = np.ones((1, values.shape[1]), dtype=bool)
+        starts = np.maximum.accumulate(np.where(np.vstack([edge, new]), position, 0), axis=0)
+        ends = np.minimum.accumulate(np.where(np.vstack([new, edge]), position, n)[::-1], axis=0)[::-1]
+        before = np.take_along_axis(counted, starts, axis=0)
+        ties = np.take_along_axis(counted, ends + 1, axis=0) - before
+    ranks = np.empty((n, k))
+    np.put_along_axis(ranks, order, before + (ties + 1) / 2, axis=0)
+    return ranks
+
+
+def _rerank_pairs(values, r, n):
+    # Ranking each column on its own is exact only for pairs whose complete
+    # rows are all of both columns' rows. The other pairs are ranked again on
+    # the rows they share; every column is sorted once, and both columns' ranks
+    # under a pair's mask follow from their sort orders (_ranks_under_masks).
+    present = ~np.isnan(values)
+    own = np.diag(n)
+    redo = np.triu((n < own[:, None]) | (n < own[None, :]), k=1)
+    if not redo.any():
+        return
+    order = np.argsort(values, axis=0, kind='stable')
+    width = max(1, _RERANK_BLOCK // max(len(values), 1))
+    for i in np.flatnonzero(redo.any(axis=1)):
+        partners = np.flatnonzero(redo[i])
+        for start in range(0, len(partners), width):
+            block = partners[start:start + width]
+            shared = present[:, [i]] & present[:, block]
+            ranks_i = _ranks_under_masks(values[:, [i]], order[:, [i]], shared)
+            ranks_j = _ranks_under_masks(values[:, block], order[:, block], shared)
+            r[i, block] = r[block, i] = _masked_pearson(ranks_i, ranks_j, shared)
+
+
+def correlation_matrix(file_or_df, columns=None, method='pearson', correction='fdr_bh'):
+    """
+    Computes the correlation, p-value and n of every column pair at once.
+
+    Each pair uses the rows where both of its columns are present
+    (pairwise-complete observations), like pandas.DataFrame.corr.
+
+    Parameters:
+    file_or_df: str or pandas.DataFrame, CSV path or an already loaded frame
+    columns: list of str or None, columns to correlate (None takes every
+        numeric column)
+    method: str, 'pearson' or 'spearman'
+    correction: str or None, multiple-testing correction of the p-values
+        ('bonferroni', 'holm', 'fdr_bh' or None)
+
+    Returns:
+    CorrelationMatrix
+    """
+    if method not in ('pearson', 'spearman'):
+        raise ValueError(f"method must be 'pearson' or 'spearman', got {method!r}")
+
+    if isinstance(file_or_df, pd.DataFrame):
+        data = file_or_df if columns is None else file_or_df[list(columns)]
+    else:
+        data = read_csv_columns(file_or_df, columns)
+    data = data.select_dtypes('number') if columns is None else data
+    data = data.astype(np.float64)
+
+    values = data.to_numpy()
+    if method == 'spearman':
+        values = data.rank().to_numpy()
+    r, n = _pairwise_pearson(values)
+
+    if method == 'spearman':
+        _rerank_pairs(data.to_numpy(), r, n)
+
+    p = pearson_p_value(r, n)
+    np.fill_diagonal(p, 0.0)
+
+    labels = list(data.columns)
+
+    def frame(matrix):
+        return pd.DataFrame(matrix, index=labels, columns=labels)
+
+    p_adjusted = None
+    if correction is not None:
+        i, j = np.triu_indices(len(labels), k=1)
+        adjusted = np.zeros_like(p)
+        adjusted[i, j] = adjust_p_values(p[i, j], correction)
+        adjusted[j, i] = adjusted[i, j]
+        p_adjusted = frame(adjusted)
+
+    return CorrelationMatrix(frame(r), frame(p), frame(n.astype(np.int64)), p_adjusted,
+                             method, correction, data)
+
+
+DEFAULT_SAMPLE_SIZE = 100_000
+DEFAULT_HISTOGRAM_BINS = 256
+
+
+class CorrelationAccumulator:
+    """
+    Streaming, mergeable statistics of one column pair, for files larger than memory.
+
+    update() folds in a chunk of (x, y) pairs and merge() folds in another
+    accumulator (e.g. one per file, filled in a worker process), both with the
+    pairwise update of Chan et al. for the count, means and centred second
+    moments. fit() then gives the same r, p-value and regression line as
+    linear_fit_stats over all the rows, without holding them.
+
+    In the same pass the accumulator keeps what a plot needs:
+    - a uniform random sample of at most sample_size pairs (each pair draws a
+      random key and the smallest keys are kept, which merges exactly);
+    - a 2-D histogram of at most bins x bins cells whose bin widths are powers
+      of two, doubled whenever the data outgrows the grid, so the data spans
+      between bins / 2 and bins cells per axis and histograms merge exactly.
+
+    Pairs where either value is missing or infinite are skipped.
+
+    Attributes:
+    n: int, number of pairs seen
+    x_min, x_max, y_min, y_max: float, range of the pairs seen
+    """
+
+    def __init__(self, sample_size=DEFAULT_SAMPLE_SIZE, bins=DEFAULT_HISTOGRAM_BINS, random_state=0):
+        """
+        Parameters:
+        sample_size: int, size of the random sample kept for plotting (0 keeps none)
+        bins: int, maximum number of histogram cells per axis (0 keeps no histogram)
+        random_state: seed of the sample keys; accumulators that are merged
+            later need different seeds (accumulate_csv takes care of it)
+        """
+        self.sample_size = sample_size
+        self.bins = bins
+        self._rng = np.random.default_rng(random_state)
+        self.n = 0
+        self.x_mean = self.y_mean = 0.0
+        self.sxx = self.syy = self.sxy = 0.0
+        self.x_min = self.y_min = np.inf
+        self.x_max = self.y_max = -np.inf
+        self._sample = np.empty((0, 3))  # key, x, y
+        self._counts = None
+        # Per axis: bin width 2 ** exponent, first cell at absolute index lo
+        self._exponent = [0, 0]
+        self._lo = [0, 0]
+
+    def _add_moments(self, n, x_mean, y_mean, sxx, syy, sxy):
+        total = self.n + n
+        dx = x_mean - self.x_mean
+        dy = y_mean - self.y_mean
+        weight = self.n * n / total
+        self.x_mean += dx * n / total
+        self.y_mean += dy * n / total
+        self.sxx += sxx + dx * dx * weight
+        self.syy += syy + dy * dy * weight
+        self.sxy += sxy + dx * dy * weight
+        self.n = total
+
+    def _keep_sample(self, sample):
+        if len(sample) > self.sample_size:
+            sample = sample[np.argpartition(sample[:, 0], self.sample_size - 1)[:self.sample_size]]
+        self._sample = sample
+
+    def _window(self, exponent, x_range, y_range):
+        # Smallest power-of-two widths (at least the given ones) at which both
+        # ranges fit in self.bins cells; returns (exponent, lo) per axis
+        window = []
+        for e, (low, high) in zip(exponent, (x_range, y_range)):
+            while np.floor(high / 2.0 ** e) - np.floor(low / 2.0 ** e) + 1 > self.bins:
+                e += 1
+            window.append((e, int(np.floor(low / 2.0 ** e))))
+        return window
+
+    def _rebinned(self, counts, exponent, lo, window):
+        # counts re-gridded onto window (coarser or shifted only, never finer)
+        (ex, lx), (ey, ly) = window
+        cells_x = ((lo[0] + np.arange(self.bins)) >> (ex - exponent[0])) - lx
+        cells_y = ((lo[1] + np.arange(self.bins)) >> (ey - exponent[1])) - ly
+        out = np.zeros((self.bins, self.bins), dtype=np.int64)
+        rows, cols = np.nonzero(counts)
+        np.add.at(out, (cells_x[rows], cells_y[cols]), counts[rows, cols])
+        return out
+
+    def _initial_exponent(self, low, high):
+        span = high - low
+        if span > 0:
+            return int(np.floor(np.log2(span / self.bins)))
+        return int(np.floor(np.log2(abs(low)))) - 8 if low else 0
+
+    def update(self, x, y):
+        """
+        Adds a chunk of pairs.
+        Parameters:
+        x, y: array-like of equal length (e.g. two columns of a CSV chunk)
+        Returns:
+        self
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        keep = np.isfinite(x) & np.isfinite(y)
+        if not keep.all():
+            x, y = x[keep], y[keep]
+        n = len(x)
+        if n == 0:
+            return self
+
+        x_mean, y_mean = x.mean(), y.mean()
+        dx, dy = x - x_mean, y - y_mean
+        self._add_moments(n, x_mean, y_mean, np.dot(dx, dx), np.dot(dy, dy), np.dot(dx, dy))
+
+        if self.bins:
+            if self._counts is None:
+                exponent = [self._initial_exponent(x.min(), x.max()),
+                            self._initial_exponent(y.min(), y.max())]
+            else:
+                exponent = self._exponent
+            x_range = (min(self.x_min, x.min()), max(self.x_max, x.max()))
+            y_range = (min(self.y_min, y.min()), max(self.y_max, y.max()))
+            window = self._window(exponent, x_range, y_range)
+            if self._counts is None:
+                self._counts = np.zeros((self.bins, self.bins), dtype=np.int64)
+            elif [w[0] for w in window] != self._exponent or [w[1] for w in window] != self._lo:
+                self._counts = self._rebinned(self._counts, self._exponent, self._lo, window)
+            (ex, lx), (ey, ly) = window
+            self._exponent, self._lo = [ex, ey], [lx, ly]
+            cells_x = np.floor(x / 2.0 ** ex).astype(np.int64) - lx
+            cells_y = np.floor(y / 2.0 ** ey).astype(np.int64) - ly
+            self._counts += np.bincount(cells_x * self.bins + cells_y,
+                                        minlength=self.bins ** 2).reshape(self.bins, self.bins)
+
+        self.x_min, self.x_max = min(self.x_min, x.min()), max(self.x_max, x.max())
+        self.y_min, self.y_max = min(self.y_min, y.min()), max(self.y_max, y.max())
+
+        if self.sample_size:
+            chunk = np.column_stack([self._rng.random(n), x, y])
+            self._keep_sample(np.concatenate([self._sample, chunk]))
+        return self
+
+    def merge(self, other):
+        """
+        Folds another accumulator (with the same sample_size and bins) into this one.
+        Returns:
+        self
+        """
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            state = {k: v for k, v in other.__dict__.items() if k != '_rng'}
+            state['_counts'] = None if other._counts is None else other._counts.copy()
+            self.__dict__.update(state)
+            return self
+        self._add_moments(other.n, other.x_mean, other.y_mean, other.sxx, other.syy, other.sxy)
+
+        if self.bins:
+            x_range = (min(self.x_min, other.x_min), max(self.x_max, other.x_max))
+            y_range = (min(self.y_min, other.y_min), max(self.y_max, other.y_max))
+            exponent = [max(a, b) for a, b in zip(self._exponent, other._exponent)]
+            window = self._window(exponent, x_range, y_range)
+            self._counts = (self._rebinned(self._counts, self._exponent, self._lo, window) +
+                            self._rebinned(other._counts, other._exponent, other._lo, window))
+            self._exponent, self._lo = [w[0] for w in window], [w[1] for w in window]
+
+        self.x_min, self.x_max = min(self.x_min, other.x_min), max(self.x_max, other.x_max)
+        self.y_min, self.y_max = min(self.y_min, other.y_min), max(self.y_max, other.y_max)
+
+        if self.sample_size:
+            self._keep_sample(np.concatenate([self._sample, other._sample]))
+        return self
+
+    def fit(self):
+        """Returns the same dict as linear_fit_stats, computed over every pair seen."""
+        if self.n < 2:
+            raise ValueError("At least two observations are needed for a correlation.")
+        return _fit_from_moments(self.n, self.x_mean, self.y_mean, self.sxx, self.syy, self.sxy)
+
+    def sample(self):
+        """Returns the random sample as a two-column array (x, y), in random order."""
+        return self._sample[np.argsort(self._sample[:, 0]), 1:]
+
+    def histogram(self):
+        """
+        Returns the 2-D histogram cropped to the occupied cells.
+        Returns:
+        (counts, x_edges, y_edges), with counts[i, j] the pairs whose x falls in
+        [x_edges[i], x_edges[i + 1]) and y in [y_edges[j], y_edges[j + 1])
+        """
+        if self._counts is None:
+            raise ValueError("The accumulator holds no histogram.")
+        rows = np.flatnonzero(self._counts.any(axis=1))
+        cols = np.flatnonzero(self._counts.any(axis=0))
+        counts = self._counts[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        x_edges = (self._lo[0] + np.arange(rows[0], rows[-1] + 2)) * 2.0 ** self._exponent[0]
+        y_edges = (self._lo[1] + np.arange(cols[0], cols[-1] + 2)) * 2.0 ** self._exponent[1]
+        return counts, x_edges, y_edges
+
+
+def _accumulate_file(source, col1, col2, chunksize, encoding, sample_size, bins, random_state):
+    # Worker run in the process pool: streams one file into a new accumulator
+    acc = CorrelationAccumulator(sample_size, bins, random_state)
+    for chunk in iter_csv_chunks(source, [col1, col2], chunksize, encoding):
+        acc.update(chunk[col1], chunk[col2])
+    return acc
+
+
+def accumulate_csv(sources, col1, col2, chunksize=DEFAULT_CHUNKSIZE, workers=1,
+                   sample_size=DEFAULT_SAMPLE_SIZE, bins=DEFAULT_HISTOGRAM_BINS,
+                   encoding=DEFAULT_ENCODING, random_state=0):
+    """
+    Streams one or more CSV files into a CorrelationAccumulator of two columns.
+
+    Memory stays bounded by the chunk size, the sample and the histogram,
+    whatever the file size. With several files and workers > 1 every file is
+    accumulated in its own process and the results are merged.
+
+    Parameters:
+    sources: str, file-like or list of them, the CSV file(s) holding both columns
+    col1, col2: str, the X and Y columns
+    chunksize: int, rows per chunk
+    workers: int or None, processes used for a list of files (None uses every CPU)
+    sample_size, bins: see CorrelationAccumulator
+    encoding: str, file encoding
+    random_state: int, seed of the sample
+
+    Returns:
+    CorrelationAccumulator
+    """
+    if not isinstance(sources, (list, tuple)):
+        sources = [sources]
+    # One independent key stream per file, so the merged sample stays uniform
+    seeds = np.random.SeedSequence(random_state).spawn(len(sources))
+    args = [(source, col1, col2, chunksize, encoding, sample_size, bins, seed)
+            for source, seed in zip(sources, seeds)]
+
+    acc = CorrelationAccumulator(sample_size, bins, random_state)
+    if workers == 1 or len(sources) == 1:
+        for a in args:
+            acc.merge(_accumulate_file(*a))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(_accumulate_file, *zip(*args)):
+                acc.merge(part)
+    return acc
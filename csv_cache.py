@@ -0,0 +1,340 @@
+"""
+On-disk columnar cache for CSV files that are plotted over and over.
+
+The first read of a CSV parses it once and stores it as an uncompressed Arrow
+IPC file named after the content hash of the CSV. Later reads memory-map that
+file and only materialise the columns they ask for, so nothing is re-parsed
+from latin1 text. Entries are evicted least-recently-used first once the cache
+grows beyond ``max_bytes``, and a path is re-hashed whenever its mtime or size
+changes, so an edited file never serves stale data.
+
+Usage:
+    import csv_cache
+    csv_cache.enable_cache()          # every OS_plots read now goes through it
+"""
+import codecs
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import csv_loader
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'os_plots')
+DEFAULT_MAX_BYTES = 2 * 2**30
+_HASH_BLOCK = 8 * 2**20
+
+
+def _hash_file(path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _entry_key(content_hash, encoding, category_ratio):
+    # The same bytes parse to different data under another encoding or
+    # category ratio, so both are part of the entry key
+    options = json.dumps([codecs.lookup(encoding).name, category_ratio])
+    return f"{content_hash}_{hashlib.blake2b(options.encode(), digest_size=4).hexdigest()}"
+
+
+@contextmanager
+def _locked(path):
+    # Exclusive lock on a lock file; the OS releases it if the process dies
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 s; keep waiting
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _unified_type(types, dictionary, n_rows, category_ratio):
+    # Common Arrow type of one column over all chunks
+    if dictionary is not None and all(pa.types.is_dictionary(t) for t in types):
+        # Text is kept dictionary-encoded unless it is mostly unique, as in
+        # csv_loader.read_csv_columns
+        if len(dictionary) < n_rows * category_ratio:
+            return pa.dictionary(pa.int32(), dictionary.type)
+        return dictionary.type
+    types = [t.value_type if pa.types.is_dictionary(t) else t for t in types]
+    try:
+        schemas = [pa.schema([pa.field('column', t)]) for t in types]
+        return pa.unify_schemas(schemas, promote_options='permissive').field(0).type
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # e.g. numbers in one chunk and text in the next
+        return pa.large_string()
+
+
+def _conform(column, target, dictionary):
+    # Casts one chunk's column to the unified type. Dictionary columns all point
+    # at the shared dictionary: an IPC file cannot replace it between batches
+    if pa.types.is_dictionary(target):
+        if column.null_count == len(column):
+            return pa.DictionaryArray.from_arrays(pa.nulls(len(column), pa.int32()), dictionary)
+        positions = pc.index_in(column.dictionary, value_set=dictionary)
+        return pa.DictionaryArray.from_arrays(pc.take(positions, column.indices), dictionary)
+    if column.null_count == len(column):
+        return pa.nulls(len(column), target)
+    if pa.types.is_dictionary(column.type):
+        column = column.dictionary_decode()
+    return column.cast(target)
+
+
+class ColumnarCache:
+    """
+    Content-hash keyed Arrow cache of parsed CSV files with LRU eviction.
+
+    Parameters:
+    cache_dir: str, directory holding the Arrow files and the index
+    max_bytes: int, total size the cache files may occupy before eviction
+    encoding: str, encoding used to parse the CSV files on a miss when read()
+        is not given one
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 encoding=csv_loader.DEFAULT_ENCODING):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.encoding = encoding
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock_path = os.path.join(cache_dir, 'index.lock')
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # index bookkeeping
+    # ------------------------------------------------------------------
+    def _load_index(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'paths': {}, 'entries': {}}
+
+    def _save_index(self, index):
+        # Write-then-rename so concurrent readers never see a partial index
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.json')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp, self.index_path)
+
+    @contextmanager
+    def _index(self):
+        # Load, modify and save the index under the lock, so processes missing
+        # at the same time never overwrite each other's entries
+        with _locked(self.lock_path):
+            index = self._load_index()
+            yield index
+            self._save_index(index)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.arrow')
+
+    def _hash_for_path(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._index() as index:
+            known = index['paths'].get(path)
+            if known and known['mtime'] == stat.st_mtime_ns and known['size'] == stat.st_size:
+                return known['hash']
+
+        # Hash outside the lock: it reads the whole file
+        content_hash = _hash_file(path)
+        with self._index() as index:
+            known = index['paths'].get(path)
+            if known and known['hash'] != content_hash:
+                # The file changed: drop its old entries unless another path shares them
+                if not any(p['hash'] == known['hash'] for other, p in index['paths'].items() if other != path):
+                    for key in [k for k in index['entries'] if k.startswith(known['hash'] + '_')]:
+                        self._remove(key, index)
+            index['paths'][path] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': content_hash}
+        return content_hash
+
+    def _remove(self, key, index):
+        index['entries'].pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, index, keep):
+        total = sum(entry['bytes'] for entry in index['entries'].values())
+        by_age = sorted(index['entries'].items(), key=lambda item: item[1]['last_access'])
+        for key, entry in by_age:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= entry['bytes']
+            self._remove(key, index)
+            content_hash = key.split('_')[0]
+            if not any(k.startswith(content_hash + '_') for k in index['entries']):
+                for path in [p for p, info in index['paths'].items() if info['hash'] == content_hash]:
+                    del index['paths'][path]
+
+    def _write_entry(self, source, entry_path, encoding, chunksize, category_ratio, on_chunk):
+        # Streams the CSV into an Arrow IPC file one chunk at a time. Chunks can
+        # disagree on dtypes (int8 in one, int16 or float in the next) and each
+        # has its own text dictionary, while an IPC file holds one schema and
+        # one dictionary per column; so every chunk is first spilled to its own
+        # file, then all of them are cast to the unified schema and written out.
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as spill:
+            spilled, types, dictionaries, n_rows = [], {}, {}, 0
+            for chunk in csv_loader.iter_csv_chunks(source, None, chunksize, encoding):
+                if on_chunk is not None:
+                    on_chunk(chunk)
+                for column in chunk.columns:
+                    if csv_loader._is_text(chunk[column].dtype):
+                        chunk[column] = chunk[column].astype('category')
+                batch = pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+                for name, column in zip(batch.schema.names, batch.columns):
+                    if column.null_count == len(column):
+                        # An all-missing chunk fits any type
+                        continue
+                    types.setdefault(name, []).append(column.type)
+                    if pa.types.is_dictionary(column.type):
+                        known = dictionaries.get(name)
+                        values = column.dictionary if known is None else pa.concat_arrays([known, column.dictionary])
+                        dictionaries[name] = pc.unique(values)
+                path = os.path.join(spill, f'{len(spilled)}.arrow')
+                with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, batch.schema) as writer:
+                    writer.write_batch(batch)
+                spilled.append(path)
+                n_rows += batch.num_rows
+
+            if not spilled:
+                header = csv_loader.read_header(source, encoding)
+                schema = pa.schema([pa.field(name, pa.large_string()) for name in header])
+            else:
+                names = pa.ipc.open_file(spilled[0]).schema.names
+                schema = pa.schema([
+                    pa.field(name, _unified_type(types[name], dictionaries.get(name), n_rows, category_ratio)
+                             if name in types else pa.float64())
+                    for name in names])
+
+            with pa.OSFile(entry_path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+                for path in spilled:
+                    with pa.memory_map(path) as mapped:
+                        batch = pa.ipc.open_file(mapped).get_batch(0)
+                        arrays = [_conform(column, field.type, dictionaries.get(field.name))
+                                  for column, field in zip(batch.columns, schema)]
+                        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+
+    # ------------------------------------------------------------------
+    # public API
+    # ------------------------------------------------------------------
+    def read(self, source, columns=None, on_chunk=None, encoding=None, category_ratio=0.5,
+             chunksize=None):
+        """
+        Returns the requested columns of a CSV file, parsing it only on a miss.
+
+        Parameters:
+        source: str or file-like, path to the CSV file or an uploaded buffer
+        columns: list of str or None, columns to return (None returns all)
+        on_chunk: callable or None, called with every chunk parsed on a miss (a
+            hit parses nothing)
+        encoding: str or None, file encoding (None uses the cache's)
+        category_ratio: float, unique-value ratio below which text columns stay
+            categoricals (see csv_loader.read_csv_columns)
+        chunksize: int or None, rows per chunk parsed on a miss (None uses
+            csv_loader.DEFAULT_CHUNKSIZE); a miss never holds more than one chunk
+
+        Encoding and category_ratio are part of the entry key, so different
+        settings never share an entry.
+
+        Returns:
+        pandas.DataFrame with the columns in the requested order.
+
+        Raises:
+        KeyError if any of the requested columns is not in the file.
+        """
+        encoding = encoding or self.encoding
+        if isinstance(source, (str, os.PathLike)):
+            content_hash = self._hash_for_path(source)
+        else:
+            csv_loader._rewind(source)
+            content_hash = hashlib.blake2b(source.read(), digest_size=20).hexdigest()
+        key = _entry_key(content_hash, encoding, category_ratio)
+        entry_path = self._entry_path(key)
+
+        with self._index() as index:
+            hit = key in index['entries'] and os.path.exists(entry_path)
+            if hit:
+                index['entries'][key]['last_access'] = time.time()
+                self._evict(index, keep=key)
+                # Mapped under the lock, so no concurrent eviction removes it first
+                mapped = pa.memory_map(entry_path)
+
+        if not hit:
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.arrow')
+            os.close(fd)
+            try:
+                self._write_entry(source, tmp, encoding, chunksize or csv_loader.DEFAULT_CHUNKSIZE,
+                                  category_ratio, on_chunk)
+                os.replace(tmp, entry_path)
+            except BaseException:
+                os.remove(tmp)
+                raise
+            with self._index() as index:
+                index['entries'][key] = {'bytes': os.path.getsize(entry_path), 'last_access': time.time()}
+                self._evict(index, keep=key)
+                mapped = pa.memory_map(entry_path)
+
+        with mapped:
+            table = pa.ipc.open_file(mapped).read_all()
+            if columns is not None:
+                columns = csv_loader._unique(columns)
+                missing = [c for c in columns if c not in table.column_names]
+                if missing:
+                    raise KeyError(f"Columns not found in file: {missing}")
+                table = table.select(columns)
+            return table.to_pandas()
+
+    def clear(self):
+        """Removes every cached file and the index."""
+        with self._index() as index:
+            for key in list(index['entries']):
+                self._remove(key, index)
+            index['paths'] = {}
+
+
+def enable_cache(cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Routes every csv_loader.read_csv_columns call (and so every OS_plots read)
+    through a ColumnarCache, and returns that cache.
+    """
+    cache = ColumnarCache(cache_dir, max_bytes)
+    csv_loader.set_cache(cache)
+    return cache
+
+
+def disable_cache():
+    """Goes back to parsing the CSV text on every read."""
+    csv_loader.set_cache(None)
@@ -0,0 +1,235 @@
+"""
+Shared CSV loading layer for the plotting functions in OS_plots.
+
+The instrument exports we plot are wide and can run to several GB, while
+each plot only needs a handful of columns. The helpers here read only the
+requested columns (``usecols``), shrink them to compact dtypes and can stream
+the file in chunks so that peak memory stays bounded by the chunk size
+instead of the file size.
+"""
+import pandas as pd
+import numpy as np
+from pandas.api.types import union_categoricals
+
+DEFAULT_ENCODING = 'latin1'
+DEFAULT_CHUNKSIZE = 200_000
+
+# Optional csv_cache.ColumnarCache consulted by read_csv_columns (see set_cache)
+_cache = None
+
+
+def set_cache(cache):
+    """
+    Sets the cache that read_csv_columns consults by default.
+
+    Parameters:
+    cache: csv_cache.ColumnarCache or None to disable caching
+    """
+    global _cache
+    _cache = cache
+
+
+def _rewind(source):
+    # Uploaded files arrive as file-like buffers; rewind them between reads
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def _is_text(dtype):
+    # pandas >= 3 reads text as the 'str' dtype rather than object
+    return dtype == object or isinstance(dtype, pd.StringDtype)
+
+
+def _unique(columns):
+    return list(dict.fromkeys(columns))
+
+
+def read_header(source, encoding=DEFAULT_ENCODING):
+    """
+    Returns the column names of a CSV file without reading any data rows.
+
+    Parameters:
+    source: str or file-like, path to the CSV file or an open buffer
+    encoding: str, file encoding
+    """
+    _rewind(source)
+    columns = list(pd.read_csv(source, encoding=encoding, nrows=0).columns)
+    _rewind(source)
+    return columns
+
+
+def project_columns(headers, x_col, y_cols):
+    """
+    Chooses the columns to read from each of several files that are merged on x_col.
+
+    Every file gets x_col plus the Y columns it has; a Y column present in
+    several files is read from the first one only, so the merge does not
+    duplicate it.
+
+    Parameters:
+    headers: list of lists of str, the column names of every file (see read_header)
+    x_col: str, the merge key / X column
+    y_cols: list of str, the Y columns
+
+    Returns:
+    list of column lists, one per file.
+    """
+    wanted_cols = [x_col] + [col for col in y_cols if col != x_col]
+    projected = []
+    taken = set()
+    for header in headers:
+        cols = [col for col in wanted_cols if col in header and (col == x_col or col not in taken)]
+        taken.update(cols)
+        projected.append(cols)
+    return projected
+
+
+def compact_dtypes(df, category_ratio=0.5):
+    """
+    Converts the columns of a DataFrame to the smallest dtype that holds the
+    same values, in place, and returns it.
+
+    Integers are downcast to the narrowest integer type, floats are downcast
+    to float32 only when the round trip is lossless (so statistics computed
+    on the data do not change), and object columns with fewer unique values
+    than ``category_ratio * len(df)`` become categoricals.
+    """
+    for column in df.columns:
+        series = df[column]
+        kind = series.dtype.kind
+        if kind in 'iu':
+            df[column] = pd.to_numeric(series, downcast='integer' if kind == 'i' else 'unsigned')
+        elif kind == 'f' and series.dtype.itemsize > 4:
+            values = series.to_numpy()
+            narrow = values.astype(np.float32)
+            if np.array_equal(narrow.astype(values.dtype), values, equal_nan=True):
+                df[column] = narrow
+        elif _is_text(series.dtype) and len(series):
+            if series.nunique(dropna=True) < len(series) * category_ratio:
+                df[column] = series.astype('category')
+    return df
+
+
+def iter_csv_chunks(source, columns=None, chunksize=DEFAULT_CHUNKSIZE,
+                    encoding=DEFAULT_ENCODING, compact=True, schema=None):
+    """
+    Streams a CSV file as DataFrame chunks holding only ``columns``.
+
+    Parameters:
+    source: str or file-like, path to the CSV file or an open buffer
+    columns: list of str or None, columns to keep (None keeps all of them)
+    chunksize: int, number of rows per chunk
+    encoding: str, file encoding
+    compact: bool, whether to shrink each chunk with compact_dtypes
+    schema: omris_data_utils.DtypeSchema or None, dtypes to apply to each chunk
+        (categorical columns are parsed straight into categories)
+
+    Yields:
+    pandas.DataFrame chunks with the columns in the requested order.
+    """
+    if columns is not None:
+        columns = _unique(columns)
+        missing = [c for c in columns if c not in read_header(source, encoding)]
+        if missing:
+            raise KeyError(f"Columns not found in file: {missing}")
+
+    _rewind(source)
+    dtype = schema.read_dtypes(columns) if schema is not None else None
+    reader = pd.read_csv(source, encoding=encoding, usecols=columns, chunksize=chunksize, dtype=dtype)
+    with reader:
+        for chunk in reader:
+            if columns is not None:
+                chunk = chunk[columns]
+            if schema is not None:
+                schema.apply(chunk)
+            # Categoricals are rebuilt once all chunks are in (see _concat_chunks)
+            yield compact_dtypes(chunk, category_ratio=0) if compact else chunk
+
+
+def _concat_chunks(chunks, category_ratio):
+    if not chunks:
+        return pd.DataFrame()
+
+    text_columns = [column for column in chunks[0].columns
+                    if all(isinstance(chunk[column].dtype, pd.CategoricalDtype) for chunk in chunks)]
+    for column in text_columns:
+        # Text chunks were dictionary-encoded as they arrived, so the full text
+        # column is never materialised; give every chunk the same dictionary so
+        # the concatenation below keeps the categorical dtype
+        categories = union_categoricals([chunk[column] for chunk in chunks]).categories
+        for chunk in chunks:
+            chunk[column] = chunk[column].cat.set_categories(categories)
+
+    df = pd.concat(chunks, ignore_index=True)
+    chunks.clear()
+    for column in text_columns:
+        if len(df[column].cat.categories) >= len(df) * category_ratio:
+            df[column] = df[column].astype(df[column].cat.categories.dtype)
+    return df
+
+
+def read_csv_columns(source, columns=None, chunksize=None, encoding=DEFAULT_ENCODING,
+                     compact=True, category_ratio=0.5, cache=None, schema=None, on_chunk=None):
+    """
+    Reads only the requested columns of a CSV file into a compact DataFrame.
+
+    Parameters:
+    source: str or file-like, path to the CSV file or an open buffer
+    columns: list of str or None, columns to read (None reads all of them)
+    chunksize: int or None, when given the file is parsed in chunks of this
+        many rows so the text parser never holds the whole file at once
+    encoding: str, file encoding
+    compact: bool, whether to shrink the columns with compact_dtypes
+    category_ratio: float, unique-value ratio below which object columns
+        become categoricals
+    cache: csv_cache.ColumnarCache, None to use the cache set with set_cache,
+        or False to always parse the CSV text
+    schema: omris_data_utils.DtypeSchema or None, dtypes to apply as the file is
+        read (from optimize_dtypes on an earlier file with the same columns)
+    on_chunk: callable or None, called with every parsed chunk (the file is then
+        read in chunks of ``chunksize``, or DEFAULT_CHUNKSIZE, rows); an exception
+        raised by it aborts the read, e.g. to cancel it. A cache hit parses
+        nothing, so the callback is not called.
+
+    Returns:
+    pandas.DataFrame with the columns in the requested order.
+
+    Raises:
+    KeyError if any of the requested columns is not in the file.
+    """
+    if cache is None:
+        cache = _cache
+    if cache and compact:
+        df = cache.read(source, columns, on_chunk=on_chunk, encoding=encoding,
+                        category_ratio=category_ratio, chunksize=chunksize)
+        return schema.apply(df) if schema is not None else df
+
+    if chunksize is None and on_chunk is not None:
+        chunksize = DEFAULT_CHUNKSIZE
+    if chunksize is None:
+        if columns is not None:
+            columns = _unique(columns)
+            missing = [c for c in columns if c not in read_header(source, encoding)]
+            if missing:
+                raise KeyError(f"Columns not found in file: {missing}")
+        _rewind(source)
+        dtype = schema.read_dtypes(columns) if schema is not None else None
+        df = pd.read_csv(source, encoding=encoding, usecols=columns, dtype=dtype)
+        if columns is not None:
+            df = df[columns]
+        if schema is not None:
+            schema.apply(df)
+        return compact_dtypes(df, category_ratio) if compact else df
+
+    chunks = []
+    for chunk in iter_csv_chunks(source, columns, chunksize, encoding, compact, schema):
+        if on_chunk is not None:
+            on_chunk(chunk)
+        if compact:
+            for column in chunk.columns:
+                if _is_text(chunk[column].dtype):
+                    chunk[column] = chunk[column].astype('category')
+        chunks.append(chunk)
+    if not compact:
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    return _concat_chunks(chunks, category_ratio)
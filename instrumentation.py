@@ -0,0 +1,268 @@
+"""
+Opt-in stage timing for the plotting and segmentation paths.
+
+Code marks its stages with named spans:
+
+    with span('merge', files=len(dfs)) as sp:
+        df = merge_frames(dfs, x_col)
+        sp.set(rows=len(df))
+
+Nothing is measured until a sink is registered. With no sinks span() returns a
+shared no-op object, so instrumented code costs one function call and one
+truthiness check per stage. With sinks every span records its wall time, CPU
+time (of the calling process), nesting path and attributes; with
+trace_memory=True it also records the bytes allocated (net) and the peak
+allocation above the span's starting point, from tracemalloc (which slows the
+traced code down noticeably, so it is off by default).
+
+    collector = CollectorSink()
+    with instrument(collector):
+        plot_from_path('data.csv', 'Sample', ['value'])
+    print(collector.summary())
+
+Spans run in worker processes (batch_watershed_segmentation, tiled_watershed)
+only reach sinks registered in those processes; JsonLinesSink can be shared by
+workers that each enable it.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_sinks = []
+_trace_memory = False
+# Open spans of the current thread / task, innermost last
+_stack = contextvars.ContextVar('instrumentation_stack', default=())
+
+
+class _NoopSpan:
+    # Shared stand-in returned by span() while instrumentation is disabled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """One timed stage; created by span(), emitted to every sink when it closes."""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.record = None
+
+    def set(self, **attrs):
+        """Attaches attributes known only once the stage ran (row counts, sizes...)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _stack.get()
+        self.path = '/'.join([s.name for s in parent] + [self.name])
+        self._token = _stack.set(parent + (self,))
+        self._memory = _trace_memory and tracemalloc.is_tracing()
+        if self._memory:
+            # The global peak is reset for this span; the peak seen so far is
+            # handed back to the enclosing span on exit (see _peak_floor)
+            self._mem_start, peak_so_far = tracemalloc.get_traced_memory()
+            if parent and parent[-1]._memory:
+                parent[-1]._peak_floor = max(parent[-1]._peak_floor, peak_so_far)
+            self._peak_floor = 0
+            tracemalloc.reset_peak()
+        self._started_at = time.time()
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        _stack.reset(self._token)
+        # Attributes never shadow the measured fields
+        record = {
+            **self.attrs,
+            'name': self.name,
+            'path': self.path,
+            'started_at': self._started_at,
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'error': exc_type.__name__ if exc_type is not None else None,
+        }
+        if self._memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self._peak_floor)
+            record['alloc_bytes'] = current - self._mem_start
+            record['peak_alloc_bytes'] = peak - self._mem_start
+            parent = _stack.get()
+            if parent and parent[-1]._memory:
+                parent[-1]._peak_floor = max(parent[-1]._peak_floor, peak)
+        self.record = record
+        for sink in list(_sinks):
+            sink.emit(record)
+        return False
+
+
+def span(name, **attrs):
+    """
+    Returns a context manager timing one named stage.
+
+    Parameters:
+    name: str, stage name; nested spans are reported with their full 'a/b/c' path
+    attrs: extra values stored in the record (must be JSON-serializable for JsonLinesSink)
+    """
+    if not _sinks:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def traced(name=None):
+    """
+    Decorator running every call of a function inside a span (named after the
+    function by default); a disabled run calls the function directly.
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return func(*args, **kwargs)
+            with Span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enabled():
+    """Returns whether any sink is registered, i.e. whether spans are measured."""
+    return bool(_sinks)
+
+
+def add_sink(sink, trace_memory=None):
+    """
+    Registers a sink (any object with an emit(record) method).
+
+    trace_memory: bool or None, start tracemalloc and record allocation deltas
+        (None keeps the current setting)
+    """
+    global _trace_memory
+    if sink not in _sinks:
+        _sinks.append(sink)
+    if trace_memory is not None:
+        _trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def remove_sink(sink):
+    """Unregisters a sink; instrumentation is disabled again once no sink is left."""
+    global _trace_memory
+    if sink in _sinks:
+        _sinks.remove(sink)
+        if hasattr(sink, 'close'):
+            sink.close()
+    if not _sinks:
+        _trace_memory = False
+
+
+@contextmanager
+def instrument(*sinks, trace_memory=False):
+    """
+    Enables the given sinks for the duration of a with-block.
+
+    Yields the first sink, so ``with instrument(CollectorSink()) as c:`` works.
+    Memory tracing started here is stopped again on exit.
+    """
+    started = trace_memory and not tracemalloc.is_tracing()
+    for sink in sinks:
+        add_sink(sink, trace_memory=trace_memory)
+    try:
+        yield sinks[0] if sinks else None
+    finally:
+        for sink in sinks:
+            remove_sink(sink)
+        if started:
+            tracemalloc.stop()
+
+
+# ------------------------------------------------------------------------------
+#  Sinks
+# ------------------------------------------------------------------------------
+
+class LoggingSink:
+    """Logs one line per span (indented by nesting depth)."""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('instrumentation')
+        self.level = level
+
+    def emit(self, record):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        memory = (f", alloc {record['alloc_bytes'] / 2**20:+.1f} MB, "
+                  f"peak {record['peak_alloc_bytes'] / 2**20:.1f} MB") if 'alloc_bytes' in record else ''
+        indent = '  ' * record['path'].count('/')
+        self.logger.log(self.level, "%s%s: %.3f s wall, %.3f s cpu%s", indent, record['name'],
+                        record['wall_s'], record['cpu_s'], memory)
+
+
+class CollectorSink:
+    """Keeps every record in memory, for notebooks and benchmarks."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+    def to_frame(self):
+        """Returns the records as a DataFrame, one row per span in completion order."""
+        import pandas as pd
+
+        return pd.DataFrame(self.records)
+
+    def summary(self):
+        """Returns count and total/mean/max wall time (and CPU time) per span path, slowest first."""
+        df = self.to_frame()
+        if df.empty:
+            return df
+        agg = {'count': ('wall_s', 'size'), 'wall_total_s': ('wall_s', 'sum'),
+               'wall_mean_s': ('wall_s', 'mean'), 'wall_max_s': ('wall_s', 'max'),
+               'cpu_total_s': ('cpu_s', 'sum')}
+        if 'peak_alloc_bytes' in df:
+            agg['peak_alloc_mb'] = ('peak_alloc_bytes', lambda s: s.max() / 2**20)
+        return df.groupby('path').agg(**agg).sort_values('wall_total_s', ascending=False)
+
+
+class JsonLinesSink:
+    """Appends one JSON object per span to a file; safe to share between threads and processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps({**record, 'pid': os.getpid()}, default=str) + '\n'
+        with self._lock:
+            # One write of a short line per record in append mode keeps lines
+            # from different processes intact
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
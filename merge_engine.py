@@ -0,0 +1,149 @@
+"""
+Merge stage for joining several data files on a shared X column.
+
+``pd.merge`` on the full frames keeps every column of every file and, with
+duplicate keys, silently multiplies rows into a cartesian product. The merge
+here first projects each frame to the X column plus the Y columns it
+contributes, estimates the output size from the per-key counts before joining
+anything, and takes a searchsorted fast path when the keys are already sorted
+and unique. Any number of frames can be joined.
+"""
+import numpy as np
+import pandas as pd
+
+
+class MergeFanoutError(ValueError):
+    """Raised when duplicate keys would blow the merge up beyond the allowed size."""
+
+
+def project_frames(dfs, x_col, y_cols=None):
+    """
+    Keeps only ``x_col`` and the requested Y columns of each frame.
+
+    A Y column present in several frames is taken from the first one only, so
+    the merged frame holds it once instead of as ``col_x``/``col_y`` copies.
+    With ``y_cols=None`` every column is kept, deduplicated the same way.
+    """
+    taken = {x_col}
+    projected = []
+    for df in dfs:
+        wanted = df.columns if y_cols is None else [col for col in y_cols if col in df.columns]
+        own = [col for col in dict.fromkeys(wanted) if col not in taken]
+        taken.update(own)
+        projected.append(df[[x_col] + own])
+    return projected
+
+
+def merge_report(dfs, x_col):
+    """
+    Predicts the size of an inner join on ``x_col`` without performing it.
+
+    Missing keys count as one more key value, since pd.merge matches them to
+    each other.
+
+    Returns:
+    dict with
+        'rows_in': list of row counts of the input frames
+        'rows_out': number of rows the inner join will produce
+        'matched_keys': number of distinct keys present in every frame
+        'duplicated_keys': number of matched keys repeated in at least one frame
+        'max_multiplicity': largest number of output rows produced by one key
+        'fanout': rows_out divided by the largest input frame
+    """
+    counts = pd.concat([df[x_col].value_counts(dropna=False) for df in dfs],
+                       axis=1, join='inner')
+    per_key = counts.prod(axis=1) if len(counts) else pd.Series(dtype='int64')
+    rows_in = [len(df) for df in dfs]
+    rows_out = int(per_key.sum())
+    return {
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'matched_keys': len(counts),
+        'duplicated_keys': int((counts > 1).any(axis=1).sum()),
+        'max_multiplicity': int(per_key.max()) if len(per_key) else 0,
+        'fanout': rows_out / max(max(rows_in), 1),
+    }
+
+
+def _sorted_unique(df, x_col):
+    keys = df[x_col]
+    # Categorical order need not match value order, so only plain numeric and
+    # datetime keys qualify
+    return keys.dtype.kind in 'iufM' and keys.is_monotonic_increasing and keys.is_unique
+
+
+def _merge_sorted(left, right, x_col):
+    # Both key columns are sorted and unique: one searchsorted pass finds the
+    # matching row of every left key in the right frame
+    left_keys = left[x_col].to_numpy()
+    right_keys = right[x_col].to_numpy()
+    positions = np.searchsorted(right_keys, left_keys)
+    positions[positions == len(right_keys)] = 0
+    matched = right_keys[positions] == left_keys if len(right_keys) else np.zeros(len(left_keys), bool)
+    merged = left.iloc[np.flatnonzero(matched)].reset_index(drop=True)
+    others = right.drop(columns=x_col).iloc[positions[matched]].reset_index(drop=True)
+    return pd.concat([merged, others], axis=1)
+
+
+def merge_frames(dfs, x_col, y_cols=None, max_fanout=None, tolerance=None):
+    """
+    Inner-joins any number of frames on ``x_col``.
+
+    Parameters:
+    dfs: list of pandas.DataFrame, the frames to join (one frame is returned projected)
+    x_col: str, name of the shared key column
+    y_cols: list of str or None, columns to keep besides ``x_col`` (None keeps all)
+    max_fanout: float or None, raise MergeFanoutError when the join would
+        produce more than this many times the rows of the largest input
+    tolerance: number or None, when given the frames are matched to the
+        nearest key within this distance (pd.merge_asof) instead of exactly
+
+    Returns:
+    pandas.DataFrame; the merge_report of the join is stored in
+    ``df.attrs['merge_report']``.
+
+    Raises:
+    KeyError if ``x_col`` is missing from any frame,
+    MergeFanoutError if the predicted output exceeds ``max_fanout``.
+    """
+    missing = [i for i, df in enumerate(dfs) if x_col not in df.columns]
+    if missing:
+        raise KeyError(f"X-axis column '{x_col}' not found in frame(s) {missing}")
+
+    frames = project_frames(dfs, x_col, y_cols)
+    if len(frames) == 1:
+        return frames[0]
+
+    report = None
+    if tolerance is None:
+        report = merge_report(frames, x_col)
+        if max_fanout is not None and report['fanout'] > max_fanout:
+            raise MergeFanoutError(
+                f"Merging on '{x_col}' would produce {report['rows_out']} rows "
+                f"({report['fanout']:.1f}x the largest file) because "
+                f"{report['duplicated_keys']} key(s) repeat; the limit is {max_fanout}x."
+            )
+
+    merged = frames[0]
+    for other in frames[1:]:
+        if tolerance is not None:
+            # merge_asof needs identical key dtypes, and the loader may have
+            # downcast each file's keys differently
+            key_dtype = np.result_type(merged[x_col].dtype, other[x_col].dtype)
+            # The marker is set on every right row, so it is missing exactly on
+            # the left rows that found no key within the tolerance (matched Y
+            # values may be missing themselves)
+            marker = '_matched'
+            while marker in merged.columns or marker in other.columns:
+                marker = '_' + marker
+            merged = pd.merge_asof(merged.astype({x_col: key_dtype}).sort_values(x_col),
+                                   other.astype({x_col: key_dtype}).assign(**{marker: True}).sort_values(x_col),
+                                   on=x_col, direction='nearest', tolerance=tolerance)
+            merged = merged[merged[marker].notna()].drop(columns=marker)
+        elif _sorted_unique(merged, x_col) and _sorted_unique(other, x_col):
+            merged = _merge_sorted(merged, other, x_col)
+        else:
+            merged = pd.merge(merged, other, on=x_col, how='inner')
+
+    merged.attrs['merge_report'] = report
+    return merged
@@ -1,43 +1,360 @@
-import pandas as pd
-import seaborn 
 import numpy as np
-import plotly
-import matplotlib as plt
+import pandas as pd
+from pandas.api import types as ptypes
+
+# Frames taller than this are profiled on a row sample when sample_size='auto'
+AUTO_SAMPLE_ROWS = 1_000_000
+DEFAULT_SAMPLE_SIZE = 100_000
+
+
+def approx_nunique(series, precision=12):
+    """
+    Estimates the number of distinct non-null values with HyperLogLog.
+
+    Uses 2**precision one-byte registers regardless of the column length; the
+    relative error is about 1.04 / sqrt(2**precision) (~1.6% at the default).
+    """
+    values = series.dropna()
+    if values.empty:
+        return 0
+
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    m = 1 << precision
+    register_index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    # The rank is the position of the first set bit in the low 32 bits; going
+    # through float64 keeps the bit length exact for 32-bit words
+    word = (hashes & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    bit_length = np.where(word > 0, np.frexp(word)[1], 0)
+    rank = (33 - bit_length).astype(np.uint8)
+
+    registers = np.zeros(m, dtype=np.uint8)
+    np.maximum.at(registers, register_index, rank)
+
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+    empty = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * m and empty:
+        # Small-range correction (linear counting)
+        estimate = m * np.log(m / empty)
+    return int(min(round(estimate), len(values)))
+
+
+def _reservoir_sample(df, sample_size, random_state):
+    # Uniform row sample without replacement, i.e. the content of a full
+    # reservoir after streaming every row of the frame
+    if sample_size is None or len(df) <= sample_size:
+        return df
+    return df.sample(n=sample_size, random_state=random_state)
+
+
+def _kind(dtype):
+    if ptypes.is_bool_dtype(dtype):
+        return 'bool'
+    if isinstance(dtype, pd.CategoricalDtype):
+        return 'category'
+    if ptypes.is_integer_dtype(dtype):
+        return 'integer'
+    if ptypes.is_float_dtype(dtype) or ptypes.is_timedelta64_dtype(dtype):
+        return 'float'
+    if ptypes.is_datetime64_any_dtype(dtype) or isinstance(dtype, pd.PeriodDtype):
+        return 'datetime'
+    if ptypes.is_string_dtype(dtype) or ptypes.is_object_dtype(dtype):
+        return 'text'
+    return 'unknown'
+
+
+def classify_variable_types(df, sample_size=None, approximate=False, random_state=0):
+    """
+    Classifies every column of a DataFrame as a statistical variable type.
+
+    Parameters:
+    df: pandas.DataFrame, the data to profile
+    sample_size: int, 'auto' or None, profile a uniform sample of this many
+        rows instead of the whole frame ('auto' samples DEFAULT_SAMPLE_SIZE
+        rows from frames taller than AUTO_SAMPLE_ROWS)
+    approximate: bool, count distinct values with HyperLogLog (approx_nunique)
+        instead of exact hashing of every value
+    random_state: int, seed of the row sample
+
+    Returns:
+    dict mapping column name to one of 'Discrete', 'Continuous', 'Nominal',
+    'Ordinal', 'Datetime', 'Text/String' or 'Unknown'.
+
+    Heuristics:
+    integers are Discrete when there are fewer distinct values than rows,
+    floats and durations are Continuous, booleans are Nominal, categoricals
+    are Ordinal or Nominal by their ``ordered`` flag, and text columns are
+    Nominal when there are fewer distinct values than half the rows.
+    """
+    if sample_size == 'auto':
+        sample_size = DEFAULT_SAMPLE_SIZE if len(df) > AUTO_SAMPLE_ROWS else None
+    data = _reservoir_sample(df, sample_size, random_state)
+    n_rows = len(data)
+
+    kinds = {column: _kind(dtype) for column, dtype in data.dtypes.items()}
+
+    # Distinct counts are needed only for integer and text columns; each is
+    # hashed exactly once
+    counted = [column for column, kind in kinds.items() if kind in ('integer', 'text')]
+    if approximate:
+        n_unique = {column: approx_nunique(data[column]) for column in counted}
+    else:
+        n_unique = data[counted].nunique().to_dict() if counted else {}
+
+    # An all-distinct integer column can be under-counted by HyperLogLog, so
+    # allow three standard errors before calling it Discrete
+    all_distinct = n_rows * (1 - 3 * 1.04 / np.sqrt(1 << 12)) if approximate else n_rows
 
-def classify_variable_types(df):
     variable_types = {}
-    
-    for column in df.columns:
-        dtype = df[column].dtype
-        
-        if dtype == 'int64':
-            # Check if the values are finite and countable
-            unique_values = df[column].nunique()
-            if unique_values < len(df):  # Heuristic: fewer unique values than rows
-                variable_types[column] = 'Discrete'
-            else:
-                variable_types[column] = 'Continuous'
-        elif dtype == 'float64':
-            # Continuous variable
+    for column, kind in kinds.items():
+        if kind == 'integer':
+            variable_types[column] = 'Discrete' if n_unique[column] < all_distinct else 'Continuous'
+        elif kind == 'float':
             variable_types[column] = 'Continuous'
-        elif dtype == 'category':
-            if df[column].cat.ordered:
-                variable_types[column] = 'Ordinal'
-            else:
-                variable_types[column] = 'Nominal'
-        elif dtype == 'object':
-            # Could be nominal or ordinal if it has a limited number of unique values
-            unique_values = df[column].nunique()
-            if unique_values < len(df) / 2:  # Heuristic to guess if it's categorical
-                variable_types[column] = 'Nominal'
-            else:
-                variable_types[column] = 'Text/String'
+        elif kind == 'bool':
+            variable_types[column] = 'Nominal'
+        elif kind == 'category':
+            variable_types[column] = 'Ordinal' if data[column].cat.ordered else 'Nominal'
+        elif kind == 'datetime':
+            variable_types[column] = 'Datetime'
+        elif kind == 'text':
+            variable_types[column] = 'Nominal' if n_unique[column] < n_rows / 2 else 'Text/String'
         else:
             variable_types[column] = 'Unknown'
-    
+
     return variable_types
 
-# Classify and print variable types
-variable_types = classify_variable_types(df)
-for variable, var_type in variable_types.items():
-    print(f"{variable}: {var_type}")
+
+# Text pairs mapped to booleans by optimize_dtypes (compared case-insensitively)
+BOOLEAN_PAIRS = (('true', 'false'), ('yes', 'no'), ('y', 'n'), ('t', 'f'))
+
+
+def _boolean_values(series):
+    # (true_value, false_value) as spelled in the column when its non-null
+    # values are one of BOOLEAN_PAIRS, otherwise None
+    values = series.dropna().unique()
+    if len(values) == 0 or len(values) > 2 or not all(isinstance(v, str) for v in values):
+        return None
+    spelled = {v.lower(): v for v in values}
+    if len(spelled) != len(values):
+        return None
+    for true, false in BOOLEAN_PAIRS:
+        if set(spelled) <= {true, false}:
+            # A missing spelling is stored in lower case
+            return spelled.get(true, true), spelled.get(false, false)
+    return None
+
+
+def _narrow_float(values, tolerance):
+    # Narrowest float dtype whose round trip stays within the relative tolerance
+    with np.errstate(over='ignore', invalid='ignore'):
+        for dtype in (np.float16, np.float32):
+            if np.dtype(dtype).itemsize >= values.dtype.itemsize:
+                break
+            back = values.astype(dtype).astype(values.dtype)
+            if tolerance == 0:
+                ok = np.array_equal(back, values, equal_nan=True)
+            else:
+                ok = np.all((np.abs(back - values) <= tolerance * np.abs(values)) |
+                            (np.isnan(back) & np.isnan(values)))
+            if ok:
+                return np.dtype(dtype)
+    return values.dtype
+
+
+class DtypeSchema:
+    """
+    The dtype conversions chosen by optimize_dtypes, reversible and reusable.
+
+    Every entry of ``columns`` maps a column to a dict with its 'variable_type',
+    the original dtype 'from', the optimized dtype 'to' and, for text mapped to
+    booleans, the 'true' and 'false' spellings. apply() converts another frame
+    with the same columns (e.g. the next export, or a chunk being read, see
+    csv_loader.read_csv_columns) without profiling it again; restore() converts
+    an optimized frame back to the original dtypes. Floats downcast with a
+    non-zero tolerance come back with the rounding of the narrow type.
+
+    Attributes:
+    columns: dict, the conversion of every converted column
+    report: pandas.DataFrame or None, bytes before / after / saved per column
+        (only for the schema returned by optimize_dtypes)
+    """
+
+    def __init__(self, columns, report=None):
+        self.columns = columns
+        self.report = report
+
+    @property
+    def bytes_saved(self):
+        """Total bytes saved on the frame the schema was built from."""
+        return int(self.report['bytes_saved'].sum()) if self.report is not None else 0
+
+    def read_dtypes(self, columns=None):
+        """
+        Returns the dtype argument for pandas.read_csv: the columns that become
+        categoricals are parsed straight into categories.
+        """
+        return {column: 'category' for column, spec in self.columns.items()
+                if spec['to'] == 'category' and (columns is None or column in columns)}
+
+    def apply(self, df):
+        """
+        Converts the columns of df listed in the schema, in place, and returns it.
+
+        Values that no longer fit the stored dtype (an integer out of range, a
+        float column with missing values or a text column where NumPy integers
+        were stored, a text value outside the stored boolean pair) leave the
+        column as it is; a boolean column with missing values becomes 'boolean'.
+        Targets such as 'Int8' or 'Float32' keep the missing values as pd.NA.
+        """
+        for column, spec in self.columns.items():
+            if column not in df.columns or str(df[column].dtype) == spec['to']:
+                continue
+            series = df[column]
+            target = spec['to']
+            if target == 'category':
+                df[column] = series.astype('category')
+            elif 'true' in spec:
+                # read_csv already parses true/false spellings itself
+                mapped = series.map({spec['true']: True, spec['false']: False, True: True, False: False})
+                if mapped.notna().sum() == series.notna().sum():
+                    # astype('bool') would turn the missing values into True
+                    df[column] = mapped.astype('bool' if target == 'bool' and mapped.notna().all()
+                                               else 'boolean')
+            elif ptypes.is_integer_dtype(target):
+                if not ptypes.is_numeric_dtype(series.dtype) or ptypes.is_bool_dtype(series.dtype):
+                    continue
+                dtype = ptypes.pandas_dtype(target)
+                nullable = isinstance(dtype, pd.api.extensions.ExtensionDtype)
+                values = series.dropna()
+                # Only the nullable integer types (Int8, ...) hold missing values
+                if (len(values) < len(series) and not nullable) or (values.dtype.kind == 'f' and (values % 1).any()):
+                    continue
+                info = np.iinfo(dtype.numpy_dtype if nullable else dtype)
+                if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+                    df[column] = series.astype(dtype)
+            elif (ptypes.is_float_dtype(target) and ptypes.is_numeric_dtype(series.dtype)
+                  and not ptypes.is_bool_dtype(series.dtype)):
+                df[column] = series.astype(ptypes.pandas_dtype(target))
+        return df
+
+    def restore(self, df):
+        """Converts the columns of an optimized frame back to their original dtypes, in place."""
+        for column, spec in self.columns.items():
+            if column not in df.columns:
+                continue
+            series = df[column]
+            if 'true' in spec:
+                series = series.map({True: spec['true'], False: spec['false']})
+            elif isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.astype(series.cat.categories.dtype)
+            df[column] = series.astype(spec['from'])
+        return df
+
+    def to_dict(self):
+        return {'columns': self.columns}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['columns'])
+
+    def save(self, path):
+        """Writes the schema as JSON, so the loaders can apply it to later files."""
+        import json
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a schema written by save()."""
+        import json
+
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def optimize_dtypes(df, float_tolerance=0.0, sample_size='auto', inplace=False):
+    """
+    Shrinks the dtypes of a DataFrame according to classify_variable_types.
+
+    Parameters:
+    df: pandas.DataFrame, the data to shrink
+    float_tolerance: float, largest relative error allowed when a float column is
+        downcast (0 only downcasts when the round trip is exact; 1e-3 admits float16
+        for most measurements, 1e-7 float32)
+    sample_size: int, 'auto' or None, row sample used for the classification
+        (see classify_variable_types); the conversions are always checked on every row
+    inplace: bool, convert df itself instead of a copy
+
+    Returns:
+    (optimized DataFrame, DtypeSchema); schema.report lists the bytes saved per column.
+
+    Conversions:
+    Nominal and Ordinal text columns become categoricals, text columns holding
+    only a true/false pair (true/false, yes/no, y/n, t/f in any case) become
+    booleans ('boolean' when values are missing), Discrete and Continuous integers
+    are downcast to the narrowest integer type, and Continuous floats become
+    integers when every value is a whole number, or else the narrowest float
+    within float_tolerance. Text/String, Datetime and categorical columns are kept,
+    and a conversion is only kept when it makes the column smaller.
+    """
+    if not inplace:
+        df = df.copy()
+    variable_types = classify_variable_types(df, sample_size=sample_size)
+
+    columns = {}
+    rows = []
+    for column, var_type in variable_types.items():
+        series = df[column]
+        kind = _kind(series.dtype)
+        spec = {'variable_type': var_type, 'from': str(series.dtype)}
+        converted = None
+
+        if kind == 'text':
+            pair = _boolean_values(series)
+            if pair is not None:
+                spec['true'], spec['false'] = pair
+                converted = series.map({pair[0]: True, pair[1]: False})
+                converted = converted.astype('boolean' if series.isna().any() else 'bool')
+            elif var_type in ('Nominal', 'Ordinal'):
+                converted = series.astype('category')
+        elif kind == 'integer' and series.dtype.kind in 'iu':
+            converted = pd.to_numeric(series, downcast='integer' if series.dtype.kind == 'i' else 'unsigned')
+        elif kind == 'float' and series.dtype.kind == 'f':
+            values = series.to_numpy()
+            finite = np.isfinite(values).all()
+            if (len(values) and finite and np.all(values % 1 == 0) and
+                    np.abs(values).max() < 2 ** 53):
+                converted = pd.to_numeric(values.astype(np.int64), downcast='integer')
+                converted = pd.Series(converted, index=series.index, name=column)
+            else:
+                dtype = _narrow_float(values, float_tolerance)
+                if dtype != values.dtype:
+                    converted = series.astype(dtype)
+
+        before = int(series.memory_usage(deep=True, index=False))
+        after = before
+        if converted is not None:
+            after = int(converted.memory_usage(deep=True, index=False))
+            if after < before:
+                spec['to'] = str(converted.dtype)
+                columns[column] = spec
+                df[column] = converted
+            else:
+                after = before
+        rows.append({'column': column, 'variable_type': var_type, 'from_dtype': spec['from'],
+                     'to_dtype': str(df[column].dtype), 'bytes_before': before,
+                     'bytes_after': after, 'bytes_saved': before - after})
+
+    return df, DtypeSchema(columns, pd.DataFrame(rows))
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Classify and print variable types of a CSV file
+    df = pd.read_csv(sys.argv[1], encoding='latin1')
+    variable_types = classify_variable_types(df, sample_size='auto')
+    for variable, var_type in variable_types.items():
+        print(f"{variable}: {var_type}")
@@ -0,0 +1,126 @@
+"""
+In-memory, streaming export of the stored protocol records.
+
+Records are read from the ProtocolStore in chunks, given proper types (the
+flattened section fields of protocol_store.FIELDS become numeric, text and
+date columns) and streamed into an in-memory buffer as xlsx, CSV or Parquet.
+Nothing is written to the working directory, so concurrent users never see
+each other's files, and memory stays bounded by the chunk size: the xlsx
+writer runs in xlsxwriter's constant-memory mode and Parquet is written one
+row group per chunk.
+"""
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from protocol_store import FIELDS
+
+FORMATS = {
+    'xlsx': ('protocol_data.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('protocol_data.csv', 'text/csv'),
+    'parquet': ('protocol_data.parquet', 'application/vnd.apache.parquet'),
+}
+DEFAULT_CHUNKSIZE = 5000
+
+_TYPES = {'REAL': 'float64', 'TEXT': 'string'}
+
+
+def typed_frame(df):
+    """
+    Casts a chunk of stored records to analysis-ready dtypes: REAL fields to
+    float64, TEXT fields to string, and the record date and creation time to
+    datetime64.
+    """
+    types = {column: _TYPES[sql_type] for _, _, column, sql_type in FIELDS if column in df.columns}
+    types.update({'id': 'int64', 'session_id': 'string'})
+    df = df.astype({column: dtype for column, dtype in types.items() if column in df.columns})
+    df['created_at'] = pd.to_datetime(df['created_at'])
+    df['settings_date'] = pd.to_datetime(df['settings_date'], errors='coerce')
+    return df
+
+
+def empty_frame():
+    """Returns a typed frame with the columns of the records table and no rows."""
+    columns = ['id', 'created_at', 'session_id'] + [column for _, _, column, _ in FIELDS]
+    return typed_frame(pd.DataFrame({column: pd.Series(dtype=object) for column in columns}))
+
+
+def _typed_frames(store, chunksize):
+    # An empty store still yields one (empty) frame, so every format gets its
+    # header and Parquet a valid schema-only file
+    empty = True
+    for df in store.iter_frames(chunksize):
+        empty = False
+        yield typed_frame(df)
+    if empty:
+        yield empty_frame()
+
+
+def _write_xlsx(frames, buffer):
+    workbook = xlsxwriter.Workbook(buffer, {'constant_memory': True})
+    sheet = workbook.add_worksheet('protocols')
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+    time_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+
+    row = 0
+    for df in frames:
+        if row == 0:
+            # constant_memory mode only accepts rows in order, header first
+            sheet.write_row(0, 0, list(df.columns))
+            row = 1
+        formats = [date_format if column == 'settings_date' else
+                   time_format if column == 'created_at' else None for column in df.columns]
+        for values in df.itertuples(index=False, name=None):
+            for col, (value, cell_format) in enumerate(zip(values, formats)):
+                if pd.isna(value):
+                    continue
+                if cell_format is not None:
+                    sheet.write_datetime(row, col, value.to_pydatetime(), cell_format)
+                else:
+                    sheet.write(row, col, value)
+            row += 1
+    workbook.close()
+
+
+def _write_csv(frames, buffer):
+    text = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+    for i, df in enumerate(frames):
+        df.to_csv(text, index=False, header=i == 0)
+    text.flush()
+    text.detach()
+
+
+def _write_parquet(frames, buffer):
+    writer = None
+    for df in frames:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(buffer, table.schema)
+        writer.write_table(table.cast(writer.schema))
+    if writer is not None:
+        writer.close()
+
+
+def export_records(store, fmt='xlsx', chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Exports every stored record into an in-memory file.
+
+    Parameters:
+    store: protocol_store.ProtocolStore, the records to export
+    fmt: str, 'xlsx', 'csv' or 'parquet'
+    chunksize: int, number of records read from the store at a time
+
+    Returns:
+    (bytes, file name, MIME type), ready for st.download_button
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {list(FORMATS)}, got {fmt!r}")
+
+    frames = _typed_frames(store, chunksize)
+    buffer = io.BytesIO()
+    {'xlsx': _write_xlsx, 'csv': _write_csv, 'parquet': _write_parquet}[fmt](frames, buffer)
+    file_name, mime = FORMATS[fmt]
+    return buffer.getvalue(), file_name, mime
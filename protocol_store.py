@@ -0,0 +1,218 @@
+"""
+Durable, append-only store for the protocol records submitted in app_try.
+
+Every submission becomes one flattened row in a local SQLite database, so
+records survive the Streamlit session and never accumulate in memory.
+SQLite in WAL mode lets any number of concurrent sessions append at once:
+each append is a single short transaction and writers wait for each other
+(up to ``timeout`` seconds) instead of failing.
+"""
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from csv_loader import compact_dtypes
+
+DEFAULT_DB_PATH = 'protocol_records.db'
+TABLE = 'protocol_records'
+
+# (section, field in the app_try record, column name, SQLite type)
+FIELDS = [
+    ("Procedure Settings", "Num", "settings_num", "TEXT"),
+    ("Procedure Settings", "Date", "settings_date", "TEXT"),
+    ("Procedure Settings", "Labeling", "settings_labeling", "TEXT"),
+    ("Procedure Settings", "Protein type", "settings_protein_type", "TEXT"),
+    ("Procedure Settings", "Concentration", "settings_concentration", "REAL"),
+    ("Physical Treatments", "Right Valve", "physical_right_valve", "REAL"),
+    ("Physical Treatments", "Left Valve", "physical_left_valve", "REAL"),
+    ("Physical Treatments", "Temp after HPH", "physical_temp_after_hph", "REAL"),
+    ("Physical Treatments", "HPH Fraction", "physical_hph_fraction", "REAL"),
+    ("Physical Treatments", "Acid Name", "physical_acid_name", "TEXT"),
+    ("Physical Treatments", "Concentration Acid", "physical_concentration_acid", "REAL"),
+    ("Physical Treatments", "Mixing Temp", "physical_mixing_temp", "REAL"),
+    ("Physical Treatments", "Mixing Time", "physical_mixing_time", "REAL"),
+    ("Physical Treatments", "Heat Treatment Fraction", "physical_heat_treatment_fraction", "REAL"),
+    ("Physical Treatments", "pH", "physical_ph", "REAL"),
+    ("Physical Treatments", "Initial Water Temp", "physical_initial_water_temp", "REAL"),
+    ("Enzymes Hydrolyzing", "Y/N", "hydrolyzing_yn", "TEXT"),
+    ("Enzymes Hydrolyzing", "Enz Num", "hydrolyzing_enz_num", "REAL"),
+    ("Enzymes Hydrolyzing", "Name", "hydrolyzing_name", "TEXT"),
+    ("Enzymes Hydrolyzing", "Concentration", "hydrolyzing_concentration", "REAL"),
+    ("Enzymes Hydrolyzing", "Added Enz", "hydrolyzing_added_enz", "REAL"),
+    ("Enzymes Hydrolyzing", "Addition Temp", "hydrolyzing_addition_temp", "REAL"),
+    ("Enzymes Hydrolyzing", "Ino. Time", "hydrolyzing_ino_time", "REAL"),
+    ("Enzymes Hydrolyzing", "Ino. Temp", "hydrolyzing_ino_temp", "REAL"),
+    ("Enzymes Hydrolyzing", "Stirring", "hydrolyzing_stirring", "REAL"),
+    ("Enzymes Hydrolyzing", "Black Box Protein Fraction", "hydrolyzing_black_box_protein_fraction", "REAL"),
+    ("Enzymes Crosslinking", "Enz Num", "crosslinking_enz_num", "REAL"),
+    ("Enzymes Crosslinking", "Name", "crosslinking_name", "TEXT"),
+    ("Enzymes Crosslinking", "Concentration", "crosslinking_concentration", "REAL"),
+    ("Enzymes Crosslinking", "Added Enz", "crosslinking_added_enz", "REAL"),
+    ("Enzymes Crosslinking", "Addition Temp", "crosslinking_addition_temp", "REAL"),
+    ("Enzymes Crosslinking", "Ino. Time", "crosslinking_ino_time", "REAL"),
+    ("Enzymes Crosslinking", "Ino. Temp", "crosslinking_ino_temp", "REAL"),
+    ("Enzymes Crosslinking", "Stirring", "crosslinking_stirring", "REAL"),
+]
+COLUMNS = [column for _, _, column, _ in FIELDS]
+NUMERIC_COLUMNS = [column for _, _, column, sql_type in FIELDS if sql_type == 'REAL']
+
+# Columns the common queries filter on
+INDEXED_COLUMNS = ['settings_date', 'settings_protein_type', 'hydrolyzing_name', 'crosslinking_name']
+
+AGGREGATIONS = {'mean': 'AVG', 'sum': 'SUM', 'min': 'MIN', 'max': 'MAX', 'count': 'COUNT'}
+
+# Group keys derived from the record date
+DATE_GROUPS = {
+    'date': "settings_date",
+    'month': "strftime('%Y-%m', settings_date)",
+    'year': "strftime('%Y', settings_date)",
+}
+
+
+def flatten_record(data):
+    """
+    Flattens one app_try record ({section: {field: value}}) into {column: value}.
+    Fields missing from the record are stored as NULL.
+    """
+    return {column: data.get(section, {}).get(field) for section, field, column, _ in FIELDS}
+
+
+class ProtocolStore:
+    """
+    Append-only SQLite store of flattened protocol records.
+
+    Parameters:
+    path: str, database file (created on first use)
+    timeout: float, seconds a writer waits for a concurrent writer to finish
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            columns = ', '.join(f'"{column}" {sql_type}' for _, _, column, sql_type in FIELDS)
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'created_at TEXT NOT NULL, '
+                         f'session_id TEXT, {columns})')
+            for column in INDEXED_COLUMNS:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{column} ON {TABLE} ("{column}")')
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation: Streamlit serves every
+        # session from its own thread, and sqlite3 connections are per-thread
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def append(self, data, session_id=None):
+        """
+        Appends one record and returns its id.
+
+        Parameters:
+        data: dict, the nested record built by app_try ({section: {field: value}})
+        session_id: str or None, identifier of the submitting session
+        """
+        row = flatten_record(data)
+        row['created_at'] = datetime.now().isoformat(timespec='seconds')
+        row['session_id'] = session_id
+        names = ', '.join(f'"{name}"' for name in row)
+        placeholders = ', '.join('?' for _ in row)
+        with self._connect() as conn:
+            cursor = conn.execute(f'INSERT INTO {TABLE} ({names}) VALUES ({placeholders})',
+                                  list(row.values()))
+            return cursor.lastrowid
+
+    def count(self):
+        """Returns the number of stored records."""
+        with self._connect() as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM {TABLE}').fetchone()[0]
+
+    def last_id(self):
+        """Returns the id of the newest record (0 when empty); it changes on every append."""
+        with self._connect() as conn:
+            return conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {TABLE}').fetchone()[0]
+
+    def to_frame(self):
+        """Returns every stored record as a DataFrame, one row per submission."""
+        with self._connect() as conn:
+            return pd.read_sql_query(f'SELECT * FROM {TABLE} ORDER BY id', conn)
+
+    def iter_frames(self, chunksize=5000):
+        """Yields the stored records in id order as DataFrames of at most ``chunksize`` rows."""
+        with self._connect() as conn:
+            yield from pd.read_sql_query(f'SELECT * FROM {TABLE} ORDER BY id', conn,
+                                         chunksize=chunksize)
+
+    def query(self, start_date=None, end_date=None, protein_type=None, enzyme=None,
+              columns=None, group_by=None, agg='mean'):
+        """
+        Filters the stored records and optionally groups and aggregates them in SQLite.
+
+        The filters use the indexes on the record date, protein type and enzyme names,
+        so queries stay fast as the store grows. The result can be passed straight to
+        OS_plots.create_plot_from_dfs([df], x_col, y_cols) or OS_plots.plot_correlation(df, ...).
+
+        Parameters:
+        start_date, end_date: str ('YYYY-MM-DD'), date or None, inclusive range of the record date
+        protein_type: str, list of str or None, protein type(s) to keep
+        enzyme: str, list of str or None, keep records whose hydrolyzing or crosslinking
+            enzyme is one of these
+        columns: list of str or None, record columns to return (None returns all of them,
+            or every numeric column when grouping)
+        group_by: str, list of str or None, columns to group by; 'date', 'month' and
+            'year' group by the record date
+        agg: str, 'mean', 'sum', 'min', 'max' or 'count' applied to every returned column
+            when grouping
+
+        Returns:
+        pandas.DataFrame shrunk with csv_loader.compact_dtypes; grouped results have one
+        row per group and an 'n_records' column.
+        """
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"agg must be one of {list(AGGREGATIONS)}, got {agg!r}")
+        group_by = [group_by] if isinstance(group_by, str) else list(group_by or [])
+        for column in list(columns or []) + [g for g in group_by if g not in DATE_GROUPS]:
+            if column not in COLUMNS:
+                raise KeyError(f"Unknown record column: {column!r}")
+
+        where, params = [], []
+        if start_date is not None:
+            where.append('settings_date >= ?')
+            params.append(str(start_date))
+        if end_date is not None:
+            where.append('settings_date <= ?')
+            params.append(str(end_date))
+        if protein_type is not None:
+            values = [protein_type] if isinstance(protein_type, str) else list(protein_type)
+            where.append(f"settings_protein_type IN ({', '.join('?' * len(values))})")
+            params += values
+        if enzyme is not None:
+            values = [enzyme] if isinstance(enzyme, str) else list(enzyme)
+            marks = ', '.join('?' * len(values))
+            where.append(f'(hydrolyzing_name IN ({marks}) OR crosslinking_name IN ({marks}))')
+            params += values * 2
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ''
+
+        if not group_by:
+            select = ', '.join(f'"{column}"' for column in columns) if columns else '*'
+            sql = f'SELECT {select} FROM {TABLE}{where_sql} ORDER BY id'
+        else:
+            keys = [f'{DATE_GROUPS[g]} AS "{g}"' if g in DATE_GROUPS else f'"{g}"' for g in group_by]
+            values = [c for c in (columns or NUMERIC_COLUMNS) if c not in group_by]
+            aggregates = [f'{AGGREGATIONS[agg]}("{c}") AS "{c}"' for c in values]
+            key_names = ', '.join(f'"{g}"' for g in group_by)
+            sql = (f"SELECT {', '.join(keys + aggregates)}, COUNT(*) AS n_records "
+                   f'FROM {TABLE}{where_sql} GROUP BY {key_names} ORDER BY {key_names}')
+
+        with self._connect() as conn:
+            return compact_dtypes(pd.read_sql_query(sql, conn, params=params))
+
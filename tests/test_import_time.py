@@ -0,0 +1,18 @@
+import statistics
+
+import pytest
+
+from benchmarks.bench_import_time import BUDGETS, DEFERRED, import_seconds, loaded_packages
+
+
+@pytest.mark.parametrize('module', sorted(BUDGETS))
+def test_import_within_budget(module):
+    # Median of a few cold imports, so one slow start does not fail the check
+    median = statistics.median(import_seconds(module) for _ in range(3))
+    assert median <= BUDGETS[module], f"importing {module} took {median:.2f} s"
+
+
+@pytest.mark.parametrize('module', sorted(DEFERRED))
+def test_import_defers_heavy_backends(module):
+    leaked = sorted(loaded_packages(module) & set(DEFERRED[module]))
+    assert not leaked, f"importing {module} loads {', '.join(leaked)}"
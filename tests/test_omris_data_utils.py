@@ -0,0 +1,55 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import csv_loader
+from omris_data_utils import optimize_dtypes
+
+
+def _schema():
+    df = pd.DataFrame({'flag': ['Yes', 'No'] * 50, 'count': np.arange(100) % 7})
+    optimized, schema = optimize_dtypes(df)
+    assert str(optimized['flag'].dtype) == 'bool'
+    assert str(optimized['count'].dtype) == 'int8'
+    return schema
+
+
+def test_apply_keeps_missing_values_of_bool_column():
+    schema = _schema()
+    df = schema.apply(pd.DataFrame({'flag': ['Yes', np.nan, 'No']}))
+    assert str(df['flag'].dtype) == 'boolean'
+    assert df['flag'].isna().tolist() == [False, True, False]
+    assert df['flag'].iloc[0] and not df['flag'].iloc[2]
+
+
+def test_read_csv_columns_keeps_missing_values_of_bool_column():
+    schema = _schema()
+    source = io.BytesIO(b'flag,count\nYes,1\n,2\nNo,3\n')
+    df = csv_loader.read_csv_columns(source, schema=schema)
+    assert df['flag'].isna().tolist() == [False, True, False]
+
+
+def test_apply_leaves_text_in_integer_column():
+    schema = _schema()
+    df = schema.apply(pd.DataFrame({'count': ['1', 'n/a', '3']}))
+    assert df['count'].tolist() == ['1', 'n/a', '3']
+
+
+def test_apply_nullable_columns_with_missing_values():
+    df = pd.DataFrame({'count': pd.array([1, None, 3, 100] * 25, dtype='Int64'),
+                       'level': pd.array([0.5, 1.5, None, 2.5] * 25, dtype='Float64')})
+    optimized, schema = optimize_dtypes(df)
+    assert str(optimized['count'].dtype) == 'Int8'
+
+    applied = schema.apply(df.copy())
+    assert applied.dtypes.equals(optimized.dtypes)
+    assert applied['count'].isna().sum() == 25
+    assert applied['level'].isna().sum() == 25
+    assert applied['count'].dropna().tolist() == df['count'].dropna().tolist()
+    assert applied['level'].dropna().tolist() == df['level'].dropna().tolist()
+
+    # Float data read from a later file fits the stored nullable integer target too
+    later = schema.apply(pd.DataFrame({'count': [1.0, np.nan, 7.0]}))
+    assert str(later['count'].dtype) == 'Int8'
+    assert later['count'].isna().tolist() == [False, True, False]
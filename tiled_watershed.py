@@ -0,0 +1,300 @@
+"""
+Tiled, out-of-core watershed segmentation for images too large for RAM.
+
+The image is opened lazily (memory-mapped .npy or uncompressed .tif, see
+open_image; any other format is first converted once to a temporary .npy, see
+to_memmap) and cut into tiles with an overlapping halo. Every tile is
+segmented by utils.segment_image in a worker process with one global
+threshold, and only the regions whose centroid lies in the tile's core (the
+tile without its halo) are kept. As long as the halo is wider than the
+largest particle, every region is therefore segmented whole by exactly one
+tile, and the labels line up across tile seams. Color images are first mean
+shift filtered tile by tile into a temporary gray image, whose histogram gives
+the same Otsu threshold as full-frame segmentation. The stitched labels are
+written to a memory-mapped int32 file, so peak memory is bounded by
+``workers`` tiles rather than by the image size.
+"""
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import cv2
+import numpy as np
+import tifffile
+from scipy import ndimage
+from skimage import img_as_ubyte
+
+from utils import filter_stage, segment_image
+
+DEFAULT_TILE_SIZE = 2048
+DEFAULT_OVERLAP = 128
+
+
+def open_image(path):
+    """
+    Opens an image without reading it into memory where the format allows it.
+
+    .npy files and uncompressed .tif files are memory-mapped; other formats
+    (and compressed TIFFs) are read whole with OpenCV / tifffile. TIFF colour
+    images are flipped from RGB to the BGR order the rest of utils expects.
+    tiled_watershed_segmentation converts the latter with to_memmap first, so
+    its workers only ever memory-map the image.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        return np.load(path, mmap_mode='r')
+    if ext in ('.tif', '.tiff'):
+        try:
+            img = tifffile.memmap(path, mode='r')
+        except ValueError:
+            # Compressed or tiled TIFFs cannot be memory-mapped
+            img = tifffile.imread(path)
+        return img[..., ::-1] if img.ndim == 3 else img
+    img = cv2.imread(path)
+    if img is None:
+        raise FileNotFoundError(f"Could not read image: {path}")
+    return img
+
+
+def is_memory_mappable(path):
+    """Returns whether open_image memory-maps the file (a .npy or an uncompressed, untiled .tif)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        return True
+    if ext in ('.tif', '.tiff'):
+        try:
+            tifffile.memmap(path, mode='r')
+            return True
+        except ValueError:
+            return False
+    return False
+
+
+def to_memmap(path, out_path):
+    """
+    Converts an image that cannot be memory-mapped to a .npy file, once.
+
+    Compressed and tiled TIFFs (of the first page) are decoded one strip or
+    tile at a time straight into the memory-mapped output, so the image is
+    never held in memory whole. Formats that cannot be decoded by region
+    (PNG, JPEG, ...) are read whole once with OpenCV. Colour is stored in BGR
+    order, like open_image returns it. Returns out_path.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ('.tif', '.tiff'):
+        img = cv2.imread(path)
+        if img is None:
+            raise FileNotFoundError(f"Could not read image: {path}")
+        out = np.lib.format.open_memmap(out_path, mode='w+', dtype=img.dtype, shape=img.shape)
+        out[:] = img
+        out.flush()
+        return out_path
+
+    with tifffile.TiffFile(path) as tif:
+        page = tif.pages[0]
+        separate = page.planarconfig == 2
+        if separate:
+            samples, height, width = page.shape
+            shape = (height, width, samples)
+        else:
+            shape = page.shape
+            height, width = shape[:2]
+        out = np.lib.format.open_memmap(out_path, mode='w+', dtype=page.dtype, shape=shape)
+        for segment, (sample, _, r, c, _), _ in page.segments():
+            if segment is None:
+                continue
+            # Edge tiles are padded beyond the image
+            segment = segment[0, :height - r, :width - c]
+            rows, cols = segment.shape[:2]
+            if separate:
+                out[r:r + rows, c:c + cols, samples - 1 - sample] = segment[..., 0]
+            elif out.ndim == 2:
+                out[r:r + rows, c:c + cols] = segment[..., 0]
+            else:
+                # TIFF colour is RGB, the rest of utils expects BGR
+                out[r:r + rows, c:c + cols] = segment[..., ::-1]
+        out.flush()
+    return out_path
+
+
+def estimate_threshold(img, max_pixels=4_000_000):
+    """
+    Otsu's threshold of the whole image, estimated on a strided subsample.
+    """
+    step = max(1, int(np.ceil(np.sqrt(img.shape[0] * img.shape[1] / max_pixels))))
+    sample = np.ascontiguousarray(img[::step, ::step])
+    gray = sample if sample.ndim == 2 else cv2.cvtColor(sample, cv2.COLOR_BGR2GRAY)
+    return cv2.threshold(img_as_ubyte(gray), 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[0]
+
+
+def otsu_from_histogram(hist):
+    """
+    Otsu's threshold of a 256-bin gray level histogram, as cv2.THRESH_OTSU computes it.
+    """
+    p = hist / hist.sum()
+    omega = np.cumsum(p)
+    mu = np.cumsum(p * np.arange(len(p)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (mu[-1] * omega - mu) ** 2 / (omega * (1 - omega))
+    return float(np.argmax(np.nan_to_num(between)))
+
+
+def tile_grid(shape, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP):
+    """
+    Returns a list of (core, padded) boxes covering an image of the given shape.
+
+    Each box is (row_start, row_stop, col_start, col_stop); the cores tile the
+    image without gaps or overlap, the padded boxes add ``overlap`` pixels on
+    every side (clipped to the image).
+    """
+    height, width = shape[:2]
+    boxes = []
+    for r0 in range(0, height, tile_size):
+        for c0 in range(0, width, tile_size):
+            core = (r0, min(r0 + tile_size, height), c0, min(c0 + tile_size, width))
+            padded = (max(r0 - overlap, 0), min(core[1] + overlap, height),
+                      max(c0 - overlap, 0), min(core[3] + overlap, width))
+            boxes.append((core, padded))
+    return boxes
+
+
+def _filter_tile(path, core, padded, gray_path):
+    # Worker: mean shift filters one padded color tile, writes its core to the
+    # gray image and returns the core's gray level histogram
+    img = open_image(path)
+    r0, r1, c0, c1 = padded
+    gray = filter_stage(np.ascontiguousarray(img[r0:r1, c0:c1]), 21, 51)
+    gray = gray[core[0] - r0:core[1] - r0, core[2] - c0:core[3] - c0]
+    out = np.load(gray_path, mmap_mode='r+')
+    out[core[0]:core[1], core[2]:core[3]] = gray
+    out.flush()
+    return np.bincount(gray.ravel(), minlength=256)
+
+
+def _segment_tile(path, core, padded, min_distance, threshold):
+    # Worker: segments one padded tile and keeps the regions whose centroid
+    # falls inside the tile core. Only this tile is ever read from disk.
+    img = open_image(path)
+    r0, r1, c0, c1 = padded
+    tile = np.ascontiguousarray(img[r0:r1, c0:c1])
+    labels = segment_image(tile, min_distance, threshold=threshold)['labels']
+
+    index = np.unique(labels[labels > 0])
+    if len(index) == 0:
+        return padded, labels
+    centroids = np.array(ndimage.center_of_mass(labels > 0, labels, index)) + (r0, c0)
+    keep = ((centroids[:, 0] >= core[0]) & (centroids[:, 0] < core[1]) &
+            (centroids[:, 1] >= core[2]) & (centroids[:, 1] < core[3]))
+
+    # Renumber the kept regions 1..k and clear the rest
+    lookup = np.zeros(labels.max() + 1, dtype=np.int32)
+    lookup[index[keep]] = np.arange(1, keep.sum() + 1, dtype=np.int32)
+    return padded, lookup[labels]
+
+
+def tiled_watershed_segmentation(image_path, min_distance, tile_size=DEFAULT_TILE_SIZE,
+                                 overlap=DEFAULT_OVERLAP, workers=None, out_path=None,
+                                 threshold=None, progress=True):
+    """
+    Performs watershed segmentation of a very large image tile by tile.
+    Parameters:
+    image_path: str, path to the image (.npy and uncompressed .tif are memory-mapped;
+        other formats are converted once to a temporary .npy, see to_memmap)
+    min_distance: int, minimum distance between peaks
+    tile_size: int, side of the square tile cores in pixels
+    overlap: int, halo added around every tile; must exceed the largest particle
+        diameter (and the 21 px mean shift radius) for seamless labels
+    workers: int or None, number of worker processes (None uses every CPU)
+    out_path: str or None, path of the .npy file receiving the labels (None uses a
+        temporary file)
+    threshold: int or None, foreground gray level (None uses Otsu's threshold of the
+        whole filtered image for color images, of a subsample for grayscale ones)
+    progress: bool, whether to print a line per finished tile
+    Returns:
+    dict with 'labels' (read-only memory-mapped int32 label image), 'labels_path',
+    'n_regions' and 'seconds'.
+    """
+    start = time.perf_counter()
+    temporary = []
+    try:
+        if not is_memory_mappable(image_path):
+            # Decode the image once here rather than once per tile in every worker
+            fd, converted = tempfile.mkstemp(suffix='.npy')
+            os.close(fd)
+            temporary.append(converted)
+            image_path = to_memmap(image_path, converted)
+        img = open_image(image_path)
+        boxes = tile_grid(img.shape, tile_size, overlap)
+        shape = img.shape[:2]
+        color = img.ndim == 3
+        if threshold is None and not color:
+            threshold = estimate_threshold(img)
+        del img
+
+        if out_path is None:
+            fd, out_path = tempfile.mkstemp(suffix='.npy')
+            os.close(fd)
+
+        n_regions = 0
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            if color:
+                # Mean shift filter every tile once, into a gray image that the
+                # segmentation pass reads instead; Otsu's threshold of its
+                # histogram is the one full-frame segment_image would use
+                fd, filtered = tempfile.mkstemp(suffix='.npy')
+                os.close(fd)
+                temporary.append(filtered)
+                np.lib.format.open_memmap(filtered, mode='w+', dtype=np.uint8, shape=shape).flush()
+                hist = sum(pool.map(_filter_tile, [image_path] * len(boxes), *zip(*boxes),
+                                    [filtered] * len(boxes)))
+                if threshold is None:
+                    threshold = otsu_from_histogram(hist)
+                image_path = filtered
+                if progress:
+                    print(f"Filtered {len(boxes)} tile(s), threshold {threshold:.0f}")
+
+            labels = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.int32, shape=shape)
+            pending = set()
+            queue = iter(boxes)
+            done = 0
+            while True:
+                # Keep at most two tiles per worker in flight so finished tiles
+                # never pile up in memory
+                for core, padded in queue:
+                    pending.add(pool.submit(_segment_tile, image_path, core, padded,
+                                            min_distance, threshold))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    (r0, r1, c0, c1), tile_labels = future.result()
+                    target = labels[r0:r1, c0:c1]
+                    # Regions straddling a seam were kept by one tile only; never
+                    # overwrite pixels another tile has already claimed
+                    write = (tile_labels > 0) & (target == 0)
+                    # Only the regions that still own pixels get a global label
+                    written = np.unique(tile_labels[write])
+                    count = len(written)
+                    lookup = np.zeros(int(tile_labels.max()) + 1, dtype=np.int32)
+                    lookup[written] = np.arange(n_regions + 1, n_regions + count + 1, dtype=np.int32)
+                    target[write] = lookup[tile_labels[write]]
+                    n_regions += count
+                    done += 1
+                    if progress:
+                        print(f"[{done}/{len(boxes)}] tile rows {r0}-{r1}, cols {c0}-{c1}: {count} regions")
+
+        labels.flush()
+        del labels
+    finally:
+        for path in temporary:
+            os.remove(path)
+    return {
+        'labels': np.load(out_path, mmap_mode='r'),
+        'labels_path': out_path,
+        'n_regions': n_regions,
+        'seconds': time.perf_counter() - start,
+    }
@@ -0,0 +1,270 @@
+"""
+Watershed segmentation of time-lapse stacks with markers carried from frame to frame.
+
+Consecutive frames of a time-lapse barely change, so instead of detecting the
+peaks of every frame from scratch, each frame's watershed is seeded with one
+marker per region of the previous frame: the point of the new distance map
+deepest inside the old region. The full peak detection (peak_local_max) only
+runs where the foreground changed, i.e. in the blocks whose mask differs from
+the previous frame's in more than ``max_change`` of the pixels, extended to the
+whole of every old region touching them. A peak found there takes over the ID
+of the old region it falls in (the strongest peak wins when a region split);
+any other peak starts a new ID that was never used before. The watershed keeps
+the marker values, so a region keeps its label for as long as it exists and the
+labels double as track IDs.
+
+Frames are read one at a time (multi-page TIFF, .npy stack, video, or a
+directory / glob / list of image files), so the stack never has to fit in
+memory. The mean shift filtering of color frames still runs on every frame.
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+import tifffile
+from scipy import ndimage
+from skimage.feature import peak_local_max
+from skimage.segmentation import watershed
+
+from instrumentation import span
+from utils import draw_segmentation, filter_stage, foreground_stage, list_images, region_properties
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+DEFAULT_BLOCK_SIZE = 64
+DEFAULT_MAX_CHANGE = 0.05
+
+
+def iter_frames(source):
+    """
+    Yields the frames of a time-lapse one at a time, as BGR or grayscale arrays.
+
+    source may be a multi-page TIFF (one frame per page), a .npy stack of shape
+    (frames, height, width[, 3]) (memory-mapped), a video file, an array of the
+    same shape as a .npy stack, or a directory / glob pattern / list of image
+    files (one frame per file, in sorted order).
+    """
+    if isinstance(source, np.ndarray):
+        yield from source
+        return
+    ext = os.path.splitext(source)[1].lower() if isinstance(source, str) else ''
+    if ext == '.npy':
+        yield from np.load(source, mmap_mode='r')
+    elif ext in ('.tif', '.tiff'):
+        with tifffile.TiffFile(source) as tif:
+            for page in tif.pages:
+                frame = page.asarray()
+                # TIFF color is RGB, the rest of the pipeline expects BGR
+                yield frame[..., ::-1] if frame.ndim == 3 else frame
+    elif ext in VIDEO_EXTENSIONS:
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise FileNotFoundError(f"Could not open video: {source}")
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield frame
+        finally:
+            capture.release()
+    else:
+        for path in list_images(source):
+            frame = cv2.imread(path)
+            if frame is None:
+                raise FileNotFoundError(f"Could not read image: {path}")
+            yield frame
+
+
+def changed_blocks(prev_mask, mask, block_size=DEFAULT_BLOCK_SIZE, max_change=DEFAULT_MAX_CHANGE):
+    """
+    Finds the blocks of a frame whose foreground changed since the previous frame.
+    Parameters:
+    prev_mask, mask: numpy.ndarray, foreground masks of the previous and current frame
+    block_size: int, side of the square blocks in pixels
+    max_change: float, fraction of a block's pixels that may flip before it counts as changed
+    Returns:
+    bool numpy.ndarray of the frame's shape, True inside the changed blocks
+    """
+    diff = (prev_mask > 0) != (mask > 0)
+    h, w = diff.shape
+    rows, cols = -(-h // block_size), -(-w // block_size)
+    padded = np.zeros((rows * block_size, cols * block_size), dtype=bool)
+    padded[:h, :w] = diff
+    fraction = padded.reshape(rows, block_size, cols, block_size).sum(axis=(1, 3)) / block_size ** 2
+    changed = fraction > max_change
+    return np.repeat(np.repeat(changed, block_size, axis=0), block_size, axis=1)[:h, :w]
+
+
+def _detect_peaks(D, fg, area, min_distance):
+    # peak_local_max on a crop around every connected part of area, padded by
+    # min_distance; the peaks are maxima of the whole foreground (masking the
+    # part itself would make its clipped edges look like peaks) and only those
+    # inside the part are kept. Returns the peaks sorted by decreasing depth.
+    parts = ndimage.label(area)[0]
+    peaks = []
+    for index, box in enumerate(ndimage.find_objects(parts), 1):
+        r0 = max(box[0].start - min_distance, 0)
+        c0 = max(box[1].start - min_distance, 0)
+        crop = (slice(r0, box[0].stop + min_distance), slice(c0, box[1].stop + min_distance))
+        found = peak_local_max(D[crop], min_distance=min_distance, labels=fg[crop].astype(np.uint8))
+        found = found[parts[crop][found[:, 0], found[:, 1]] == index]
+        peaks.append(found + (r0, c0))
+    if not peaks:
+        return np.empty((0, 2), dtype=np.intp)
+    peaks = np.concatenate(peaks)
+    return peaks[np.argsort(-D[peaks[:, 0], peaks[:, 1]], kind='stable')]
+
+
+def propagate_markers(prev_labels, D, thresh, changed, min_distance, next_id):
+    """
+    Builds the watershed markers of a frame from the previous frame's labels.
+    Parameters:
+    prev_labels: numpy.ndarray, labels of the previous frame (None for the first frame)
+    D: numpy.ndarray, distance transform of the current foreground
+    thresh: numpy.ndarray, current foreground mask
+    changed: numpy.ndarray, bool mask of the pixels where peaks are detected again
+    min_distance: int, minimum distance between peaks
+    next_id: int, first label ID not used so far
+    Returns:
+    tuple (markers, next_id, redetected), with redetected the fraction of the
+    frame where peak_local_max ran
+    """
+    fg = thresh > 0
+    markers = np.zeros(D.shape, dtype=np.int32)
+    if prev_labels is None:
+        area = np.ones(D.shape, dtype=bool)
+        prev_labels = markers
+    else:
+        # Old regions touching a changed block are detected again as a whole
+        touched = np.zeros(int(prev_labels.max()) + 1, dtype=bool)
+        touched[prev_labels[changed]] = True
+        touched[0] = False
+        area = changed | touched[prev_labels]
+
+        # One marker per remaining old region, at its deepest point in the new frame
+        # (a per-label argmax over the foreground pixels; ndimage.maximum_position
+        # sorts the whole frame)
+        pixels = np.flatnonzero(fg & ~area & (prev_labels > 0))
+        if len(pixels):
+            ids = prev_labels.ravel()[pixels]
+            depth = D.ravel()[pixels]
+            deepest = np.zeros(len(touched), dtype=D.dtype)
+            np.maximum.at(deepest, ids, depth)
+            at_max = depth == deepest[ids]
+            first = np.unique(ids[at_max], return_index=True)[1]
+            markers.ravel()[pixels[at_max][first]] = ids[at_max][first]
+
+    with span('peak_local_max', redetected=float(area.mean())):
+        peaks = _detect_peaks(D, fg, area, min_distance) if area.any() else np.empty((0, 2), np.intp)
+    if len(peaks):
+        # The deepest peak inside an old region inherits its ID, the others get new ones
+        old = prev_labels[peaks[:, 0], peaks[:, 1]]
+        inherit = np.zeros(len(peaks), dtype=bool)
+        inherit[np.unique(old, return_index=True)[1]] = True
+        inherit &= old > 0
+        ids = old.astype(np.int32)
+        n_new = int((~inherit).sum())
+        ids[~inherit] = np.arange(next_id, next_id + n_new, dtype=np.int32)
+        next_id += n_new
+        markers[peaks[:, 0], peaks[:, 1]] = ids
+    return markers, next_id, float(area.mean())
+
+
+def track_frames(source, min_distance, threshold=None, block_size=DEFAULT_BLOCK_SIZE,
+                 max_change=DEFAULT_MAX_CHANGE, keyframe_every=None):
+    """
+    Segments the frames of a time-lapse one after the other, with stable label IDs.
+    Parameters:
+    source: time-lapse to read, see iter_frames
+    min_distance: int, minimum distance between peaks
+    threshold: int or None, foreground gray level (None uses Otsu's threshold of every
+        frame; a fixed level keeps a global brightness drift from flipping the foreground)
+    block_size, max_change: change detection settings, see changed_blocks
+    keyframe_every: int or None, detect peaks on the whole frame every this many
+        frames (IDs are still inherited), to correct markers drifting off over time
+    Yields:
+    dict per frame with 'frame' (index), 'image', 'labels' (int32, 0 is background,
+    the same ID is the same region in every frame), 'n_regions', 'new_regions'
+    (IDs first seen in this frame), 'redetected' (fraction of the frame where peaks
+    were detected again) and 'seconds'.
+    """
+    prev_thresh = prev_labels = None
+    next_id = 1
+    for index, frame in enumerate(iter_frames(source)):
+        start = time.perf_counter()
+        frame = np.ascontiguousarray(frame)
+        with span('frame', frame=index) as sp:
+            gray = filter_stage(frame, 21, 51)
+            thresh = foreground_stage(gray, threshold)
+            D = ndimage.distance_transform_edt(thresh)
+
+            keyframe = prev_labels is None or (keyframe_every and index % keyframe_every == 0)
+            changed = (np.ones(D.shape, dtype=bool) if keyframe
+                       else changed_blocks(prev_thresh, thresh, block_size, max_change))
+            first_new = next_id
+            markers, next_id, redetected = propagate_markers(prev_labels, D, thresh, changed,
+                                                             min_distance, next_id)
+            labels = watershed(-D, markers, mask=thresh).astype(np.int32)
+            ids = np.unique(labels[labels > 0])
+            sp.set(redetected=redetected, regions=len(ids))
+
+        prev_thresh, prev_labels = thresh, labels
+        yield {
+            'frame': index,
+            'image': frame,
+            'labels': labels,
+            'n_regions': int(len(ids)),
+            'new_regions': int((ids >= first_new).sum()),
+            'redetected': redetected,
+            'seconds': time.perf_counter() - start,
+        }
+
+
+def timelapse_watershed_segmentation(source, min_distance, threshold=None, output_dir=None,
+                                     return_labels=False, return_regions=True, progress=True,
+                                     block_size=DEFAULT_BLOCK_SIZE, max_change=DEFAULT_MAX_CHANGE,
+                                     keyframe_every=None):
+    """
+    Performs watershed segmentation on every frame of a time-lapse stack, tracking the regions.
+    Parameters:
+    source: str, list or numpy.ndarray, the stack (multi-page TIFF, .npy, video, directory,
+        glob pattern or list of frame images, see iter_frames)
+    min_distance: int, minimum distance between peaks
+    threshold: int or None, foreground gray level (None uses Otsu's threshold of every frame)
+    output_dir: str or None, if given an overlay 'frame_<index>_watershed.png' is written there
+        per frame (region numbers are the track IDs)
+    return_labels: bool, whether to return the label array of every frame
+    return_regions: bool, whether to return the region_properties table of every frame
+        (with a 'frame' column; pd.concat of the tables gives one row per region and frame,
+        and 'label' identifies the same region across frames)
+    progress: bool, whether to print a line per frame
+    block_size, max_change, keyframe_every: change detection settings, see track_frames
+    Returns:
+    list of dicts, one per frame, with 'frame', 'n_regions', 'new_regions', 'redetected',
+    'seconds' and, as requested, 'labels', 'regions' and 'overlay_path'.
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    records = []
+    start = time.perf_counter()
+    for result in track_frames(source, min_distance, threshold, block_size, max_change, keyframe_every):
+        record = {key: result[key] for key in ('frame', 'n_regions', 'new_regions', 'redetected', 'seconds')}
+        if return_labels:
+            record['labels'] = result['labels']
+        if return_regions:
+            regions = region_properties(result['labels'], result['image'])
+            regions.insert(0, 'frame', result['frame'])
+            record['regions'] = regions
+        if output_dir is not None:
+            record['overlay_path'] = os.path.join(output_dir, f"frame_{result['frame']:05d}_watershed.png")
+            cv2.imwrite(record['overlay_path'], draw_segmentation(result['image'], result['labels']))
+        records.append(record)
+        if progress:
+            print(f"[{result['frame']}] {result['n_regions']} regions, {result['new_regions']} new, "
+                  f"{result['redetected']:.0%} re-detected ({result['seconds']:.2f} s)")
+
+    if progress:
+        print(f"Segmented {len(records)} frame(s) in {time.perf_counter() - start:.1f} s")
+    return records
@@ -1,94 +1,697 @@
-# import libs
-import cv2
-from skimage.feature import peak_local_max
-from skimage.segmentation import watershed
-from skimage import io, img_as_ubyte
-from scipy import ndimage
-import numpy as np
-import imutils
-import matplotlib.pyplot as plt
-
-
-def watershed_segmentation(image_path, min_distance):
-
-    """
-    This function performs watershed segmentation on an input image.
-    Parameters:
-    image_path: str, path to the input image
-    min_distance: int, minimum distance between peaks
-    Function Steps:
-    Reads and processes the image (grayscale conversion if needed).
-    Applies Otsu's thresholding and computes the distance transform.
-    Identifies peaks and creates markers for segmentation.
-    Applies the watershed algorithm to segment the image.
-    Draws contours and labels each segmented region.
-    Displays the segmented result using matplotlib.
-    Requires OpenCV, NumPy, SciPy, scikit-image, imutils, and matplotlib.
-    """
-    # Read the image
-    img = cv2.imread(image_path)
-    
-    # Check if the image is grayscale or color
-    if len(img.shape) == 2:
-        # If grayscale, skip mean shift filtering
-        gray = img
-    else:
-        # If color, apply mean shift filtering and convert to grayscale
-        shifted = cv2.pyrMeanShiftFiltering(img, 21, 51)
-        gray = cv2.cvtColor(shifted, cv2.COLOR_BGR2GRAY)
-    
-    # Ensure the image is 8-bit
-    gray = img_as_ubyte(gray)
-    
-    # Apply thresholding
-    thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
-    
-    # Compute the distance transform
-    D = ndimage.distance_transform_edt(thresh)
-    
-    # Find peaks in the distance map
-    localMax = peak_local_max(D, min_distance=min_distance, labels=thresh)
-    
-    # Create a binary mask for the local maxima
-    localMaxMask = np.zeros(D.shape, dtype=bool)
-    localMaxMask[tuple(localMax.T)] = True
-    
-    # Perform connected component analysis
-    markers = ndimage.label(localMaxMask, structure=np.ones((3, 3)))[0]
-    
-    # Apply the Watershed algorithm
-    labels = watershed(-D, markers, mask=thresh)
-    
-    # Prepare the output image
-    output = img.copy() if len(img.shape) == 3 else cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-    
-    # Loop over unique labels
-    for label in np.unique(labels):
-        if label == 0:
-            continue
-        
-        # Create a mask for the current label
-        mask = np.zeros(gray.shape, dtype="uint8")
-        mask[labels == label] = 255
-        
-        # Find contours
-        cnts = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        cnts = imutils.grab_contours(cnts)
-        c = max(cnts, key=cv2.contourArea)
-        
-        # Draw contour and label
-        ((x, y), r) = cv2.minEnclosingCircle(c)
-        cv2.putText(output, f"#{label}", (int(x) - 10, int(y)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-        cv2.drawContours(output, [c], -1, (0, 255, 0), 2)
-    
-    # Display the result
-    plt.figure(figsize=(12, 12))
-    plt.imshow(cv2.cvtColor(output, cv2.COLOR_BGR2RGB))
-    plt.title('Watershed Segmentation Result')
-    plt.axis('off')
-    plt.show()
-
-
-
-# function of kmeans - todo
+# import libs
+import glob
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from instrumentation import span, traced
+
+# OpenCV, scikit-image, SciPy, imutils and matplotlib are imported inside the
+# functions that use them, so importing utils (e.g. for list_images, or in a
+# worker that only needs one stage) does not load every imaging backend.
+# The import-time budget is checked by benchmarks/bench_import_time.py.
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+# Instrumentation span of every SegmentationPipeline stage
+STAGE_SPANS = {'read': 'read_image', 'filtered': 'mean_shift', 'foreground': 'threshold',
+               'distance': 'distance_transform', 'markers': 'peak_local_max', 'labels': 'watershed'}
+
+
+class SegmentationPipeline:
+    """
+    The watershed segmentation split into explicit stages with memoized intermediates.
+    Every intermediate is cached under the hash of the image plus the parameters of its
+    own stage and of all the stages before it, so when one parameter changes only the
+    stages from that point on are recomputed:
+        filtered   - mean shift filtering + grayscale (spatial_radius, color_radius), slowest
+        foreground - thresholded mask (threshold)
+        distance   - Euclidean distance transform of the mask
+        markers    - labeled local maxima of the distance map (min_distance)
+        labels     - watershed of the distance map from the markers
+    Parameters:
+    max_entries: int, number of intermediates kept (least recently used are dropped first);
+        0 disables caching
+    Attributes:
+    computed: dict, how many times each stage was actually computed (cache misses)
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self.computed = {'read': 0, 'filtered': 0, 'foreground': 0, 'distance': 0,
+                         'markers': 0, 'labels': 0}
+
+    def _memo(self, key, compute):
+        with span(STAGE_SPANS[key[0]]) as sp:
+            if key in self._cache:
+                sp.set(cached=True)
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            value = compute()
+            sp.set(cached=False)
+        self.computed[key[0]] += 1
+        if self.max_entries > 0:
+            self._cache[key] = value
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._cache.clear()
+
+    def _read(self, image):
+        import cv2
+
+        if not isinstance(image, str):
+            return image
+        stat = os.stat(image)
+
+        def read():
+            img = cv2.imread(image)
+            if img is None:
+                raise FileNotFoundError(f"Could not read image: {image}")
+            return img
+        return self._memo(('read', os.path.abspath(image), stat.st_mtime_ns, stat.st_size), read)
+
+    def run(self, image, min_distance, threshold=None, spatial_radius=21, color_radius=51):
+        """
+        Segments an image, reusing every cached stage whose inputs did not change.
+        Parameters:
+        image: str or numpy.ndarray, path to the input image or the image itself (BGR or grayscale)
+        min_distance: int, minimum distance between peaks
+        threshold: int or None, fixed gray level for the foreground mask (None uses Otsu's
+            threshold of this image)
+        spatial_radius, color_radius: int, pyrMeanShiftFiltering window radii (color images only)
+        Returns:
+        dict with 'image', 'labels' (int32 label image, 0 is background) and 'n_regions'.
+        """
+        from scipy import ndimage
+        from skimage.segmentation import watershed
+
+        img = self._read(image)
+        key = (hashlib.blake2b(np.ascontiguousarray(img).data, digest_size=16).hexdigest(),
+               img.shape, str(img.dtype))
+
+        key += (spatial_radius, color_radius)
+        gray = self._memo(('filtered',) + key, lambda: filter_stage(img, spatial_radius, color_radius))
+        key += (threshold,)
+        thresh = self._memo(('foreground',) + key, lambda: foreground_stage(gray, threshold))
+        D = self._memo(('distance',) + key, lambda: ndimage.distance_transform_edt(thresh))
+        key += (min_distance,)
+        markers = self._memo(('markers',) + key, lambda: _markers_stage(D, thresh, min_distance))
+        labels = self._memo(('labels',) + key, lambda: watershed(-D, markers, mask=thresh).astype(np.int32))
+
+        return {'image': img, 'labels': labels, 'n_regions': int(len(np.unique(labels[labels > 0])))}
+
+
+def filter_stage(img, spatial_radius, color_radius):
+    """
+    First watershed stage: mean shift filters a color image and converts it to 8-bit gray.
+    Parameters:
+    img: numpy.ndarray, BGR or grayscale image (grayscale images are not filtered)
+    spatial_radius: int, spatial window radius for mean shift filtering
+    color_radius: int, color window radius for mean shift filtering
+    Returns:
+    uint8 grayscale numpy.ndarray
+    """
+    import cv2
+    from skimage import img_as_ubyte
+
+    # Check if the image is grayscale or color
+    if len(img.shape) == 2:
+        # If grayscale, skip mean shift filtering
+        gray = img
+    else:
+        # If color, apply mean shift filtering and convert to grayscale
+        shifted = cv2.pyrMeanShiftFiltering(img, spatial_radius, color_radius)
+        gray = cv2.cvtColor(shifted, cv2.COLOR_BGR2GRAY)
+    
+    # Ensure the image is 8-bit
+    return img_as_ubyte(gray)
+
+
+def foreground_stage(gray, threshold):
+    """
+    Second watershed stage: thresholds the filtered gray image into the foreground mask.
+    Parameters:
+    gray: numpy.ndarray, uint8 grayscale image (see filter_stage)
+    threshold: int or None, foreground gray level (None uses Otsu's threshold)
+    Returns:
+    uint8 numpy.ndarray, 255 on the foreground and 0 elsewhere
+    """
+    import cv2
+
+    # Apply thresholding
+    if threshold is None:
+        return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+    return cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)[1]
+
+
+def _markers_stage(D, thresh, min_distance):
+    from scipy import ndimage
+    from skimage.feature import peak_local_max
+
+    # Find peaks in the distance map
+    localMax = peak_local_max(D, min_distance=min_distance, labels=thresh)
+    
+    # Create a binary mask for the local maxima
+    localMaxMask = np.zeros(D.shape, dtype=bool)
+    localMaxMask[tuple(localMax.T)] = True
+    
+    # Perform connected component analysis
+    return ndimage.label(localMaxMask, structure=np.ones((3, 3)))[0]
+
+
+@traced()
+def segment_image(image, min_distance, threshold=None, pipeline=None):
+    """
+    Runs the watershed segmentation steps and returns the result instead of displaying it.
+    Parameters:
+    image: str or numpy.ndarray, path to the input image or the image itself (BGR or grayscale)
+    min_distance: int, minimum distance between peaks
+    threshold: int or None, fixed gray level for the foreground mask (None uses Otsu's
+        threshold of this image; tiles of one large image pass a shared global threshold)
+    pipeline: SegmentationPipeline or None, pipeline whose cached stages to reuse
+        (None computes every stage without caching)
+    Returns:
+    dict with 'image' (the input image), 'labels' (int32 label image, 0 is background)
+    and 'n_regions' (number of segmented regions).
+    """
+    if pipeline is None:
+        pipeline = SegmentationPipeline(max_entries=0)
+    return pipeline.run(image, min_distance, threshold=threshold)
+
+
+def sweep(image, min_distance, threshold=None, pipeline=None):
+    """
+    Segments one image for every combination of parameter values, recomputing only the
+    stages downstream of the parameter that changed.
+    Parameters:
+    image: str or numpy.ndarray, path to the input image or the image itself
+    min_distance: int or list of int, minimum distances between peaks to try
+    threshold: int, None or list, foreground thresholds to try (None is Otsu's)
+    pipeline: SegmentationPipeline or None, pipeline to reuse across calls
+    Returns:
+    pandas.DataFrame with the columns 'threshold' ('otsu' for None), 'min_distance'
+    and 'n_regions'.
+    """
+    if pipeline is None:
+        pipeline = SegmentationPipeline()
+    thresholds = threshold if isinstance(threshold, (list, tuple)) else [threshold]
+    distances = min_distance if isinstance(min_distance, (list, tuple)) else [min_distance]
+
+    rows = []
+    for t in thresholds:
+        for d in distances:
+            result = pipeline.run(image, d, threshold=t)
+            rows.append({'threshold': 'otsu' if t is None else t, 'min_distance': d,
+                         'n_regions': result['n_regions']})
+    return pd.DataFrame(rows)
+
+
+def _region_contours(labels):
+    # Yields (label, external contours) per region. Each region is cut out of
+    # its own bounding box (ndimage.find_objects), so the work is proportional
+    # to the region sizes rather than to labels x image pixels
+    import cv2
+    import imutils
+    from scipy import ndimage
+
+    for index, region in enumerate(ndimage.find_objects(labels)):
+        if region is None:
+            continue
+        label = index + 1
+        mask = (labels[region] == label).astype("uint8")
+        cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE,
+                                offset=(region[1].start, region[0].start))
+        yield label, imutils.grab_contours(cnts)
+
+
+@traced()
+def draw_segmentation(img, labels):
+    """
+    Draws the contour and the number of every segmented region on a copy of the image.
+    Parameters:
+    img: numpy.ndarray, the segmented image (BGR or grayscale)
+    labels: numpy.ndarray, label image returned by segment_image
+    Returns:
+    BGR numpy.ndarray with the overlay.
+    """
+    import cv2
+
+    # Prepare the output image
+    output = img.copy() if len(img.shape) == 3 else cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    
+    # Loop over the regions, each cropped to its bounding box
+    with span('contours') as sp:
+        n_regions = 0
+        for label, cnts in _region_contours(labels):
+            c = max(cnts, key=cv2.contourArea)
+            
+            # Draw contour and label
+            ((x, y), r) = cv2.minEnclosingCircle(c)
+            cv2.putText(output, f"#{label}", (int(x) - 10, int(y)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+            cv2.drawContours(output, [c], -1, (0, 255, 0), 2)
+            n_regions += 1
+        sp.set(regions=n_regions)
+
+    return output
+
+
+@traced()
+def region_properties(labels, intensity=None):
+    """
+    Measures every segmented region in one pass over the label image.
+    Parameters:
+    labels: numpy.ndarray, label image returned by segment_image (0 is background)
+    intensity: numpy.ndarray or None, image to average inside each region
+        (a BGR image is converted to grayscale first)
+    Returns:
+    pandas.DataFrame with one row per region and the columns 'label', 'area',
+    'centroid_x', 'centroid_y', 'equivalent_diameter', 'perimeter', 'bbox_x',
+    'bbox_y', 'bbox_width', 'bbox_height' and, with an intensity image,
+    'mean_intensity'. All values are in pixels, ready for the OS_plots functions.
+    """
+    import cv2
+    from scipy import ndimage
+
+    labels = np.asarray(labels)
+    flat = labels.ravel()
+    n_bins = int(flat.max()) + 1 if flat.size else 1
+
+    # Area and centroid from bincount reductions over all pixels at once
+    rows, cols = np.indices(labels.shape)
+    area = np.bincount(flat, minlength=n_bins)
+    sum_y = np.bincount(flat, weights=rows.ravel(), minlength=n_bins)
+    sum_x = np.bincount(flat, weights=cols.ravel(), minlength=n_bins)
+
+    present = np.flatnonzero(area)
+    present = present[present > 0]
+
+    table = pd.DataFrame({'label': present, 'area': area[present]})
+    table['centroid_x'] = sum_x[present] / area[present]
+    table['centroid_y'] = sum_y[present] / area[present]
+    table['equivalent_diameter'] = np.sqrt(4 * area[present] / np.pi)
+
+    # Bounding boxes and perimeters from the cropped regions
+    boxes = ndimage.find_objects(labels)
+    table['bbox_x'] = [boxes[label - 1][1].start for label in present]
+    table['bbox_y'] = [boxes[label - 1][0].start for label in present]
+    table['bbox_width'] = [boxes[label - 1][1].stop - boxes[label - 1][1].start for label in present]
+    table['bbox_height'] = [boxes[label - 1][0].stop - boxes[label - 1][0].start for label in present]
+    perimeter = {label: sum(cv2.arcLength(c, True) for c in cnts) for label, cnts in _region_contours(labels)}
+    table['perimeter'] = table['label'].map(perimeter)
+
+    if intensity is not None:
+        if intensity.ndim == 3:
+            intensity = cv2.cvtColor(intensity, cv2.COLOR_BGR2GRAY)
+        sums = np.bincount(flat, weights=intensity.ravel().astype(np.float64), minlength=n_bins)
+        table['mean_intensity'] = sums[present] / area[present]
+
+    return table
+
+
+@traced()
+def watershed_segmentation(image_path, min_distance):
+
+    """
+    This function performs watershed segmentation on an input image.
+    Parameters:
+    image_path: str, path to the input image
+    min_distance: int, minimum distance between peaks
+    Function Steps:
+    Reads and processes the image (grayscale conversion if needed).
+    Applies Otsu's thresholding and computes the distance transform.
+    Identifies peaks and creates markers for segmentation.
+    Applies the watershed algorithm to segment the image.
+    Draws contours and labels each segmented region.
+    Displays the segmented result using matplotlib.
+    Requires OpenCV, NumPy, SciPy, scikit-image, imutils, and matplotlib.
+    For many images without display use batch_watershed_segmentation.
+    For time-lapse stacks with region IDs kept across frames use
+    timelapse_watershed.timelapse_watershed_segmentation.
+    """
+    import cv2
+    import matplotlib.pyplot as plt
+
+    result = segment_image(image_path, min_distance)
+    output = draw_segmentation(result['image'], result['labels'])
+    
+    # Display the result
+    with span('display'):
+        plt.figure(figsize=(12, 12))
+        plt.imshow(cv2.cvtColor(output, cv2.COLOR_BGR2RGB))
+        plt.title('Watershed Segmentation Result')
+        plt.axis('off')
+        plt.show()
+
+
+def list_images(images):
+    """
+    Expands a directory, a glob pattern or a list of paths into a sorted list of image paths.
+    """
+    if isinstance(images, (list, tuple)):
+        return list(images)
+    if os.path.isdir(images):
+        return sorted(os.path.join(images, name) for name in os.listdir(images)
+                      if name.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(glob.glob(images))
+
+
+def _segment_file(image_path, min_distance, output_dir, return_labels, return_regions):
+    # Worker run in the process pool: segments one image file and optionally
+    # writes its overlay, returning only picklable results
+    import cv2
+
+    start = time.perf_counter()
+    result = segment_image(image_path, min_distance)
+    record = {'path': image_path, 'n_regions': result['n_regions']}
+    if return_labels:
+        record['labels'] = result['labels']
+    if return_regions:
+        regions = region_properties(result['labels'], result['image'])
+        regions.insert(0, 'image', os.path.basename(image_path))
+        record['regions'] = regions
+    if output_dir is not None:
+        name = os.path.splitext(os.path.basename(image_path))[0]
+        record['overlay_path'] = os.path.join(output_dir, f"{name}_watershed.png")
+        cv2.imwrite(record['overlay_path'], draw_segmentation(result['image'], result['labels']))
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def _map_images(paths, worker, args, workers, progress):
+    # Runs worker(path, *args) for every path, in a process pool unless workers == 1,
+    # and returns the records in input order (failures become {'path', 'error'})
+    results = [None] * len(paths)
+    start = time.perf_counter()
+
+    def report(done, index):
+        record = results[index]
+        if progress:
+            status = f"{record['n_regions']} regions" if 'error' not in record else f"failed: {record['error']}"
+            print(f"[{done}/{len(paths)}] {os.path.basename(record['path'])}: {status} "
+                  f"({record.get('seconds', 0):.2f} s)")
+
+    if workers == 1:
+        for done, (index, path) in enumerate(enumerate(paths), 1):
+            try:
+                results[index] = worker(path, *args)
+            except Exception as e:
+                results[index] = {'path': path, 'error': str(e)}
+            report(done, index)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(worker, path, *args): index for index, path in enumerate(paths)}
+            for done, future in enumerate(as_completed(futures), 1):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    results[index] = {'path': paths[index], 'error': str(e)}
+                report(done, index)
+
+    if progress:
+        print(f"Segmented {len(paths)} image(s) in {time.perf_counter() - start:.1f} s")
+    return results
+
+
+def batch_watershed_segmentation(images, min_distance, output_dir=None, workers=None,
+                                 return_labels=True, return_regions=False, progress=True):
+    """
+    Performs watershed segmentation on many images in parallel, without displaying them.
+    Parameters:
+    images: str or list, a directory, a glob pattern (e.g. 'data/*.tif') or a list of image paths
+    min_distance: int, minimum distance between peaks
+    output_dir: str or None, if given an overlay image '<name>_watershed.png' is written there per image
+    workers: int or None, number of worker processes (None uses every CPU, 1 runs in this process)
+    return_labels: bool, whether to return the label array of every image
+    return_regions: bool, whether to return the region_properties table of every image
+        (with an 'image' column, so the tables can be concatenated with pd.concat)
+    progress: bool, whether to print a line per finished image
+    Returns:
+    list of dicts, in input order, with 'path', 'n_regions', 'seconds' and, as requested,
+    'labels', 'regions' and 'overlay_path'. Images that fail have an 'error' entry instead.
+    """
+    paths = list_images(images)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    return _map_images(paths, _segment_file, (min_distance, output_dir, return_labels, return_regions),
+                       workers, progress)
+
+
+
+def _read_color_image(image):
+    # Image path or array -> 8-bit image (BGR or grayscale), as the k-means features need
+    import cv2
+    from skimage import img_as_ubyte
+
+    img = cv2.imread(image, cv2.IMREAD_UNCHANGED) if isinstance(image, str) else np.asarray(image)
+    if img is None:
+        raise ValueError(f"Could not read image {image}")
+    if img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img if img.dtype == np.uint8 else img_as_ubyte(img)
+
+
+class ColorKMeans:
+    """
+    Mini-batch k-means over pixel colors, fitted once and reused for a whole image set.
+
+    fit() draws a random sample of pixels from the images and refines the centers
+    with small random batches (each center moving by 1 / number of pixels it has
+    absorbed so far), so fitting costs the same whatever the image size.
+    predict() labels every pixel of an image in row blocks of at most
+    chunk_pixels pixels, which bounds the memory of the distance computation.
+    Centers are ordered by lightness, so label 1 is always the darkest cluster
+    and the labels mean the same thing in every image labelled with one model.
+    """
+
+    def __init__(self, n_clusters=4, color_space='lab', batch_size=4096, max_iter=300,
+                 sample_size=200_000, tol=1e-3, random_state=0):
+        """
+        Parameters:
+        n_clusters: int, number of color clusters
+        color_space: str, 'lab' (perceptual distances) or 'bgr'; ignored for grayscale images
+        batch_size: int, pixels per mini-batch update
+        max_iter: int, maximum number of mini-batch updates
+        sample_size: int, pixels sampled from all the images together for fitting
+        tol: float, stop once no center moves more than this (in color units) in an update
+        random_state: int, seed of the sampling, so a fit is reproducible
+        """
+        if color_space not in ('lab', 'bgr'):
+            raise ValueError("color_space must be 'lab' or 'bgr'")
+        self.n_clusters = n_clusters
+        self.color_space = color_space
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.sample_size = sample_size
+        self.tol = tol
+        self.random_state = random_state
+        self.centers_ = None
+        self.n_iter_ = 0
+
+    def _features(self, img):
+        # (pixels, channels) float32 features of an 8-bit image
+        import cv2
+
+        if img.ndim == 2:
+            return img.reshape(-1, 1).astype(np.float32)
+        if self.color_space == 'lab':
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+        return img.reshape(-1, img.shape[2]).astype(np.float32)
+
+    def _nearest(self, X):
+        # Index of the nearest center per row; ||x||^2 is the same for every center and is dropped
+        d = (self.centers_ ** 2).sum(axis=1) - 2 * X @ self.centers_.T
+        return d.argmin(axis=1)
+
+    def fit(self, images):
+        """
+        Fits the centers on a pixel sample drawn evenly from the images.
+        Parameters:
+        images: image path or array, or a list of them (all color or all grayscale)
+        Returns:
+        self
+        """
+        if isinstance(images, (str, np.ndarray)):
+            images = [images]
+        rng = np.random.default_rng(self.random_state)
+        with span('kmeans_fit', images=len(images), clusters=self.n_clusters) as sp:
+            per_image = max(1, self.sample_size // len(images))
+            samples = []
+            for image in images:
+                X = self._features(_read_color_image(image))
+                samples.append(X[rng.choice(len(X), min(per_image, len(X)), replace=False)])
+            X = np.concatenate(samples)
+            if len(X) < self.n_clusters:
+                raise ValueError(f"{len(X)} pixels are too few for {self.n_clusters} clusters")
+
+            # k-means++ seeding on (a subset of) the sample
+            seed_pool = X[rng.choice(len(X), min(len(X), 20 * self.batch_size), replace=False)]
+            centers = [seed_pool[rng.integers(len(seed_pool))]]
+            d2 = ((seed_pool - centers[0]) ** 2).sum(axis=1)
+            for _ in range(1, self.n_clusters):
+                total = d2.sum()
+                # Fewer distinct colors than clusters: pick arbitrary points
+                index = rng.choice(len(seed_pool), p=d2 / total) if total > 0 else rng.integers(len(seed_pool))
+                centers.append(seed_pool[index])
+                d2 = np.minimum(d2, ((seed_pool - centers[-1]) ** 2).sum(axis=1))
+            self.centers_ = np.array(centers, dtype=np.float64)
+
+            # Mini-batch updates with a per-center learning rate of 1 / count
+            counts = np.zeros(self.n_clusters)
+            self.n_iter_ = 0
+            for self.n_iter_ in range(1, self.max_iter + 1):
+                batch = X[rng.integers(0, len(X), self.batch_size)]
+                nearest = self._nearest(batch)
+                n = np.bincount(nearest, minlength=self.n_clusters)
+                sums = np.stack([np.bincount(nearest, weights=batch[:, c], minlength=self.n_clusters)
+                                 for c in range(X.shape[1])], axis=1)
+                counts += n
+                hit = n > 0
+                step = (sums[hit] - n[hit, None] * self.centers_[hit]) / counts[hit, None]
+                self.centers_[hit] += step
+                if np.abs(step).max() < self.tol:
+                    break
+
+            # Darkest cluster first (L in Lab, channel sum in BGR/grayscale)
+            key = self.centers_[:, 0] if self.color_space == 'lab' or X.shape[1] == 1 else self.centers_.sum(axis=1)
+            self.centers_ = self.centers_[np.argsort(key, kind='stable')]
+            sp.set(pixels=len(X), iterations=self.n_iter_)
+        return self
+
+    def predict(self, image, chunk_pixels=1_000_000):
+        """
+        Labels every pixel with its nearest center.
+        Parameters:
+        image: str or numpy.ndarray, image path or image array
+        chunk_pixels: int, maximum number of pixels assigned at once
+        Returns:
+        numpy.ndarray (int32) of the image's height and width, with labels 1..n_clusters
+        """
+        if self.centers_ is None:
+            raise RuntimeError("ColorKMeans.predict called before fit")
+        img = _read_color_image(image)
+        labels = np.empty(img.shape[:2], dtype=np.int32)
+        rows = max(1, chunk_pixels // img.shape[1])
+        with span('kmeans_assign', pixels=labels.size):
+            for top in range(0, img.shape[0], rows):
+                block = img[top:top + rows]
+                labels[top:top + rows] = self._nearest(self._features(block)).reshape(block.shape[:2]) + 1
+        return labels
+
+    def colors(self):
+        """Returns the centers as BGR (or gray) uint8 colors, one row per label 1..n_clusters."""
+        import cv2
+
+        centers = np.clip(np.rint(self.centers_), 0, 255).astype(np.uint8)
+        if centers.shape[1] == 3 and self.color_space == 'lab':
+            centers = cv2.cvtColor(centers[None], cv2.COLOR_LAB2BGR)[0]
+        return centers
+
+
+def cluster_fractions(labels, n_clusters):
+    """
+    Returns the fraction of the image's pixels in each cluster.
+    Parameters:
+    labels: numpy.ndarray, label image with labels 1..n_clusters
+    n_clusters: int, number of clusters
+    Returns:
+    numpy.ndarray of length n_clusters; entry i belongs to label i + 1
+    """
+    counts = np.bincount(np.asarray(labels).ravel(), minlength=n_clusters + 1)[1:n_clusters + 1]
+    return counts / max(np.asarray(labels).size, 1)
+
+
+@traced()
+def kmeans_segmentation(image, n_clusters=4, model=None, color_space='lab'):
+    """
+    Segments an image into color clusters with mini-batch k-means.
+    Parameters:
+    image: str or numpy.ndarray, image path or image array
+    n_clusters: int, number of clusters (ignored when a fitted model is given)
+    model: ColorKMeans or None, a fitted model to reuse (e.g. across an image set);
+        None fits one on this image
+    color_space: str, 'lab' or 'bgr', used when fitting a new model
+    Returns:
+    dict with the (8-bit) 'image', the 'labels' image (1..n_clusters, usable with
+    draw_segmentation and region_properties), 'n_regions' (clusters present in the
+    image), the per-cluster area 'fractions' and the 'model'
+    """
+    img = _read_color_image(image)
+    if model is None:
+        model = ColorKMeans(n_clusters, color_space=color_space).fit(img)
+    labels = model.predict(img)
+    fractions = cluster_fractions(labels, model.n_clusters)
+    return {'image': img, 'labels': labels, 'n_regions': int(np.count_nonzero(fractions)),
+            'fractions': fractions, 'model': model}
+
+
+def _kmeans_file(image_path, model, output_dir, return_labels, return_regions):
+    # Worker run in the process pool: labels one image file with the shared model
+    # and optionally writes the cluster-colored image
+    import cv2
+
+    start = time.perf_counter()
+    result = kmeans_segmentation(image_path, model=model)
+    record = {'path': image_path, 'n_regions': result['n_regions'], 'fractions': result['fractions']}
+    if return_labels:
+        record['labels'] = result['labels']
+    if return_regions:
+        regions = region_properties(result['labels'], result['image'])
+        regions.insert(0, 'image', os.path.basename(image_path))
+        regions['fraction'] = result['fractions'][regions['label'] - 1]
+        record['regions'] = regions
+    if output_dir is not None:
+        name = os.path.splitext(os.path.basename(image_path))[0]
+        record['overlay_path'] = os.path.join(output_dir, f"{name}_kmeans.png")
+        palette = np.vstack([np.zeros((1,) + model.colors().shape[1:], np.uint8), model.colors()])
+        cv2.imwrite(record['overlay_path'], palette[result['labels']])
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def batch_kmeans_segmentation(images, n_clusters=4, model=None, output_dir=None, workers=None,
+                              return_labels=True, return_regions=False, progress=True,
+                              fit_images=8, color_space='lab'):
+    """
+    Performs k-means color segmentation on many images in parallel with one shared model.
+    The model is fitted once (on pixels sampled from up to fit_images images spread over
+    the set) and only the pixel assignment runs per image, so the cluster labels mean
+    the same color in every image.
+    Parameters:
+    images: str or list, a directory, a glob pattern (e.g. 'data/*.tif') or a list of image paths
+    n_clusters: int, number of clusters (ignored when a fitted model is given)
+    model: ColorKMeans or None, a fitted model to reuse; None fits one first
+    output_dir: str or None, if given an image '<name>_kmeans.png' with every pixel in its
+        cluster's color is written there per image
+    workers: int or None, number of worker processes (None uses every CPU, 1 runs in this process)
+    return_labels: bool, whether to return the label array of every image
+    return_regions: bool, whether to return the region_properties table of every image
+        (one row per cluster, with 'image' and 'fraction' columns)
+    progress: bool, whether to print a line per finished image
+    fit_images: int, number of images the model is fitted on
+    color_space: str, 'lab' or 'bgr', used when fitting a new model
+    Returns:
+    list of dicts, in input order, with 'path', 'n_regions', 'fractions', 'seconds' and, as
+    requested, 'labels', 'regions' and 'overlay_path'. Images that fail have an 'error' entry instead.
+    """
+    paths = list_images(images)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    if model is None and paths:
+        picks = np.unique(np.linspace(0, len(paths) - 1, min(fit_images, len(paths))).round().astype(int))
+        model = ColorKMeans(n_clusters, color_space=color_space).fit([paths[i] for i in picks])
+
+    return _map_images(paths, _kmeans_file, (model, output_dir, return_labels, return_regions),
+                       workers, progress)
+